@@ -0,0 +1,106 @@
+# -----------------------------------------------------------------------
+# bench_intent.py
+# Accuracy and latency of orchestrator task detection.
+#
+#   cd backend && python benchmarks/bench_intent.py [--verbose]
+#
+# Scores the legacy substring detector and the intent classifier (rules +
+# model, see src/utils/intent_classifier.py) on benchmarks/intent_data/
+# eval.jsonl, lists what each gets wrong, and times both per call. Exits
+# non-zero if the classifier's accuracy drops below MIN_ACCURACY or a
+# latency exceeds its budget, so it can run in CI.
+# -----------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from src.utils.intent_classifier import IntentClassifier, IntentModel  # noqa: E402
+
+EVAL_PATH = os.path.join(BACKEND_DIR, "benchmarks", "intent_data", "eval.jsonl")
+MIN_ACCURACY = 0.9
+# Microseconds per call (median); generous so only real regressions fail
+BUDGETS_US = {"rules path": 50.0, "model path": 1000.0}
+
+
+def legacy_detect(content: str) -> str:
+    """detect_task() before the intent classifier, kept as the baseline."""
+    lower = content.lower()
+    if any(k in lower for k in ["quiz", "mcq", "test me", "question"]):
+        return "quiz"
+    if any(k in lower for k in ["flashcard", "flash card", "term", "definition"]):
+        return "flashcard"
+    if any(k in lower for k in ["summarize", "summarise", "summary", "notes"]):
+        return "summary"
+    if any(k in lower for k in ["recommend", "resource", "book", "lecture", "article"]):
+        return "recommendation"
+    if any(k in lower for k in ["audio", "podcast", "listen", "speak"]):
+        return "audio"
+    if any(k in lower for k in ["document", "pdf", "analyze", "analyse", "extract"]):
+        return "document_analysis"
+    return "chat"
+
+
+def median_us(fn, texts, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        samples.append((time.perf_counter() - start) / len(texts) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eval", default=EVAL_PATH)
+    parser.add_argument("--verbose", action="store_true", help="list every misrouted example")
+    args = parser.parse_args()
+
+    with open(args.eval, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    classifier = IntentClassifier(model=IntentModel.load())
+    if classifier.model is None:
+        raise SystemExit("No intent model - run benchmarks/train_intent.py first")
+
+    results = [(row, legacy_detect(row["text"]), classifier.classify(row["text"])) for row in rows]
+    legacy_hits = sum(old == row["label"] for row, old, _ in results)
+    new_hits = sum(new.task == row["label"] for row, _, new in results)
+    sources = Counter(new.source for _, _, new in results)
+
+    print(f"{len(rows)} eval examples")
+    print(f"  legacy substring detector  accuracy {legacy_hits / len(rows):.3f}")
+    print(f"  intent classifier          accuracy {new_hits / len(rows):.3f}  "
+          f"(decided by rules {sources['rules']}, model {sources['model']})")
+    for row, old, new in results:
+        if new.task != row["label"] or args.verbose and old != row["label"]:
+            print(f"    {row['label']:<17} legacy={old:<17} new={new.task:<17} "
+                  f"({new.source} {new.confidence:.2f})  {row['text']!r}")
+
+    rules_texts = [r["text"] for r, _, new in results if new.source == "rules"]
+    model_texts = [r["text"] for r, _, new in results if new.source == "model"]
+    timings = {
+        "legacy": median_us(legacy_detect, [r["text"] for r in rows]),
+        "rules path": median_us(classifier.classify, rules_texts) if rules_texts else 0.0,
+        "model path": median_us(classifier.classify, model_texts) if model_texts else 0.0,
+    }
+    print("median latency per call")
+    failed = new_hits / len(rows) < MIN_ACCURACY
+    for name, us in timings.items():
+        budget = BUDGETS_US.get(name)
+        over = budget is not None and us > budget
+        failed |= over
+        print(f"  {name:<12} {us:8.1f} µs" + (f"  (budget {budget:.0f} µs{' EXCEEDED' if over else ''})" if budget else ""))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -----------------------------------------------------------------------
+# bench_metrics.py
+# Overhead of the metrics subsystem on hot paths.
+#
+#   cd backend && python benchmarks/bench_metrics.py
+#
+# Measures per-operation cost of counters/histograms, the @timed decorator
+# and the ASGI middleware (driven directly, without a server, so only the
+# middleware itself is measured). Exits non-zero if any figure exceeds its
+# budget, so it can run in CI.
+# -----------------------------------------------------------------------
+
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.metrics import MetricsMiddleware, MetricsRegistry, timed  # noqa: E402
+
+# Budgets in microseconds per operation; generous so only real regressions fail
+BUDGETS_US = {
+    "counter.labels().inc()": 3.0,
+    "cached child .inc()": 2.0,
+    "histogram.labels().observe()": 3.0,
+    "@timed overhead": 5.0,
+    "middleware overhead / request": 25.0,
+    "render 50 series (per scrape)": 2000.0,
+}
+
+
+def per_op_us(stmt, number: int) -> float:
+    best = min(timeit.repeat(stmt, number=number, repeat=5))
+    return best / number * 1e6
+
+
+def bench_primitives(results: dict):
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_requests", "bench", ["route", "status"])
+    histogram = registry.histogram("bench_latency_seconds", "bench", ["route"])
+    child = counter.labels("/api/doubt/ask", "200")
+
+    results["counter.labels().inc()"] = per_op_us(lambda: counter.labels("/api/doubt/ask", "200").inc(), 200_000)
+    results["cached child .inc()"] = per_op_us(child.inc, 200_000)
+    results["histogram.labels().observe()"] = per_op_us(
+        lambda: histogram.labels("/api/doubt/ask").observe(0.123), 200_000
+    )
+
+    timed_histogram = registry.histogram("bench_timed_seconds", "bench", ["op", "outcome"])
+
+    def bare():
+        return 1
+
+    wrapped = timed(timed_histogram, op="bench")(bare)
+    results["@timed overhead"] = per_op_us(wrapped, 200_000) - per_op_us(bare, 200_000)
+
+    for i in range(50):
+        registry.counter(f"bench_series_{i}", "bench").inc()
+    results["render 50 series (per scrape)"] = per_op_us(registry.render, 2_000)
+
+
+def bench_middleware(results: dict):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/api/doubt/history/a/b",
+             "path_params": {"learning_space_id": "a", "user_id": "b"}, "route": object()}
+    wrapped = MetricsMiddleware(app)
+    n = 50_000
+
+    async def run(target):
+        start = time.perf_counter()
+        for _ in range(n):
+            await target(dict(scope), receive, send)
+        return time.perf_counter() - start
+
+    loop = asyncio.new_event_loop()
+    try:
+        bare = min(loop.run_until_complete(run(app)) for _ in range(3))
+        instrumented = min(loop.run_until_complete(run(wrapped)) for _ in range(3))
+    finally:
+        loop.close()
+    results["middleware overhead / request"] = (instrumented - bare) / n * 1e6
+
+
+def main() -> int:
+    results: dict[str, float] = {}
+    bench_primitives(results)
+    bench_middleware(results)
+
+    failed = False
+    print(f"{'operation':<34}{'µs/op':>10}{'budget':>10}")
+    for name, value in results.items():
+        budget = BUDGETS_US[name]
+        flag = "" if value <= budget else "  OVER BUDGET"
+        failed |= value > budget
+        print(f"{name:<34}{value:>10.3f}{budget:>10.1f}{flag}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# -----------------------------------------------------------------------
+# compare_modes.py
+# Full workflow runs under each GENERATION_MODE, side by side.
+#
+#   cd backend
+#   python benchmarks/compare_modes.py --modes separate,combined \
+#       --concurrency 1,4 --requests 32 --time-scale 0.05 [--out modes.json]
+#
+# GENERATION_MODE is read once at import time, so every mode runs the
+# load_test.py `workflow` scenario in its own process, with the same seed,
+# fake provider profile and settings. Reports latency percentiles, LLM calls
+# and tokens per run and the failure rate (runs without a summary) per mode
+# and concurrency level. The fake providers report a fixed number of output
+# tokens per call, so output tokens track the number of calls; input tokens
+# come from the rendered prompts.
+# -----------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOAD_TEST = os.path.join(BACKEND_DIR, "benchmarks", "load_test.py")
+
+from load_test import git_commit  # noqa: E402
+
+
+def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, f"{mode}.json")
+        command = [
+            sys.executable, LOAD_TEST, "--scenarios", "workflow", "--generation-mode", mode,
+            "--concurrency", ",".join(str(c) for c in args.concurrency), "--requests", str(args.requests),
+            "--time-scale", str(args.time_scale), "--seed", str(args.seed), "--out", out,
+        ]
+        if args.profile:
+            command += ["--profile", args.profile]
+        print(f"── {mode} ──", flush=True)
+        subprocess.run(command, cwd=BACKEND_DIR, check=True)
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def side_by_side(reports: dict) -> list[dict]:
+    rows = []
+    for mode, report in reports.items():
+        for level in report["results"]:
+            requests = level["requests"]
+            rows.append({
+                "mode": mode,
+                "concurrency": level["concurrency"],
+                "p50_ms": level["p50_ms"],
+                "p95_ms": level["p95_ms"],
+                "p99_ms": level["p99_ms"],
+                "llm_calls_per_run": round(level["llm_calls"] / requests, 2),
+                "input_tokens_per_run": round(level["input_tokens"] / requests, 1),
+                "output_tokens_per_run": round(level["output_tokens"] / requests, 1),
+                "failure_rate": round(level["errors"] / requests, 3),
+            })
+    return sorted(rows, key=lambda r: (r["concurrency"], r["mode"]))
+
+
+def print_table(rows: list[dict]):
+    print(f"\n{'mode':<10} {'c':>3} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'calls':>6} {'in tok':>8} {'out tok':>8} {'failed':>7}")
+    for row in rows:
+        print(
+            f"{row['mode']:<10} {row['concurrency']:>3} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+            f"{row['p99_ms']:>9.1f} {row['llm_calls_per_run']:>6.2f} {row['input_tokens_per_run']:>8.0f} "
+            f"{row['output_tokens_per_run']:>8.0f} {100 * row['failure_rate']:>6.1f}%"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="separate,combined",
+                        type=lambda s: [x.strip() for x in s.split(",") if x.strip()])
+    parser.add_argument("--concurrency", default="1,4", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=32, help="workflow runs per mode and concurrency level")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplier for simulated LLM latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--profile", default="", help="FAKE_LLM_PROFILE: inline JSON or path")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    reports = {mode: run_mode(mode, args) for mode in args.modes}
+    rows = side_by_side(reports)
+    print_table(rows)
+    if args.out:
+        settings = next(iter(reports.values()))["settings"]
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "settings": {**settings, "generation_mode": args.modes},
+                "results": rows,
+            }, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# -----------------------------------------------------------------------
+# load_test.py
+# Offline load test: fake LLM providers + in-memory Supabase, no credits.
+#
+#   cd backend
+#   python benchmarks/load_test.py --scenarios doubt,orchestrator,workflow \
+#       --concurrency 1,4,16 --requests 64 --time-scale 0.05 --out bench.json
+#   python benchmarks/load_test.py ... --compare bench.json   # diff vs a baseline
+#
+# Drives /api/doubt/ask, /api/doubt/batch (5 questions per call) and
+# /api/orchestrator/route through the ASGI app
+# (httpx ASGITransport, so no sockets) and full agent graph runs via
+# invoke_agent_workflow(). Reports throughput, latency percentiles, errors,
+# LLM calls and tokens, and memory per scenario and concurrency level.
+# Results are JSON with the git commit and every knob that affects them, so
+# runs can be compared across commits as long as the settings match.
+# -----------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def configure_environment(args):
+    """Must run before any src.* import: config is read once at import time."""
+    os.environ["SUPABASE_BACKEND"] = "memory"
+    os.environ["FAKE_LLM"] = "true"
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    os.environ["FAKE_LLM_TIME_SCALE"] = str(args.time_scale)
+    if args.profile:
+        os.environ["FAKE_LLM_PROFILE"] = args.profile
+    if args.generation_mode:
+        os.environ["GENERATION_MODE"] = args.generation_mode
+    os.environ.setdefault("MEMORY_DB_LATENCY_MS", str(args.db_latency_ms))
+    # Keep the benchmark output readable
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ── Fixtures ───────────────────────────────────────────────────────────
+
+SUMMARY = (
+    "Photosynthesis is the process by which green plants use sunlight, water and carbon dioxide "
+    "to make glucose and release oxygen. It happens in the chloroplasts. "
+) * 20
+
+ORCHESTRATOR_PROMPTS = [
+    ("quiz", "Make a quiz on the water cycle"),
+    ("flashcard", "Flashcards for Newton's laws"),
+    ("summary", "Summarise the French revolution"),
+    ("recommendation", "Recommend resources for learning fractions"),
+    ("chat", "Why is the sky blue?"),
+]
+
+
+def seed_database(client, users: int, spaces: int):
+    """Profiles plus two pools of spaces: ready ones (for doubts) and fresh ones (for workflow runs)."""
+    client.seed("student_profile", [
+        {"user_id": f"user-{u}", "grade_level": "Class 8", "language": "English", "gender": ""}
+        for u in range(users)
+    ])
+    client.seed("learning_space", [
+        {"id": f"ready-{i}", "user_id": f"user-{i % users}", "topic": "Photosynthesis",
+         "status": "normal", "language": "English", "summary_notes": SUMMARY}
+        for i in range(spaces)
+    ])
+
+
+def fresh_space(client, users: int, index: int) -> str:
+    space_id = f"run-{index}-{uuid.uuid4().hex[:8]}"
+    client.seed("learning_space", [{
+        "id": space_id, "user_id": f"user-{index % users}", "topic": "Photosynthesis",
+        "status": "normal", "language": "English", "pdf_source": "", "summary_notes": None,
+    }])
+    return space_id
+
+
+# ── Scenarios ──────────────────────────────────────────────────────────
+
+async def run_level(make_call, concurrency: int, total: int) -> dict:
+    """Run `total` calls with at most `concurrency` in flight; return latency / throughput stats."""
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await make_call(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 3) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_rss_kb": rss_after,
+        "rss_growth_kb": rss_after - rss_before,
+    }
+
+
+def scenario_calls(name: str, client_db, http, users: int, spaces: int):
+    from src.services.agent_workflow import invoke_agent_workflow
+
+    if name == "doubt":
+        async def call(i):
+            response = await http.post("/api/doubt/ask", json={
+                "learning_space_id": f"ready-{i % spaces}", "user_id": f"user-{(i % spaces) % users}",
+                "question": f"Can you explain step {i % 7} again?",
+            })
+            return response.status_code == 200
+        return call
+
+    if name == "doubt_batch":
+        async def call(i):
+            # Distinct questions, so answers come from the combined call rather than the cache
+            response = await http.post("/api/doubt/batch", json={
+                "learning_space_id": f"ready-{i % spaces}", "user_id": f"user-{(i % spaces) % users}",
+                "questions": [f"What happens in step {i}-{n} of the process?" for n in range(5)],
+            })
+            return response.status_code == 200 and response.json()["success"]
+        return call
+
+    if name == "orchestrator":
+        async def call(i):
+            task, content = ORCHESTRATOR_PROMPTS[i % len(ORCHESTRATOR_PROMPTS)]
+            response = await http.post("/api/orchestrator/route", json={
+                # Unique content so the response cache doesn't turn this into a DB benchmark
+                "task_type": task, "content": f"{content} #{i}-{uuid.uuid4().hex[:6]}",
+                "student_profile": {"grade_level": "Class 8", "language": "English"},
+            })
+            return response.status_code == 200
+        return call
+
+    if name == "workflow":
+        async def call(i):
+            space_id = fresh_space(client_db, users, i)
+            result = await asyncio.to_thread(invoke_agent_workflow, space_id, f"user-{i % users}")
+            return bool(result and result.get("summary_notes"))
+        return call
+
+    raise SystemExit(f"Unknown scenario '{name}' (expected doubt, doubt_batch, orchestrator, workflow)")
+
+
+def llm_usage(usage, requests: int) -> dict:
+    """LLM calls and tokens of one level, from the usage tally it ran under."""
+    rows = usage.report(group_by="task")
+    tokens = sum(row["input_tokens"] + row["output_tokens"] for row in rows)
+    return {
+        "llm_calls": sum(row["calls"] for row in rows),
+        "input_tokens": sum(row["input_tokens"] for row in rows),
+        "output_tokens": sum(row["output_tokens"] for row in rows),
+        "tokens_per_request": round(tokens / requests, 1) if requests else None,
+        "cost_usd": round(sum(row["cost_usd"] for row in rows), 6),
+    }
+
+
+async def main_async(args) -> dict:
+    import httpx
+    from src.configs.config import GENERATION_MODE
+    from src.services.supabase_service import supabase_service
+    from src.utils.fake_llm import reset_simulators, simulator_stats
+    from src.utils.model_router import health_tracker
+    from src.utils.retry_policy import provider_retry_budget
+    from src.utils.tracing import usage_scope
+    import main as app_module
+
+    db = supabase_service.client
+    seed_database(db, args.users, args.spaces)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                # Fresh provider state per level so levels don't leak 429s / degraded circuits
+                reset_simulators()
+                health_tracker.reset()
+                provider_retry_budget.reset()
+                if args.tracemalloc:
+                    tracemalloc.start()
+                # Calls started by the level copy this context, so the tally sees all of them
+                with usage_scope() as usage:
+                    stats = await run_level(scenario_calls(scenario, db, http, args.users, args.spaces),
+                                            concurrency, args.requests)
+                stats.update(llm_usage(usage, args.requests))
+                if args.tracemalloc:
+                    stats["py_heap_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+                    tracemalloc.stop()
+                stats["scenario"] = scenario
+                stats["providers"] = simulator_stats()
+                results.append(stats)
+                print(
+                    f"{scenario:<13} c={concurrency:<3} {stats['throughput_rps']:>8.2f} req/s  "
+                    f"p50 {stats['p50_ms']:>9.1f} ms  p99 {stats['p99_ms']:>9.1f} ms  "
+                    f"errors {stats['errors']}/{stats['requests']}  "
+                    f"{stats['tokens_per_request']:>7.0f} tok/req",
+                    flush=True,
+                )
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "seed": args.seed, "time_scale": args.time_scale, "profile": args.profile or None,
+            "generation_mode": GENERATION_MODE,
+            "db_latency_ms": args.db_latency_ms, "requests": args.requests,
+            "users": args.users, "spaces": args.spaces,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != current["settings"]:
+        print("⚠️ Settings differ from the baseline; deltas are not comparable.")
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\nvs {baseline.get('commit')} (baseline)")
+    for row in current["results"]:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if not old:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p99_ms"):
+            if old.get(key):
+                deltas.append(f"{key} {100 * (row[key] - old[key]) / old[key]:+.1f}%")
+        print(f"{row['scenario']:<13} c={row['concurrency']:<3} " + "  ".join(deltas))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="doubt,orchestrator,workflow",
+                        type=lambda s: [x.strip() for x in s.split(",") if x.strip()])
+    parser.add_argument("--concurrency", default="1,4,16", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=32, help="calls per scenario and concurrency level")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplier for simulated LLM latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--profile", default="", help="FAKE_LLM_PROFILE: inline JSON or path")
+    parser.add_argument("--generation-mode", default="", help="GENERATION_MODE for workflow runs (separate/combined)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--spaces", type=int, default=32)
+    parser.add_argument("--tracemalloc", action="store_true", help="record Python heap peak (slows the run)")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    parser.add_argument("--compare", default="", help="baseline results JSON to diff against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    report = asyncio.run(main_async(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
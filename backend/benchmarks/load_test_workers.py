@@ -0,0 +1,288 @@
+# -----------------------------------------------------------------------
+# load_test_workers.py
+# Multi-worker load test: throughput as the number of worker processes grows.
+#
+#   cd backend
+#   python benchmarks/load_test_workers.py --workers 1,2,4 --scenarios orchestrator,doubt \
+#       --concurrency 32 --requests 400 [--server gunicorn] [--out workers.json]
+#
+# Same offline setup as load_test.py (fake LLM providers, in-memory Supabase
+# seeded through MEMORY_DB_SEED so every worker has the fixtures), but over
+# real sockets: for each worker count the app is started with gunicorn
+# (gunicorn.conf.py) or `uvicorn --workers`, with shared state in SQLite as
+# in production, warmed up, and driven by several client processes so the
+# load generator isn't the bottleneck. Simulated LLM latency defaults to
+# zero, which makes each request pure CPU - the case extra cores help.
+#
+# Reports throughput, latency percentiles, errors and scaling efficiency
+# (throughput / (workers x single-worker throughput)). Scaling is capped by
+# the cores available to the server and the clients together; worker counts
+# above that are flagged. Exits non-zero on request errors, or when
+# --min-efficiency is set and a worker count that fits the cores misses it.
+# -----------------------------------------------------------------------
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ORCHESTRATOR_PROMPTS, git_commit, percentile, seed_database  # noqa: E402
+
+
+class _SeedFile:
+    """Collects load_test.seed_database() rows as MEMORY_DB_SEED JSON."""
+
+    def __init__(self):
+        self.tables: dict[str, list] = {}
+
+    def seed(self, table: str, rows: list):
+        self.tables.setdefault(table, []).extend(rows)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# ── Server ─────────────────────────────────────────────────────────────
+
+def start_server(args, workers: int, port: int, workdir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "SUPABASE_BACKEND": "memory",
+        "MEMORY_DB_SEED": os.path.join(workdir, "seed.json"),
+        "MEMORY_DB_LATENCY_MS": str(args.db_latency_ms),
+        "FAKE_LLM": "true",
+        "FAKE_LLM_SEED": str(args.seed),
+        "FAKE_LLM_TIME_SCALE": str(args.time_scale),
+        "SHARED_STATE_BACKEND": "sqlite",
+        "SHARED_STATE_DB": os.path.join(workdir, f"shared-{workers}.sqlite3"),
+        "PRELOAD_AGENT_GRAPH": "false",
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "GUNICORN_LOG_LEVEL": "warning",
+    }
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    log = open(os.path.join(workdir, f"server-{workers}.log"), "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(process: subprocess.Popen, base_url: str, timeout: float = 90):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server not ready after {timeout:.0f}s")
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ── Clients ────────────────────────────────────────────────────────────
+
+def build_request(scenario: str, i: int, users: int, spaces: int) -> tuple[str, dict]:
+    if scenario == "doubt":
+        return "/api/doubt/ask", {
+            "learning_space_id": f"ready-{i % spaces}", "user_id": f"user-{(i % spaces) % users}",
+            "question": f"Can you explain step {i % 7} again?",
+        }
+    if scenario == "orchestrator":
+        task, content = ORCHESTRATOR_PROMPTS[i % len(ORCHESTRATOR_PROMPTS)]
+        return "/api/orchestrator/route", {
+            # Unique content so the response cache doesn't turn this into a DB benchmark
+            "task_type": task, "content": f"{content} #{i}-{uuid.uuid4().hex[:6]}",
+            "student_profile": {"grade_level": "Class 8", "language": "English"},
+        }
+    raise SystemExit(f"Unknown scenario '{scenario}' (expected doubt, orchestrator)")
+
+
+async def _client(base_url: str, scenario: str, indices: range, concurrency: int, users: int, spaces: int):
+    import httpx
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as http:
+        async def one(i):
+            nonlocal errors
+            path, body = build_request(scenario, i, users, spaces)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    ok = (await http.post(path, json=body)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+        started = time.time()
+        await asyncio.gather(*(one(i) for i in indices))
+    return latencies, errors, started, time.time()
+
+
+def client_process(base_url, scenario, indices, concurrency, users, spaces, start_at, results):
+    # All clients start together, so their combined span covers one burst
+    time.sleep(max(0.0, start_at - time.time()))
+    results.put(asyncio.run(_client(base_url, scenario, indices, concurrency, users, spaces)))
+
+
+def run_level(args, base_url: str, scenario: str, total: int) -> dict:
+    clients = max(1, min(args.clients, args.concurrency))
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + 2.0   # time for the spawned clients to import httpx
+    processes = [
+        context.Process(target=client_process, args=(
+            base_url, scenario, range(c, total, clients), max(1, args.concurrency // clients),
+            args.users, args.spaces, start_at, results,
+        ))
+        for c in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    # From the first client starting to the last one finishing
+    elapsed = max(c[3] for c in collected) - min(c[2] for c in collected)
+    latencies = sorted(l for c in collected for l in c[0])
+    errors = sum(c[1] for c in collected)
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 3) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+# ── Main ───────────────────────────────────────────────────────────────
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--scenarios", default="orchestrator,doubt",
+                        type=lambda s: [x.strip() for x in s.split(",") if x.strip()])
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight, over all clients")
+    parser.add_argument("--requests", type=int, default=400, help="calls per scenario and worker count")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default="auto")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="multiplier for simulated LLM latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--spaces", type=int, default=32)
+    parser.add_argument("--min-efficiency", type=float, default=0.0,
+                        help="fail if scaling efficiency drops below this where the cores allow it")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    args = parser.parse_args()
+    if args.server == "auto":
+        args.server = "gunicorn" if importlib.util.find_spec("gunicorn") else "uvicorn"
+    return args
+
+
+def main():
+    args = parse_args()
+    cores = available_cores()
+    print(f"{cores} core(s) available, server: {args.server}, clients: {args.clients}")
+
+    results, failed = [], False
+    with tempfile.TemporaryDirectory(prefix="load-workers-") as workdir:
+        seed = _SeedFile()
+        seed_database(seed, args.users, args.spaces)
+        with open(os.path.join(workdir, "seed.json"), "w", encoding="utf-8") as f:
+            json.dump(seed.tables, f)
+
+        for workers in args.workers:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            server = start_server(args, workers, port, workdir)
+            try:
+                wait_ready(server, base_url)
+                for scenario in args.scenarios:
+                    # Warm every worker (lazy imports, first-call caches) before measuring
+                    run_level(args, base_url, scenario, max(8 * workers, args.concurrency))
+                    stats = run_level(args, base_url, scenario, args.requests)
+                    stats.update(scenario=scenario, workers=workers, oversubscribed=workers + args.clients > cores)
+                    results.append(stats)
+            except SystemExit:
+                with open(os.path.join(workdir, f"server-{workers}.log"), encoding="utf-8") as log:
+                    print(log.read()[-3000:])
+                raise
+            finally:
+                stop_server(server)
+
+    baseline = {r["scenario"]: r["throughput_rps"] for r in results if r["workers"] == 1}
+    for row in results:
+        single = baseline.get(row["scenario"])
+        row["efficiency"] = round(row["throughput_rps"] / (row["workers"] * single), 3) if single else None
+        print(
+            f"{row['scenario']:<13} workers={row['workers']:<3} {row['throughput_rps']:>8.2f} req/s  "
+            f"p50 {row['p50_ms']:>8.1f} ms  p99 {row['p99_ms']:>8.1f} ms  errors {row['errors']}/{row['requests']}"
+            + (f"  efficiency {row['efficiency']:.2f}" if row["efficiency"] is not None else "")
+            + ("  (more processes than cores)" if row["oversubscribed"] else "")
+        )
+        failed |= row["errors"] > 0
+        if args.min_efficiency and row["efficiency"] is not None and not row["oversubscribed"]:
+            failed |= row["efficiency"] < args.min_efficiency
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cores": cores,
+                "settings": {
+                    "server": args.server, "clients": args.clients, "concurrency": args.concurrency,
+                    "requests": args.requests, "time_scale": args.time_scale, "seed": args.seed,
+                    "db_latency_ms": args.db_latency_ms, "users": args.users, "spaces": args.spaces,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.out}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
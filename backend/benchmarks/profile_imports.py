@@ -0,0 +1,130 @@
+# -----------------------------------------------------------------------
+# profile_imports.py
+# Cold-start profile of the FastAPI app.
+#
+#   cd backend
+#   python benchmarks/profile_imports.py [--runs 5] [--target 2.0] [--top 15]
+#
+# Starts fresh interpreters that import main.py and run the app's lifespan
+# startup (what a new container does before it can take traffic), and
+# reports the median import and startup times, the slowest modules by
+# cumulative import time (python -X importtime) and any of the modules that
+# are meant to load on first use (LangGraph, provider SDKs, PDF / YouTube
+# extractors, the Supabase SDK) but were imported anyway. Exits non-zero if
+# import + startup exceeds --target seconds or a deferred module was loaded.
+#
+# SUPABASE_BACKEND defaults to "memory" so no network is involved; set it
+# (and the Supabase env vars) to include the real client in the figures.
+# -----------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use, never while the app starts
+DEFERRED_MODULES = (
+    "langgraph",
+    "langchain_google_genai",
+    "langchain_groq",
+    "langchain_mistralai",
+    "langchain_openai",
+    "langchain_community",
+    "youtube_transcript_api",
+    "pypdf",
+    "supabase",
+)
+
+_CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(startup())
+print(json.dumps({
+    "import_s": imported - started,
+    "startup_s": ready - imported,
+    "modules": sorted(m for m in sys.modules if m.split(".")[0] in DEFERRED),
+}))
+"""
+
+
+def run_child(env: dict, importtime: bool = False) -> tuple[dict, str]:
+    code = f"DEFERRED = {DEFERRED_MODULES!r}\n" + _CHILD
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    proc = subprocess.run(args, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise SystemExit(f"child failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def slowest_modules(importtime_log: str, top: int) -> list[tuple[str, float]]:
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        # Top-level application modules and direct third-party imports only
+        if name.startswith(("main", "src.")) or not name.startswith(" "):
+            rows.append((name.strip(), int(cumulative_us) / 1e6))
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target", type=float, default=2.0, help="seconds for import + startup (median)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--out", default="", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    env = {**os.environ, "SUPABASE_BACKEND": os.environ.get("SUPABASE_BACKEND", "memory"),
+           "PRELOAD_AGENT_GRAPH": "false", "PYTHONDONTWRITEBYTECODE": "1"}
+    # Warm the filesystem cache and .pyc files once, so runs measure imports, not disk
+    run_child(env)
+    samples = [run_child(env)[0] for _ in range(args.runs)]
+    _, importtime_log = run_child(env, importtime=True)
+
+    import_s = statistics.median(s["import_s"] for s in samples)
+    startup_s = statistics.median(s["startup_s"] for s in samples)
+    loaded = sorted({m.split(".")[0] for s in samples for m in s["modules"]})
+    report = {
+        "runs": args.runs,
+        "supabase_backend": env["SUPABASE_BACKEND"],
+        "import_s": round(import_s, 3),
+        "startup_s": round(startup_s, 3),
+        "cold_start_s": round(import_s + startup_s, 3),
+        "target_s": args.target,
+        "deferred_modules_loaded": loaded,
+        "slowest_modules": [{"module": m, "cumulative_s": round(t, 3)} for m, t in
+                            slowest_modules(importtime_log, args.top)],
+    }
+
+    print(f"cold start (median of {args.runs}): import {import_s:.3f}s + startup {startup_s:.3f}s "
+          f"= {import_s + startup_s:.3f}s  (target {args.target:.2f}s)")
+    print("slowest imports (cumulative):")
+    for row in report["slowest_modules"]:
+        print(f"  {row['cumulative_s']:7.3f}s  {row['module']}")
+    if loaded:
+        print(f"deferred modules imported at startup: {', '.join(loaded)}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if loaded or import_s + startup_s > args.target:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
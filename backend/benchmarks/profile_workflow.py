@@ -0,0 +1,149 @@
+# -----------------------------------------------------------------------
+# profile_workflow.py
+# Profile our own overhead in a full agent graph run, with provider
+# latency taken out of the picture by an LLM cassette.
+#
+#   cd backend
+#   # 1. record once (fake providers by default; --live uses the real ones)
+#   python benchmarks/profile_workflow.py record --cassette run.jsonl.gz
+#   # 2. replay as often as needed, instantly or with scaled original latencies
+#   python benchmarks/profile_workflow.py replay --cassette run.jsonl.gz --latency-scale 0 --runs 5
+#
+# Runs against the in-memory Supabase stand-in with fixed ids, so replays
+# render the same prompts as the recording. Reports wall time split into
+# LLM (recorded or replayed), DB and everything else, the Python heap peak
+# and the top functions from cProfile. cProfile only sees the calling
+# thread, so graph nodes running in LangGraph's executor show up as waits;
+# --sort tottime surfaces the hot spots that are on this thread.
+# -----------------------------------------------------------------------
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SPACE_ID = "profile-space"
+USER_ID = "profile-user"
+
+
+def configure_environment(args):
+    """Must run before any src.* import: config is read once at import time."""
+    os.environ["SUPABASE_BACKEND"] = "memory"
+    os.environ["LLM_CASSETTE_MODE"] = args.mode
+    os.environ["LLM_CASSETTE_PATH"] = args.cassette
+    os.environ["LLM_CASSETTE_LATENCY_SCALE"] = str(args.latency_scale)
+    if not args.live:
+        os.environ["FAKE_LLM"] = "true"
+        os.environ.setdefault("FAKE_LLM_TIME_SCALE", "0.05")
+    os.environ.setdefault("MEMORY_DB_LATENCY_MS", str(args.db_latency_ms))
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def seed(client):
+    client.reset()
+    client.seed("student_profile", [
+        {"user_id": USER_ID, "grade_level": "Class 8", "language": "English", "gender": ""},
+    ])
+    client.seed("learning_space", [{
+        "id": SPACE_ID, "user_id": USER_ID, "topic": "Photosynthesis", "status": "normal",
+        "language": "English", "pdf_source": "", "summary_notes": None,
+    }])
+
+
+def db_seconds() -> float:
+    from src.services.supabase_service import DB_LATENCY
+    # labels() registers each child under two keys; count every child once
+    children = {id(child): child for child in DB_LATENCY._children.values()}
+    return sum(child.sum for child in children.values())
+
+
+def run_once(client, profiler=None) -> dict:
+    from src.services.agent_workflow import invoke_agent_workflow
+    from src.utils.tracing import span_exporter
+
+    seed(client)
+    since = time.time()
+    db_before = db_seconds()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    result = invoke_agent_workflow(SPACE_ID, USER_ID)
+    if profiler:
+        profiler.disable()
+    wall = time.perf_counter() - start
+
+    llm_calls = [s for s in span_exporter.spans(name="llm.call", since=since) if s["duration_ms"] is not None]
+    # Concurrent node calls overlap, so the LLM share is bounded by the run's critical path
+    llm = sum(s["duration_ms"] for s in llm_calls) / 1000
+    db = db_seconds() - db_before
+    return {
+        "ok": bool(result and result.get("summary_notes")),
+        "wall_s": round(wall, 4),
+        "llm_s": round(llm, 4),
+        "db_s": round(db, 4),
+        "llm_calls": len(llm_calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--cassette", default="workflow.jsonl.gz")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="replay: multiplier for recorded latency")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--live", action="store_true", help="record against the real providers")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0)
+    parser.add_argument("--top", type=int, default=25, help="functions to show from the profile")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key, e.g. tottime")
+    parser.add_argument("--out", default="", help="write results JSON here")
+    args = parser.parse_args()
+    if args.mode == "record" and args.runs != 1:
+        parser.error("record makes exactly one run")
+    configure_environment(args)
+
+    from src.services.supabase_service import supabase_service
+    from src.utils.cassette import llm_cassette
+
+    client = supabase_service.client
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    runs = [run_once(client, profiler) for _ in range(args.runs)]
+    heap_peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+
+    print(f"{'run':<5}{'ok':<5}{'wall s':>9}{'llm s':>9}{'db s':>9}{'calls':>7}")
+    for i, run in enumerate(runs):
+        print(f"{i:<5}{str(run['ok']):<5}{run['wall_s']:>9.3f}{run['llm_s']:>9.3f}{run['db_s']:>9.3f}{run['llm_calls']:>7}")
+    print(f"\nPython heap peak: {heap_peak_kb} KB   cassette: {llm_cassette.stats}")
+
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats(args.sort).print_stats(args.top)
+    print(buffer.getvalue())
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "mode": args.mode, "cassette": args.cassette, "latency_scale": args.latency_scale,
+                "live": args.live, "db_latency_ms": args.db_latency_ms,
+                "runs": runs, "heap_peak_kb": heap_peak_kb, "cassette_stats": llm_cassette.stats,
+            }, f, indent=2)
+        print(f"Results written to {args.out}")
+    if llm_cassette.stats["missed"]:
+        print("⚠️ Some calls were not in the cassette; the replay does not match the recording.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# -----------------------------------------------------------------------
+# train_intent.py
+# Trains the orchestrator's intent model (src/utils/intent_model.npz).
+#
+#   cd backend
+#   python benchmarks/train_intent.py                       # seed examples only
+#   python benchmarks/train_intent.py --extra labelled.jsonl  # plus logged requests
+#
+# Input files are JSONL rows {"text": ..., "label": <task>}. The seed set is
+# benchmarks/intent_data/train.jsonl; --extra adds labelled exports of real
+# orchestrator requests (e.g. the "[Orchestrator] task=..." log lines with
+# the task corrected where it was wrong). The model is a softmax regression
+# over the hashed n-gram features of src/utils/embeddings.py, trained with
+# full-batch gradient descent, class-balanced, with L2 regularization.
+# Accuracy on benchmarks/intent_data/eval.jsonl is printed, never trained on.
+# -----------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from src.utils.embeddings import HashedNgramEmbedder  # noqa: E402
+from src.utils.intent_classifier import MODEL_PATH, TASKS, IntentModel  # noqa: E402
+
+DATA_DIR = os.path.join(BACKEND_DIR, "benchmarks", "intent_data")
+
+
+def load_rows(path: str) -> list[tuple[str, str]]:
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if row.get("label") not in TASKS:
+                raise SystemExit(f"{path}:{line_no}: unknown label {row.get('label')!r}")
+            rows.append((row["text"], row["label"]))
+    return rows
+
+
+def featurize(featurizer: HashedNgramEmbedder, rows) -> tuple[np.ndarray, np.ndarray]:
+    x = np.stack([featurizer.embed(text) for text, _ in rows])
+    y = np.array([TASKS.index(label) for _, label in rows])
+    return x, y
+
+
+def train(x: np.ndarray, y: np.ndarray, epochs: int, lr: float, l2: float) -> tuple[np.ndarray, np.ndarray]:
+    classes = len(TASKS)
+    weights = np.zeros((classes, x.shape[1]), dtype=np.float64)
+    bias = np.zeros(classes, dtype=np.float64)
+    onehot = np.eye(classes)[y]
+    # Balanced: every class carries the same total weight, however many examples it has
+    counts = np.bincount(y, minlength=classes).astype(np.float64)
+    sample_weight = (len(y) / (classes * np.maximum(counts, 1)))[y][:, None] / len(y)
+    for _ in range(epochs):
+        logits = x @ weights.T + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        grad = (probabilities - onehot) * sample_weight
+        weights -= lr * (grad.T @ x + l2 * weights)
+        bias -= lr * grad.sum(axis=0)
+    return weights, bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train", default=os.path.join(DATA_DIR, "train.jsonl"))
+    parser.add_argument("--extra", action="append", default=[], help="more labelled JSONL (repeatable)")
+    parser.add_argument("--eval", default=os.path.join(DATA_DIR, "eval.jsonl"))
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--epochs", type=int, default=400)
+    parser.add_argument("--lr", type=float, default=2.0)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--out", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    rows = load_rows(args.train)
+    for path in args.extra:
+        rows += load_rows(path)
+    featurizer = HashedNgramEmbedder(dim=args.dim)
+    x, y = featurize(featurizer, rows)
+    weights, bias = train(x, y, args.epochs, args.lr, args.l2)
+    model = IntentModel(weights, bias, TASKS, args.dim)
+
+    train_accuracy = float(((x @ model.weights.T + model.bias).argmax(axis=1) == y).mean())
+    print(f"trained on {len(rows)} examples, train accuracy {train_accuracy:.3f}")
+    if os.path.exists(args.eval):
+        eval_rows = load_rows(args.eval)
+        hits = sum(TASKS[int(model.probabilities(text).argmax())] == label for text, label in eval_rows)
+        print(f"model alone on {len(eval_rows)} eval examples: accuracy {hits / len(eval_rows):.3f}")
+
+    model.save(args.out)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -----------------------------------------------------------------------
+# gunicorn.conf.py
+# Multi-process serving: gunicorn manages uvicorn workers, one per core.
+#
+#   cd backend
+#   gunicorn -c gunicorn.conf.py main:app
+#   WEB_CONCURRENCY=4 PORT=8080 gunicorn -c gunicorn.conf.py main:app
+#
+# Each worker is a separate process with its own event loop, caches and
+# Supabase client. State the workers must agree on (per-user job limits,
+# bulk-job cancellation, the LLM circuit breaker, the watchdog lease) goes
+# through src/services/shared_state.py; with more than one worker this file
+# switches it to the SQLite backend before any worker starts, unless
+# SHARED_STATE_BACKEND is set. `uvicorn main:app --workers N` works too, but
+# then set SHARED_STATE_BACKEND=sqlite yourself.
+# -----------------------------------------------------------------------
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Longest route timeout (route_timeout in config.py) plus headroom; workflow runs
+# happen in background threads and keep the worker's heartbeat going
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "150"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Workers import the app themselves: the app starts threads in its lifespan
+# and defers heavy imports, neither of which survives a fork from the master
+preload_app = False
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+if workers > 1:
+    os.environ.setdefault("SHARED_STATE_BACKEND", "sqlite")
+
+
+def on_starting(server):
+    """Start from empty shared state: slots and leases of a previous master's workers are void."""
+    if os.environ.get("SHARED_STATE_BACKEND") != "sqlite":
+        return
+    path = os.environ.get("SHARED_STATE_DB", "/tmp/smarttutor_shared_state.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+    server.log.info(f"Shared worker state: {path} ({workers} workers)")
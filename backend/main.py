@@ -1,6 +1,9 @@
+import threading
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 
 import logging
@@ -18,11 +21,43 @@ logger = logging.getLogger(__name__)
 from src.api.routes.workflow import router as workflow_router
 from src.api.routes.doubt import router as doubt_router
 from src.api.routes.orchestrator import router as orchestrator_router
+from src.api.routes.telemetry import router as telemetry_router
+from src.configs.config import PRELOAD_AGENT_GRAPH
+from src.services.generation_watchdog import generation_watchdog
+from src.services.supabase_service import supabase_service
+from src.utils.deadline import DeadlineExceeded, DeadlineMiddleware
+from src.utils.retry_policy import retry_budget_scope
+from src.utils.tracing import start_span
+from src.utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, metrics
+
+
+def _preload_agent_graph():
+    try:
+        from src.agents.graph import get_agent_workflow
+        get_agent_workflow()
+        logger.info("🧩 Agent graph compiled")
+    except Exception as e:
+        logger.warning(f"Agent graph preload failed (it will be built on the first run): {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created here, not at import, so the app imports fast
+    supabase_service.connect()
+    # Reset spaces left in 'generating' by crashed or timed-out runs
+    generation_watchdog.start()
+    if PRELOAD_AGENT_GRAPH:
+        # Off the startup path: the app takes traffic while LangGraph loads
+        threading.Thread(target=_preload_agent_graph, name="graph-preload", daemon=True).start()
+    yield
+    generation_watchdog.stop()
+
 
 app = FastAPI(
     title="Educational AI Agent Backend",
     description="Backend API for the Educational AI Agent",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS for frontend access
@@ -34,10 +69,35 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-route request counts and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Request deadline (route default or X-Request-Timeout); client disconnects cancel the work
+app.add_middleware(DeadlineMiddleware)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    logger.warning(f"⏱️ {request.method} {request.url.path} stopped: {exc}")
+    return JSONResponse(status_code=504, content={"detail": f"Request ran out of time: {exc}"})
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Root span per request; LLM calls made while serving it are attributed to it
+    request_id = request.headers.get("x-request-id")
+    # LLM retries made while serving one request share a single retry budget
+    with retry_budget_scope(), start_span(
+        "http.request", request_id=request_id, method=request.method, path=request.url.path,
+    ) as span:
+        response = await call_next(request)
+        span.set(status_code=response.status_code)
+    response.headers["X-Request-ID"] = span.attributes["request_id"]
+    return response
+
 # Include the workflow router from the src directory
 app.include_router(workflow_router, prefix="/api/workflows", tags=["workflow"])
 app.include_router(doubt_router, prefix="/api/doubt", tags=["doubt"])
 app.include_router(orchestrator_router, prefix="/api/orchestrator", tags=["orchestrator"])
+app.include_router(telemetry_router, prefix="/api/telemetry", tags=["telemetry"])
 
 @app.get("/")
 async def root():
@@ -47,5 +107,10 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,118 @@
+# -----
+# Content fingerprints for incremental regeneration.
+#
+# Every artifact stores a hash of the inputs it was generated from
+# (source, summary, profile fields, prompt version, and the provider that
+# actually answered). A run computes the fingerprint it would produce with
+# the routed provider; when that matches and the artifact is still
+# present, the node is skipped instead of burning another LLM call. An
+# artifact that came from a fallback provider therefore never matches and
+# is regenerated once the primary is back.
+#
+# Each node module defines PROMPT_VERSION: bump it whenever the node's
+# prompt changes so stored artifacts are regenerated instead of skipped
+# as unchanged.
+# -----
+
+import hashlib
+import json
+import logging
+from src.agents.state import AgentState
+from src.configs.config import GENERATION_MODE
+from src.agents.nodes import (
+    node_audio_summary, node_flashcards, node_quiz, node_recommendation, node_summarise
+)
+from src.utils.model_router import provider_for_task
+
+logger = logging.getLogger(__name__)
+
+# node name → (router task, state key holding its artifact, prompt version)
+ARTIFACT_NODES: dict[str, tuple[str, str, str]] = {
+    "summarise":      ("summary",        "summary_notes",   node_summarise.PROMPT_VERSION),
+    "quiz":           ("quiz",           "quiz",            node_quiz.PROMPT_VERSION),
+    "flashcards":     ("flashcard",      "flashcards",      node_flashcards.PROMPT_VERSION),
+    "recommendation": ("recommendation", "recommendations", node_recommendation.PROMPT_VERSION),
+    "audio_summary":  ("audio",          "podcast_script",  node_audio_summary.PROMPT_VERSION),
+}
+
+# Nodes that only refine the summary in place. They follow the summary's
+# fate: if the summary was reused, their output is already baked into it.
+SUMMARY_REFINER_NODES = {"verify", "enrichment"}
+
+# Key under which the hash of the produced summary text is stored
+SUMMARY_HASH_KEY = "summary_hash"
+
+# Generated together by node_study_pack when GENERATION_MODE=combined
+STUDY_PACK_NODES = ("quiz", "flashcards", "recommendation")
+
+# The student profile fields the prompts use (see initial_state in agent_workflow.py)
+_PROFILE_FIELDS = ("grade_level", "gender", "language")
+
+
+def _digest(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def artifact_task(node: str) -> str:
+    """The router task that generates a node's artifact in the current GENERATION_MODE."""
+    if GENERATION_MODE == "combined" and node in STUDY_PACK_NODES:
+        return "study_pack"
+    return ARTIFACT_NODES[node][0]
+
+
+def compute_fingerprint(node: str, state: AgentState, provider: str | None = None) -> str | None:
+    """
+    Fingerprint of the inputs a node would consume in this state. `provider`
+    is the one that produced the artifact (see UsageTally.provider); before
+    the run it defaults to the provider the node's task is routed to.
+    Returns None when the node is not fingerprinted or its inputs are unknown.
+    """
+    if node not in ARTIFACT_NODES:
+        return None
+
+    _, _, prompt_version = ARTIFACT_NODES[node]
+    profile = state.get("student_profile") or {}
+    payload = {
+        "node": node,
+        "prompt_version": prompt_version,
+        "model": provider or provider_for_task(artifact_task(node)),
+        "profile": {f: profile.get(f) for f in _PROFILE_FIELDS},
+    }
+
+    if node == "summarise":
+        prompt = state.get("user_prompt") or {}
+        payload["source"] = _digest({
+            "topic": prompt.get("topic"),
+            "file_url": (prompt.get("file_url") or "").strip(),
+        })
+    else:
+        summary_hash = (state.get("fingerprints") or {}).get(SUMMARY_HASH_KEY)
+        if not summary_hash:
+            return None
+        payload["summary"] = summary_hash
+
+    return _digest(payload)
+
+
+def can_skip(node: str, state: AgentState, fingerprint: str | None) -> bool:
+    """A node can be skipped when its fingerprint is unchanged and its artifact still exists."""
+    if not fingerprint:
+        return False
+    stored = state.get("stored_fingerprints") or {}
+    if stored.get(node) != fingerprint:
+        return False
+    if node == "summarise" and not stored.get(SUMMARY_HASH_KEY):
+        return False
+    _, artifact_key, _ = ARTIFACT_NODES[node]
+    return bool(state.get(artifact_key))
+
+
+def merge_fingerprints(stored: dict | None, produced: dict | None) -> dict:
+    """Combine stored and freshly produced fingerprints; None entries invalidate."""
+    merged = {**(stored or {}), **(produced or {})}
+    return {k: v for k, v in merged.items() if v}
@@ -1,12 +1,129 @@
+import logging
+import time
+import threading
+import contextvars
 from langgraph.graph import StateGraph, START, END
+from functools import lru_cache
+from src.configs.config import GENERATION_MODE, SPECULATIVE_AUDIO, node_timeout
+from src.utils.deadline import Deadline, current_deadline, deadline_scope
+from src.utils.tracing import start_span, usage_scope
 from src.agents.state import AgentState
+from src.agents.fingerprint import (
+    ARTIFACT_NODES, SUMMARY_HASH_KEY, SUMMARY_REFINER_NODES,
+    artifact_task, can_skip, compute_fingerprint, hash_text,
+)
+from src.agents.summary_artifact import SummaryArtifact
 from src.agents.nodes.node_summarise import run_node_summary_notes
 from src.agents.nodes.node_quiz import run_node_quiz
 from src.agents.nodes.node_recommendation import run_node_recommendation
 from src.agents.nodes.node_flashcards import run_node_flashcards
-from src.agents.nodes.node_audio_summary import run_node_audio_overview
+from src.agents.nodes.node_audio_summary import run_node_audio_overview, run_node_audio_reconcile
 from src.agents.nodes.node_verifier import run_node_verifier
 from src.agents.nodes.node_enrichment import run_node_enrichment
+from src.agents.nodes.node_study_pack import run_node_study_pack
+
+logger = logging.getLogger(__name__)
+
+
+def _incremental(name: str, node_fn):
+    """
+    Wrap a node so it is skipped when the inputs of its stored artifact are
+    unchanged, and so it records the fingerprint of whatever it produces.
+    """
+
+    def run(state: AgentState):
+        if name in SUMMARY_REFINER_NODES:
+            if "summarise" in (state.get("skipped_nodes") or []):
+                logger.info(f"⏭️ Skipping '{name}': summary reused from previous run")
+                return {"skipped_nodes": [name]}
+            return node_fn(state)
+
+        fingerprint = compute_fingerprint(name, state)
+        if can_skip(name, state, fingerprint):
+            logger.info(f"⏭️ Skipping '{name}': inputs unchanged since last run")
+            update = {"skipped_nodes": [name], "fingerprints": {name: fingerprint}}
+            if name == "summarise":
+                stored = state.get("stored_fingerprints") or {}
+                update["fingerprints"][SUMMARY_HASH_KEY] = stored[SUMMARY_HASH_KEY]
+            return update
+
+        with usage_scope() as usage:
+            result = dict(node_fn(state) or {})
+        _, artifact_key, _ = ARTIFACT_NODES[name]
+        produced = result.get(artifact_key)
+        # Record the provider that actually answered (a fallback's artifact won't match next time);
+        # a node that ran but produced nothing invalidates its old fingerprint
+        provider = usage.provider(artifact_task(name))
+        fingerprints = {name: compute_fingerprint(name, state, provider) if produced else None}
+        if name == "summarise":
+            # Downstream nodes need the summary hash to compute their own fingerprints
+            fingerprints[SUMMARY_HASH_KEY] = hash_text(SummaryArtifact.from_any(produced).markdown) if produced else None
+        result["fingerprints"] = fingerprints
+        return result
+
+    return run
+
+
+def _bounded(name: str, node_fn):
+    """
+    Run a node under its own wall-clock budget, nested inside the run budget.
+    On timeout the node's deadline is cancelled (so its retries stop) and the
+    graph moves on; whatever other nodes already saved is kept.
+    """
+
+    def run(state: AgentState):
+        deadline = Deadline(node_timeout(name), parent=current_deadline())
+        if deadline.expired:
+            logger.warning(f"⌛ Skipping '{name}': workflow run budget exhausted")
+            return {"timed_out_nodes": [name]}
+
+        outcome = {}
+
+        def target():
+            try:
+                with deadline_scope(deadline=deadline):
+                    outcome["result"] = node_fn(state)
+            except BaseException as e:
+                outcome["error"] = e
+
+        # Daemon thread: a hung provider call must not keep the process alive
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(target,), name=f"node-{name}", daemon=True)
+        worker.start()
+        remaining = deadline.remaining()
+        worker.join(None if remaining == float("inf") else remaining)
+
+        if worker.is_alive():
+            deadline.cancel()
+            logger.error(f"⌛ Node '{name}' exceeded its time budget — cancelled, keeping partial output")
+            return {"timed_out_nodes": [name]}
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("result") or {}
+
+    return run
+
+
+def _timed(name: str, node_fn):
+    """Wrap a node so its wall-clock duration is recorded in `node_timings` and traced as a span."""
+
+    def run(state: AgentState):
+        start = time.perf_counter()
+        try:
+            with start_span("graph.node", node=name):
+                result = dict(node_fn(state) or {})
+        finally:
+            duration = time.perf_counter() - start
+            logger.info(f"⏱️ Node '{name}' finished in {duration:.2f}s")
+        result["node_timings"] = {name: round(duration, 3)}
+        return result
+
+    return run
+
+
+def _node(name: str, node_fn):
+    return _timed(name, _incremental(name, _bounded(name, node_fn)))
+
 
 def create_agent_graph():
     # define the graph
@@ -14,34 +131,86 @@ def create_agent_graph():
 
     # Add nodes
     # Summarize runs first, then the rest run sequentially
-    workflow.add_node("summarise", run_node_summary_notes)
-    workflow.add_node("quiz", run_node_quiz)
-    workflow.add_node("recommendation", run_node_recommendation)
-    workflow.add_node("flashcards", run_node_flashcards)
-    workflow.add_node("audio_summary", run_node_audio_overview)
-    workflow.add_node("verify", run_node_verifier)
-    workflow.add_node("enrichment", run_node_enrichment)
+    workflow.add_node("summarise", _node("summarise", run_node_summary_notes))
+    if GENERATION_MODE == "combined":
+        # One call for quiz + flashcards + recommendations; fingerprints handled per artifact inside
+        workflow.add_node("study_pack", _timed("study_pack", _bounded("study_pack", run_node_study_pack)))
+    else:
+        workflow.add_node("quiz", _node("quiz", run_node_quiz))
+        workflow.add_node("recommendation", _node("recommendation", run_node_recommendation))
+        workflow.add_node("flashcards", _node("flashcards", run_node_flashcards))
+    workflow.add_node("audio_summary", _node("audio_summary", run_node_audio_overview))
+    workflow.add_node("verify", _node("verify", run_node_verifier))
+    workflow.add_node("enrichment", _node("enrichment", run_node_enrichment))
+    # Not an artifact of its own, so no fingerprint layer
+    workflow.add_node("audio_reconcile", _timed("audio_reconcile", _bounded("audio_reconcile", run_node_audio_reconcile)))
 
     # Set Entry Point
     workflow.add_edge(START, "summarise")
 
     # Add Edges (Fan-out: everything runs in parallel after summary is ready)
-    workflow.add_edge("summarise", "quiz")
-    workflow.add_edge("summarise", "recommendation")
-    workflow.add_edge("summarise", "flashcards")
+    if GENERATION_MODE == "combined":
+        workflow.add_edge("summarise", "study_pack")
+        workflow.add_edge("study_pack", END)
+    else:
+        workflow.add_edge("summarise", "quiz")
+        workflow.add_edge("summarise", "recommendation")
+        workflow.add_edge("summarise", "flashcards")
+        workflow.add_edge("quiz", END)
+        workflow.add_edge("recommendation", END)
+        workflow.add_edge("flashcards", END)
     workflow.add_edge("summarise", "enrichment")
     workflow.add_edge("summarise", "verify")
     
-    # Audio summary depends on verification
-    workflow.add_edge("verify", "audio_summary")
+    if SPECULATIVE_AUDIO:
+        # Audio starts from the draft summary alongside verification;
+        # the reconcile step regenerates it only if the verifier changed a lot
+        workflow.add_edge("summarise", "audio_summary")
+        workflow.add_edge(["verify", "audio_summary"], "audio_reconcile")
+        workflow.add_edge("audio_reconcile", END)
+    else:
+        # Audio summary depends on verification
+        workflow.add_edge("verify", "audio_summary")
+        workflow.add_edge("audio_summary", END)
     
     # All terminal nodes point to END
-    workflow.add_edge("quiz", END)
-    workflow.add_edge("recommendation", END)
-    workflow.add_edge("flashcards", END)
     workflow.add_edge("enrichment", END)
-    workflow.add_edge("audio_summary", END)
 
     return workflow.compile()
 
-AgentGraphWorkflow = create_agent_graph()
+
+@lru_cache(maxsize=1)
+def get_agent_workflow():
+    """The compiled graph, built on first use rather than when the module is imported."""
+    return create_agent_graph()
+
+
+@lru_cache(maxsize=1)
+def _graph_edges() -> dict[str, list[str]]:
+    edges: dict[str, list[str]] = {}
+    for edge in get_agent_workflow().get_graph().edges:
+        edges.setdefault(edge.source, []).append(edge.target)
+    return edges
+
+
+def critical_path(node_timings: dict) -> tuple[float, list[str]]:
+    """
+    Longest START→END path through the graph, weighted by the measured node
+    durations of a run. This is the latency no amount of fan-out can hide.
+    """
+    edges = _graph_edges()
+    memo: dict[str, tuple[float, list[str]]] = {}
+
+    def longest(node: str) -> tuple[float, list[str]]:
+        if node not in memo:
+            best = (0.0, [])
+            for nxt in edges.get(node, []):
+                candidate = longest(nxt)
+                if candidate[0] > best[0]:
+                    best = candidate
+            own = node_timings.get(node, 0.0)
+            memo[node] = (own + best[0], ([node] if node in node_timings else []) + best[1])
+        return memo[node]
+
+    total, path = longest(START)
+    return round(total, 3), path
@@ -1,14 +1,17 @@
 import logging
-import json
-from langchain_core.prompts import ChatPromptTemplate
 from src.agents.state import AgentState
+from src.agents.summary_artifact import SummaryArtifact, summary_of
 from src.agents.output_structures import AudioTask
+from src.configs.config import AUDIO_RERUN_CHANGE_RATIO
 from src.services.supabase_service import supabase_service
 from src.utils.model_router import call_with_fallback
+from src.utils.prompt_builder import PromptAssembly
 
 # ----- Agent Node - Audio Summary -----
 # Script generation: Groq Llama 3  |  Fallback: Gemini Flash
 
+PROMPT_VERSION = "v2"
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,11 +20,10 @@ def run_node_audio_overview(state: AgentState):
 
     logging.info("Running node_audio_overview.... [primary: Groq Llama 3]")
 
-    prompt_template = ChatPromptTemplate([
-        ("system", """
+    instructions = """
         ## 🔊 TASK: AUDIO
         ### INPUT:
-        Text content for study summary: {topic_summary}
+        The study notes above.
 
         ### RULES:
         * Text must be clean and natural for speech
@@ -30,29 +32,20 @@ def run_node_audio_overview(state: AgentState):
         * Output MUST be valid JSON: {{ "task": "audio", "data": {{ "text": "..." }} }}
         * Provide content in {language} ONLY. 
         * Academic Level: {grade_level}
-        """),
-        ("user", "Summarized Study Material: {topic_summary}. \n\nIMPORTANT: Generate clean script in {language} ONLY.")
-    ])
-
-    # Robustly extract summary text from state
-    summary_data = state.get("summary_notes")
-    summary_text = ""
-
-    if summary_data:
-        if isinstance(summary_data, str):
-            try:
-                parsed = json.loads(summary_data)
-                summary_text = parsed.get("summary", summary_data)
-            except Exception:
-                summary_text = summary_data
-        elif hasattr(summary_data, "summary"):
-            summary_text = summary_data.summary
-        else:
-            summary_text = str(summary_data)
-
-    if not summary_text:
+        """
+
+    # Summary normalized once per run; nodes share its views
+    summary = summary_of(state)
+    if not summary:
         logger.warning("No summary notes found, falling back to topic for audio summary")
-        summary_text = state['user_prompt']['topic']
+        summary = SummaryArtifact(state['user_prompt']['topic'])
+
+    # Summary goes into the shared prompt prefix (once, not twice) so providers can reuse it
+    prompt = PromptAssembly(
+        instructions,
+        "Write the audio script for the study notes above. \n\nIMPORTANT: Generate clean script in {language} ONLY.",
+        shared_context=summary.shared_context,
+    )
 
     target_lang = state['student_profile'].get("language", "English")
     logger.info(f"Generating audio script in '{target_lang}' | Primary: Groq Llama 3")
@@ -60,11 +53,10 @@ def run_node_audio_overview(state: AgentState):
     try:
         response = call_with_fallback(
             task="audio",
-            chain_fn=lambda llm: prompt_template | llm,
+            chain_fn=prompt,
             input_data={
                 "grade_level": state['student_profile'].get("grade_level", "general"),
                 "language": target_lang,
-                "topic_summary": summary_text,
             },
             structured_schema=AudioTask,
             temperature=0.2,
@@ -83,3 +75,21 @@ def run_node_audio_overview(state: AgentState):
     except Exception as e:
         logger.warning(f"Failed to generate audio script: {e}")
         return {"podcast_script": None}
+
+
+def run_node_audio_reconcile(state: AgentState):
+    """
+    Join point for speculative audio: the script was generated from the draft
+    summary in parallel with verification. Keep it unless the verifier changed
+    a material share of the summary, in which case regenerate from the verified text.
+    """
+    stats = state.get("verification_stats") or {}
+    changed_ratio = stats.get("changed_ratio", 0.0)
+
+    if changed_ratio < AUDIO_RERUN_CHANGE_RATIO:
+        logger.info(f"Speculative audio script kept (verifier changed {changed_ratio:.1%} of the summary)")
+        return {"audio_speculation": {"kept": True, "changed_ratio": changed_ratio}}
+
+    logger.info(f"Verifier changed {changed_ratio:.1%} of the summary — regenerating audio script")
+    result = run_node_audio_overview(state)
+    return {**result, "audio_speculation": {"kept": False, "changed_ratio": changed_ratio}}
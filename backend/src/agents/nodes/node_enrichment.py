@@ -1,5 +1,6 @@
 import logging
 from src.agents.state import AgentState
+from src.agents.summary_artifact import summary_of
 from src.services.supabase_service import supabase_service
 from src.utils.pdf_extractor import describe_pdf_visuals
 
@@ -27,30 +28,20 @@ def run_node_enrichment(state: AgentState):
             logger.info("No meaningful visuals found to enrich.")
             return {}
 
-        # 2. Extract current summary to update it
-        current_summary = state.get("summary_notes")
+        # 2. Current summary to append to
+        current_summary = summary_of(state)
         if not current_summary:
             logger.warning("Enrichment failed: No existing summary notes to append to.")
             return {}
 
-        # 3. Update the summary with visuals
-        # We append the visuals to the end of the summary for the DB
-        # If it's a Pydantic object, we handle it
-        import json
-        
-        updated_notes = current_summary
-        if hasattr(current_summary, "summary"):
-            updated_notes.summary = f"{current_summary.summary}\n\n{visual_descriptions}"
-            data_to_store = updated_notes.model_dump()
-        else:
-            # Fallback if it's raw text
-            updated_notes = f"{current_summary}\n\n{visual_descriptions}"
-            data_to_store = {"summary": updated_notes}
+        # 3. Add the visuals as an appendix section. The verifier may revise the
+        # body in the same step; the state reducer keeps both changes.
+        updated_notes = current_summary.with_appendix(visual_descriptions)
 
         # 4. Push to Supabase to trigger frontend update
         supabase_service.update_learning_space(
             state["learning_space_id"],
-            {"summary_notes": data_to_store}
+            {"summary_notes": updated_notes.to_storage()}
         )
         
         logger.info("🎨 Visual enrichment complete and pushed to DB.")
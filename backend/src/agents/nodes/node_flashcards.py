@@ -1,14 +1,16 @@
 import logging
-import json
-from langchain_core.prompts import ChatPromptTemplate
 from src.agents.state import AgentState
+from src.agents.summary_artifact import SummaryArtifact, summary_of
 from src.agents.output_structures import FlashcardTask
 from src.services.supabase_service import supabase_service
 from src.utils.model_router import call_with_fallback
+from src.utils.prompt_builder import PromptAssembly
 
 # ------- Agent Node - Flashcards ---------------
 # Primary model: Mistral AI  |  Fallback: Gemini Flash
 
+PROMPT_VERSION = "v2"
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,11 +19,10 @@ def run_node_flashcards(state: AgentState):
 
     logger.info("node_flashcards is running [primary: Mistral AI]")
 
-    prompt_template = ChatPromptTemplate([
-        ("system", """ 
+    instructions = """
         ## 📚 TASK: FLASHCARD
         ### INPUT:
-        Text content on a topic: {topic_summary}
+        The study notes above.
 
         ### RULES:
         * Generate 5–10 flashcards
@@ -31,29 +32,20 @@ def run_node_flashcards(state: AgentState):
         * Output MUST be valid JSON wrapping data in a 'data' array
         * Provide content in {language} ONLY. This is a CRITICAL REQUIREMENT. 
         * Student Level: {grade_level}
-        """),
-        ("user", "Summarized Study Material: {topic_summary}. \n\nIMPORTANT: Generate content in {language} ONLY.")
-    ])
-
-    # Robustly extract summary text from state
-    summary_data = state.get("summary_notes")
-    summary_text = ""
-
-    if summary_data:
-        if isinstance(summary_data, str):
-            try:
-                parsed = json.loads(summary_data)
-                summary_text = parsed.get("summary", summary_data)
-            except Exception:
-                summary_text = summary_data
-        elif hasattr(summary_data, "summary"):
-            summary_text = summary_data.summary
-        else:
-            summary_text = str(summary_data)
-
-    if not summary_text:
+        """
+
+    # Summary normalized once per run; nodes share its views
+    summary = summary_of(state)
+    if not summary:
         logger.warning("No summary notes found, falling back to topic for flashcards")
-        summary_text = state['user_prompt']['topic']
+        summary = SummaryArtifact(state['user_prompt']['topic'])
+
+    # Summary goes into the shared prompt prefix (once, not twice) so providers can reuse it
+    prompt = PromptAssembly(
+        instructions,
+        "Create flashcards from the study notes above. \n\nIMPORTANT: Generate content in {language} ONLY.",
+        shared_context=summary.shared_context,
+    )
 
     target_lang = state['student_profile'].get("language", "English")
     logger.info(f"🎯 FLASHCARDS NODE - Target language: '{target_lang}' | Primary: Mistral AI")
@@ -61,11 +53,10 @@ def run_node_flashcards(state: AgentState):
     try:
         response = call_with_fallback(
             task="flashcard",
-            chain_fn=lambda llm: prompt_template | llm,
+            chain_fn=prompt,
             input_data={
                 "grade_level": state['student_profile'].get("grade_level", "general"),
                 "language": target_lang,
-                "topic_summary": summary_text,
             },
             structured_schema=FlashcardTask,
             temperature=0.1,
@@ -1,14 +1,16 @@
 import logging
-import json
-from langchain_core.prompts import ChatPromptTemplate
 from src.agents.state import AgentState
+from src.agents.summary_artifact import SummaryArtifact, summary_of
 from src.agents.output_structures import QuizOutput
 from src.services.supabase_service import supabase_service
 from src.utils.model_router import call_with_fallback
+from src.utils.prompt_builder import PromptAssembly
 
 # ---------------- Agent Node - Quiz ---------------
 # Primary model: DeepSeek  |  Fallback: Gemini Flash
 
+PROMPT_VERSION = "v2"
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,9 +19,8 @@ def run_node_quiz(state: AgentState):
 
     logger.info("node_quiz is running [primary: DeepSeek]")
 
-    prompt_template = ChatPromptTemplate([
-        ("system", """ 
-        You are a helpful academic tutor. Use these instructions to create a quiz on the notes provided by the user:
+    instructions = """
+        You are a helpful academic tutor. Use these instructions to create a quiz on the study notes above:
         
         Student Profile:
             - Class Level: {grade_level}
@@ -34,29 +35,20 @@ def run_node_quiz(state: AgentState):
         6. Provide content in {language} ONLY. This is a CRITICAL REQUIREMENT. 
         7. If the source material or topic title is in a different language, you MUST TRANSLATE EVERYTHING to {language}.
         8. DO NOT use any other language than {language} in your output.
-        """),
-        ("user", "Topic Summary {topic_summary}. \n\nIMPORTANT: Generate the content in {language} ONLY.")
-    ])
-
-    # Robustly extract summary text from state
-    summary_data = state.get("summary_notes")
-    summary_text = ""
+        """
 
-    if summary_data:
-        if isinstance(summary_data, str):
-            try:
-                parsed = json.loads(summary_data)
-                summary_text = parsed.get("summary", summary_data)
-            except Exception:
-                summary_text = summary_data
-        elif hasattr(summary_data, "summary"):
-            summary_text = summary_data.summary
-        else:
-            summary_text = str(summary_data)
-
-    if not summary_text:
+    # Summary normalized once per run; nodes share its views
+    summary = summary_of(state)
+    if not summary:
         logger.warning("No summary notes found, falling back to topic for quiz generation")
-        summary_text = state['user_prompt']['topic']
+        summary = SummaryArtifact(state['user_prompt']['topic'])
+
+    # Summary goes into the shared prompt prefix so providers can reuse it across nodes
+    prompt = PromptAssembly(
+        instructions,
+        "Create the quiz from the study notes above. \n\nIMPORTANT: Generate the content in {language} ONLY.",
+        shared_context=summary.shared_context,
+    )
 
     target_lang = state['student_profile'].get("language", "English")
     logger.info(f"🎯 QUIZ NODE - Target language: '{target_lang}' | Primary: DeepSeek")
@@ -64,12 +56,11 @@ def run_node_quiz(state: AgentState):
     try:
         response = call_with_fallback(
             task="quiz",
-            chain_fn=lambda llm: prompt_template | llm,
+            chain_fn=prompt,
             input_data={
                 "grade_level": state['student_profile'].get("grade_level", "general"),
                 "language": target_lang,
                 "gender": state['student_profile'].get("gender", ""),
-                "topic_summary": summary_text,
             },
             structured_schema=QuizOutput,
             temperature=0.1,
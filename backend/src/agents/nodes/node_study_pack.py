@@ -0,0 +1,169 @@
+import re
+import json
+import time
+import logging
+from pydantic import ValidationError
+from src.agents.state import AgentState
+from src.agents.output_structures import QuizOutput, FlashcardTask, RecommendationList
+from src.agents.fingerprint import ARTIFACT_NODES, can_skip, compute_fingerprint
+from src.agents.summary_artifact import SummaryArtifact, summary_of
+from src.agents.nodes.node_quiz import run_node_quiz
+from src.agents.nodes.node_flashcards import run_node_flashcards
+from src.agents.nodes.node_recommendation import run_node_recommendation
+from src.services.supabase_service import supabase_service
+from src.utils.llm_utils import estimate_tokens
+from src.utils.model_router import call_with_fallback, provider_for_task
+from src.utils.prompt_builder import PromptAssembly
+from src.utils.tracing import usage_scope
+
+# ------- Agent Node - Study Pack (combined generation) ---------------
+# One call returns quiz, flashcards and recommendations together, so the
+# summary is sent once and only one rate-limit slot is used. Each artifact
+# is validated on its own; any that fail fall back to their usual node.
+# Primary model: Gemini Flash (GENERATION_MODE=combined)
+
+logger = logging.getLogger(__name__)
+
+# graph node name → (key in the combined JSON, schema, per-artifact fallback node)
+_PARTS = {
+    "quiz":           ("quiz",            QuizOutput,         run_node_quiz),
+    "flashcards":     ("flashcards",      FlashcardTask,      run_node_flashcards),
+    "recommendation": ("recommendations", RecommendationList, run_node_recommendation),
+}
+
+_INSTRUCTIONS = """
+    You are a helpful academic tutor. Using the study notes above, create ALL of the requested study artifacts in one response.
+
+    Student Profile:
+    - Class Level: {grade_level}
+    - Language: {language}
+    - Gender: {gender}
+
+    Artifacts (only produce the keys listed in "Requested"):
+    - "quiz": 10 MCQ questions with 4 options (A-D), correctAnswer, hint and explanation, testing fundamentals and analytical thinking.
+    - "flashcards": 5–10 flashcards in a "data" array; short clear "question", 1–2 line "answer", no extra text.
+    - "recommendations": up to 10 resources (books, online lectures, articles) with a contextual description and url if available.
+
+    Rules:
+    1. Respond with ONE JSON object and nothing else. Top-level keys: the requested artifacts.
+    2. Each artifact MUST follow its JSON schema exactly:
+    {schemas}
+    3. Provide content in {language} ONLY. This is a CRITICAL REQUIREMENT.
+    4. If the source material or topic title is in a different language, you MUST TRANSLATE EVERYTHING to {language}.
+    """
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+
+def _parse_json(text: str) -> dict:
+    cleaned = _FENCE.sub("", text.strip())
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("No JSON object in combined response")
+    parsed = json.loads(cleaned[start:end + 1])
+    if not isinstance(parsed, dict):
+        raise ValueError("Combined response is not a JSON object")
+    return parsed
+
+
+def run_node_study_pack(state: AgentState):
+    """Single LLM call for quiz, flashcards and recommendations with per-artifact fallback."""
+
+    logger.info("node_study_pack running.... [combined generation]")
+
+    # Respect incremental regeneration for each artifact individually
+    update = {"skipped_nodes": [], "fingerprints": {}}
+    needed = []
+    for name in _PARTS:
+        fingerprint = compute_fingerprint(name, state)
+        if can_skip(name, state, fingerprint):
+            logger.info(f"⏭️ Skipping '{name}': inputs unchanged since last run")
+            update["skipped_nodes"].append(name)
+            update["fingerprints"][name] = fingerprint
+        else:
+            needed.append((name, fingerprint))
+
+    if not needed:
+        return update
+
+    stats = {"mode": "combined" if len(needed) > 1 else "single", "requested": [n for n, _ in needed], "parsed": [], "fallbacks": []}
+    started = time.perf_counter()
+    parsed = {}
+    combined_provider = None
+
+    # A single artifact gains nothing from the combined schema
+    if len(needed) > 1:
+        summary = summary_of(state) or SummaryArtifact(state['user_prompt']['topic'])
+        schemas = {
+            _PARTS[name][0]: _PARTS[name][1].model_json_schema() for name, _ in needed
+        }
+        prompt = PromptAssembly(
+            _INSTRUCTIONS,
+            "Requested: {requested}. \n\nIMPORTANT: Generate the content in {language} ONLY.",
+            shared_context=summary.shared_context,
+        )
+        try:
+            with usage_scope() as usage:
+                response = call_with_fallback(
+                    task="study_pack",
+                    chain_fn=prompt,
+                    input_data={
+                        "grade_level": state['student_profile'].get("grade_level", "general"),
+                        "language": state['student_profile'].get("language", "English"),
+                        "gender": state['student_profile'].get("gender", ""),
+                        "schemas": json.dumps(schemas, ensure_ascii=False),
+                        "requested": ", ".join(schemas),
+                    },
+                    structured_schema=None,
+                    temperature=0.1,
+                )
+            combined_provider = usage.provider("study_pack")
+            content = response.content if hasattr(response, "content") else str(response)
+            stats["output_tokens"] = estimate_tokens(content)
+            parsed = _parse_json(content)
+        except Exception as e:
+            logger.warning(f"Combined generation failed, falling back per artifact: {e}")
+
+    to_store = {}
+    single = len(needed) == 1
+    for name, _ in needed:
+        key, schema, fallback_node = _PARTS[name]
+        task, artifact_key, _ = ARTIFACT_NODES[name]
+        try:
+            artifact = schema.model_validate(parsed[key]).model_dump()
+        except (KeyError, TypeError, ValidationError) as e:
+            # Only note the miss here: LLM calls made inside an except block
+            # would run with the parse error still being handled
+            artifact = None
+            logger.warning(f"Artifact '{name}' missing from combined output ({type(e).__name__}) — using per-artifact call")
+
+        # Fingerprints record the provider that produced each artifact, so one
+        # that came from a fallback is regenerated next run
+        if artifact is not None:
+            to_store[artifact_key] = artifact
+            update[artifact_key] = artifact
+            update["fingerprints"][name] = compute_fingerprint(name, state, combined_provider)
+            stats["parsed"].append(name)
+            continue
+
+        stats["fallbacks"].append(name)
+        with usage_scope() as usage:
+            result = fallback_node(state) or {}
+        update.update(result)
+        provider = usage.provider(task)
+        if single and provider == provider_for_task(task):
+            # A lone artifact is always generated by its own node: that's the planned path
+            provider = None
+        produced = result.get(artifact_key)
+        update["fingerprints"][name] = compute_fingerprint(name, state, provider) if produced else None
+
+    if to_store:
+        # One write for everything the combined call produced
+        supabase_service.update_learning_space(state["learning_space_id"], to_store)
+
+    stats["latency"] = round(time.perf_counter() - started, 3)
+    logger.info(
+        f"Study pack done in {stats['latency']:.2f}s | parsed: {stats['parsed']} | fallbacks: {stats['fallbacks']}"
+    )
+    update["generation_stats"] = stats
+    return update
@@ -2,6 +2,7 @@
 import logging
 from langchain_core.prompts import ChatPromptTemplate
 from src.agents.state import AgentState
+from src.agents.summary_artifact import SummaryArtifact
 from src.agents.output_structures import SummaryNoteOutput
 from src.services.supabase_service import supabase_service
 from src.utils.model_router import call_with_fallback
@@ -11,6 +12,8 @@ from src.utils.youtube_extractor import fetch_youtube_transcript
 # -------------- Agent Node - Notes Summary ----------------
 # Primary model: DeepSeek  |  Fallback: Gemini Flash
 
+PROMPT_VERSION = "v1"
+
 logger = logging.getLogger(__name__)
 
 
@@ -117,7 +120,7 @@ def run_node_summary_notes(state: AgentState):
             logger.warning("⚠️ No summary text found to save")
 
         return {
-            "summary_notes": summary_text,
+            "summary_notes": SummaryArtifact(summary_text),
             "raw_source_text": extracted_content
         }
 
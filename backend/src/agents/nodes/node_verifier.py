@@ -1,77 +1,208 @@
+import re
+import time
 import logging
-from langchain_core.prompts import ChatPromptTemplate
+from difflib import SequenceMatcher
 from src.agents.state import AgentState
-from src.agents.output_structures import SummaryNoteOutput
+from src.agents.output_structures import SummaryNoteOutput, VerificationReport
+from src.agents.summary_artifact import SummaryArtifact, summary_of
+from src.configs.config import VERIFIER_MODE
 from src.services.supabase_service import supabase_service
+from src.utils.llm_utils import estimate_tokens
 from src.utils.model_router import call_with_fallback
+from src.utils.prompt_builder import PromptAssembly
+from src.utils.token_budget import PromptSection, fit_sections
+
+# -------------- Agent Node - Verifier ----------------
+# Default "diff" mode asks only for span corrections and applies them
+# locally, so output tokens scale with the number of errors rather than
+# with the length of the summary. "rewrite" mode keeps the legacy
+# full-summary rewrite (VERIFIER_MODE=rewrite).
 
 logger = logging.getLogger(__name__)
 
-def run_node_verifier(state: AgentState):
+# The summary is sent as the shared prompt prefix (same bytes as the other
+# nodes use) so providers can reuse it; the source material comes after.
+
+_REWRITE_INSTRUCTIONS = """You are a meticulous Fact-Checker and Academic Editor.
+    Your task is to review the AI-generated summary (the study notes above) against the provided Source Material.
+
+    CRITICAL RULES:
+    1. Accuracy: Identify any facts in the Summary that CONTRADICT the Source Material.
+    2. Hallucinations: Remove any information in the Summary that is NOT present in the Source Material.
+    3. Tone: Ensure the tone is appropriate for {grade_level}.
+    4. Language: The final output MUST be in {language} ONLY.
+
+    If the summary is already perfect, return it as is.
+    If there are errors, return a corrected and improved version of the summary.
     """
-    Critic Node: Verifies the generated summary against the original source text 
-    to eliminate hallucinations and ensure factual integrity.
+
+_REWRITE_USER = """
+    Source Material:
+    ---
+    {source_text}
+    ---
+
+    Please provide the verified and corrected version of the summary.
     """
-    if not state.get('raw_source_text') or not state.get('summary_notes'):
-        logger.info("Verifier skipped: No source text or summary found.")
-        return {}
 
-    logger.info("node_verifier running... [Verification Pass]")
-
-    prompt_template = ChatPromptTemplate([
-        ("system", """You are a meticulous Fact-Checker and Academic Editor. 
-        Your task is to review an AI-generated summary against the provided Source Material.
-        
-        CRITICAL RULES:
-        1. Accuracy: Identify any facts in the Summary that CONTRADICT the Source Material.
-        2. Hallucinations: Remove any information in the Summary that is NOT present in the Source Material.
-        3. Tone: Ensure the tone is appropriate for {grade_level}.
-        4. Language: The final output MUST be in {language} ONLY.
-
-        If the summary is already perfect, return it as is. 
-        If there are errors, return a corrected and improved version of the summary.
-        """),
-        ("user", """
-        Source Material:
-        ---
-        {source_text}
-        ---
-
-        Current Summary:
-        ---
-        {current_summary}
-        ---
-
-        Please provide the verified and corrected version of the summary.
-        """)
-    ])
+_DIFF_INSTRUCTIONS = """You are a meticulous Fact-Checker and Academic Editor.
+    Your task is to review the AI-generated summary (the study notes above) against the provided Source Material.
 
-    try:
-        # Use a secondary model (Gemini Flash) for verification as it's great at following constraints
-        target_lang = state['student_profile'].get("language", "english")
-        
-        response = call_with_fallback(
-            task="verification",
-            chain_fn=lambda llm: prompt_template | llm,
-            input_data={
-                "grade_level": state['student_profile'].get("grade_level", "general"),
-                "language": target_lang,
-                "source_text": state['raw_source_text'][:25000], # Truncate to safety
-                "current_summary": state['summary_notes'],
-            },
-            structured_schema=SummaryNoteOutput,
-            temperature=0.0, # Zero temperature for factual consistency
-        )
+    CRITICAL RULES:
+    1. Accuracy: Flag any facts in the Summary that CONTRADICT the Source Material.
+    2. Hallucinations: Flag any claim in the Summary that is NOT supported by the Source Material.
+    3. Language: Replacements MUST be in {language} ONLY and suit a {grade_level} student.
+
+    DO NOT rewrite the summary. Return ONLY a list of corrections:
+    - "span": the exact wrong text, copied VERBATIM from the summary (keep it short, one sentence at most)
+    - "replacement": the corrected text, or "" to delete the span
+    - "reason": one short line explaining the correction
+    If the summary is accurate, return an empty list of corrections.
+    """
+
+_DIFF_USER = """
+    Source Material:
+    ---
+    {source_text}
+    ---
+
+    List the corrections needed, if any.
+    """
 
-        logger.info("Verification complete. Factual integrity ensured.")
 
-        # Update the learning space with the verified summary
+def apply_corrections(summary: str, corrections: list) -> tuple[str, list]:
+    """
+    Apply span corrections to the summary locally.
+    Spans are matched exactly first, then with whitespace-insensitive matching.
+    Returns the corrected text and the corrections that were applied.
+    """
+    applied = []
+    for correction in corrections:
+        span = (correction.span or "").strip()
+        if not span:
+            continue
+        if span in summary:
+            summary = summary.replace(span, correction.replacement, 1)
+            applied.append(correction)
+            continue
+        pattern = r"\s+".join(re.escape(part) for part in span.split())
+        match = re.search(pattern, summary)
+        if match:
+            summary = summary[:match.start()] + correction.replacement + summary[match.end():]
+            applied.append(correction)
+        else:
+            logger.warning(f"Verifier correction span not found in summary, ignoring: {span[:60]!r}")
+    return summary, applied
+
+
+def change_ratio(before: str, after: str) -> float:
+    """
+    Share of the summary the verifier changed (0 = identical), the same
+    measure in both modes. Compared word by word: on characters SequenceMatcher
+    either junks the common letters of long texts (wildly overstating the
+    change) or, with autojunk off, takes seconds on a long summary.
+    """
+    matcher = SequenceMatcher(None, before.split(), after.split(), autojunk=False)
+    return round(1 - matcher.ratio(), 4)
+
+
+def _verify_diff(state: AgentState, summary: SummaryArtifact, input_data: dict) -> dict:
+    started = time.perf_counter()
+    summary_text = summary.text
+    report = call_with_fallback(
+        task="verification",
+        chain_fn=PromptAssembly(_DIFF_INSTRUCTIONS, _DIFF_USER, shared_context=summary.shared_context),
+        input_data=input_data,
+        structured_schema=VerificationReport,
+        temperature=0.0,  # Zero temperature for factual consistency
+    )
+    corrected, applied = apply_corrections(summary_text, report.corrections)
+
+    stats = {
+        "mode": "diff",
+        "corrections": len(report.corrections),
+        "applied": len(applied),
+        "changed_ratio": change_ratio(summary_text, corrected),
+        "input_tokens": estimate_tokens(input_data["source_text"]) + summary.token_count,
+        "output_tokens": estimate_tokens(report.model_dump_json()),
+        # What the legacy full rewrite would have had to emit for the same summary
+        "rewrite_output_tokens": summary.token_count,
+        "latency": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Verification complete: {stats['applied']}/{stats['corrections']} corrections applied | "
+        f"~{stats['output_tokens']} output tokens vs ~{stats['rewrite_output_tokens']} for a full rewrite"
+    )
+
+    if applied:
+        revised = summary.with_text(corrected)
         supabase_service.update_learning_space(
             state["learning_space_id"],
-            {"summary_notes": response.model_dump()}
+            {"summary_notes": revised.to_storage()}
         )
+        return {"summary_notes": revised, "verification_stats": stats}
+    return {"verification_stats": stats}
+
 
-        return {"summary_notes": response}
+def _verify_rewrite(state: AgentState, summary: SummaryArtifact, input_data: dict) -> dict:
+    started = time.perf_counter()
+    response = call_with_fallback(
+        task="verification",
+        chain_fn=PromptAssembly(_REWRITE_INSTRUCTIONS, _REWRITE_USER, shared_context=summary.shared_context),
+        input_data=input_data,
+        structured_schema=SummaryNoteOutput,
+        temperature=0.0,  # Zero temperature for factual consistency
+    )
+    stats = {
+        "mode": "rewrite",
+        "changed_ratio": change_ratio(summary.text, response.summary),
+        "input_tokens": estimate_tokens(input_data["source_text"]) + summary.token_count,
+        "output_tokens": estimate_tokens(response.model_dump_json()),
+        "latency": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Verification complete (rewrite): ~{stats['output_tokens']} output tokens")
+
+    # Update the learning space with the verified summary
+    revised = summary.with_text(response.summary, title=response.title)
+    supabase_service.update_learning_space(
+        state["learning_space_id"],
+        {"summary_notes": revised.to_storage()}
+    )
+    return {"summary_notes": revised, "verification_stats": stats}
+
+
+def run_node_verifier(state: AgentState):
+    """
+    Critic Node: Verifies the generated summary against the original source text
+    to eliminate hallucinations and ensure factual integrity.
+    """
+    summary = summary_of(state)
+    if not state.get('raw_source_text') or not summary:
+        logger.info("Verifier skipped: No source text or summary found.")
+        return {}
+
+    logger.info(f"node_verifier running... [Verification Pass, mode={VERIFIER_MODE}]")
+
+    # The summary is sent whole (it is the shared prefix); the source gets the rest of the budget
+    fitted = fit_sections("verifier", [
+        PromptSection("summary", summary.text, priority=0),
+        PromptSection("source", state['raw_source_text'], priority=1,
+                      marker="\n\n[... SOURCE TRUNCATED DUE TO LENGTH ...]"),
+    ], task="verification")
+    if not fitted["source"]:
+        logger.info("Verifier skipped: summary leaves no room for source material in the prompt budget.")
+        return {}
+
+    input_data = {
+        "grade_level": state['student_profile'].get("grade_level", "general"),
+        "language": state['student_profile'].get("language", "english"),
+        "source_text": fitted["source"],
+    }
+
+    try:
+        if VERIFIER_MODE == "rewrite":
+            return _verify_rewrite(state, summary, input_data)
+        return _verify_diff(state, summary, input_data)
 
     except Exception as e:
         logger.error(f"Failed to verify summary notes: {e}")
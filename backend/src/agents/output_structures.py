@@ -12,6 +12,20 @@ class SummaryNoteOutput(BaseModel):
     summary: str = Field(description="Summary Note in markdown language")
 
 
+# ------- Verification Output Structure --------
+class SummaryCorrection(BaseModel):
+    span: str = Field(description="Exact text copied verbatim from the summary that needs fixing")
+    replacement: str = Field(description="Corrected text to put in place of the span (empty string to delete it)")
+    reason: str = Field(description="Short reason for the correction, grounded in the source material")
+
+
+class VerificationReport(BaseModel):
+    corrections: List[SummaryCorrection] = Field(
+        default_factory=list,
+        description="Only the corrections that are needed. Empty list if the summary is accurate."
+    )
+
+
 # ------- Quiz Output Structure --------
 class QuestionOptions(BaseModel):
     A: str = Field("Option A for the question")
@@ -86,3 +100,13 @@ class AudioData(BaseModel):
 class AudioTask(BaseModel):
     task: str = "audio"
     data: AudioData
+
+
+# ---- Doubt Batch Output Structure -------
+
+class DoubtAnswer(BaseModel):
+    number: int = Field(description="Number of the question being answered, as given in the list")
+    answer: str = Field(description="The answer to that question")
+
+class DoubtAnswerList(BaseModel):
+    answers: List[DoubtAnswer] = Field(description="One answer per question, in the order asked")
@@ -3,7 +3,9 @@
 # ----
 
 # Student profile type definition
-from typing import Optional, TypedDict
+import operator
+from typing import Annotated, Optional, TypedDict
+from src.agents.summary_artifact import SummaryArtifact, merge_summary
 class StudentProfile(TypedDict):
     gender: str
     grade_level: str  # e.g., "class 6", "12th", "undergrad", "postgrad"
@@ -16,14 +18,27 @@ class UserPrompt(TypedDict):
     file_url: Optional[str]
 
 
+def merge_dicts(left: dict | None, right: dict | None) -> dict:
+    """Reducer so parallel branches can each contribute keys to one dict."""
+    return {**(left or {}), **(right or {})}
+
+
 class AgentState(TypedDict):
     learning_space_id: str
     student_profile: StudentProfile
     user_prompt: UserPrompt
-    summary_notes: str
+    summary_notes: Annotated[SummaryArtifact, merge_summary]  # Normalized once; verify and enrichment updates merge
     podcast_script: str
     quiz: str
     flashcards: str
     recommendations: str
     study_plan: str
     raw_source_text: str  # Original text from PDF or YouTube Transcript
+    stored_fingerprints: dict  # Artifact fingerprints persisted by the previous run
+    fingerprints: Annotated[dict, merge_dicts]  # Fingerprints produced by this run
+    skipped_nodes: Annotated[list, operator.add]  # Nodes skipped because inputs were unchanged
+    node_timings: Annotated[dict, merge_dicts]  # node → wall-clock seconds spent in this run
+    timed_out_nodes: Annotated[list, operator.add]  # Nodes cancelled for exceeding their time budget
+    verification_stats: dict  # Verifier mode, corrections applied and token estimates
+    audio_speculation: dict  # Whether the draft-based audio script was kept after verification
+    generation_stats: dict  # Combined study-pack generation outcome (GENERATION_MODE=combined)
@@ -0,0 +1,186 @@
+# -----
+# Canonical summary artifact carried through the agent graph.
+#
+# summary_notes arrives as plain text, a JSON string, a dict from the DB or
+# a Pydantic model. It is normalized once into a SummaryArtifact, and every
+# node reads the same object: the derived views (plain text, markdown
+# sections, token count, speech text, the shared prompt context) are
+# computed on first use and memoized on the artifact.
+#
+# Refiner nodes don't overwrite each other in the same superstep: verify
+# replaces the body (bumping `revision`), enrichment adds an appendix
+# section, and merge_summary() combines both updates.
+# -----
+
+import json
+import re
+from src.utils.llm_utils import estimate_tokens
+from src.utils.prompt_builder import SharedContext
+
+_HEADING = re.compile(r"^(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*$", re.MULTILINE)
+_FENCE = re.compile(r"^```.*$", re.MULTILINE)
+_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_EMPHASIS = re.compile(r"(\*{1,3}|_{1,3}|~~|`)(?=\S)(.+?)(?<=\S)\1")
+_LIST_MARKER = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+", re.MULTILINE)
+_BLOCK_MARKUP = re.compile(r"^\s*(?:>+\s?|\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)*\|?\s*$)", re.MULTILINE)
+# Symbols and emoji a TTS engine would read out (or stumble on)
+_UNSPOKEN = re.compile(r"[#*_`~|<>\[\]{}\\^=+]|[\u2600-\u27bf\U0001f000-\U0001faff\ufe0f\u200d]")
+
+
+class SummaryArtifact:
+    """Immutable summary notes with memoized derived views."""
+
+    __slots__ = ("text", "title", "appendix", "revision", "_views")
+
+    def __init__(self, text: str = "", title: str | None = None, appendix: tuple = (), revision: int = 0):
+        self.text = text or ""
+        self.title = title or None
+        self.appendix = tuple(appendix)
+        self.revision = revision
+        self._views = {}
+
+    @classmethod
+    def from_any(cls, data) -> "SummaryArtifact":
+        """Normalize a str / JSON str / dict / Pydantic summary (or an artifact, returned as is)."""
+        if isinstance(data, SummaryArtifact):
+            return data
+        if not data:
+            return EMPTY_SUMMARY
+        if isinstance(data, str):
+            # Only text that looks like a JSON object is worth a parse attempt
+            if data.lstrip().startswith("{"):
+                try:
+                    parsed = json.loads(data)
+                except (json.JSONDecodeError, TypeError):
+                    parsed = None
+                if isinstance(parsed, dict):
+                    return cls(str(parsed.get("summary", data)), parsed.get("title"))
+            return cls(data)
+        if isinstance(data, dict):
+            return cls(str(data.get("summary", "")), data.get("title"))
+        if hasattr(data, "summary"):
+            return cls(data.summary, getattr(data, "title", None))
+        return cls(str(data))
+
+    def __bool__(self) -> bool:
+        return bool(self.text or self.appendix)
+
+    def __str__(self) -> str:
+        return self.markdown
+
+    def __repr__(self) -> str:
+        return f"SummaryArtifact(rev={self.revision}, chars={len(self.markdown)}, appendix={len(self.appendix)})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SummaryArtifact):
+            return NotImplemented
+        return (self.text, self.title, self.appendix, self.revision) == (
+            other.text, other.title, other.appendix, other.revision)
+
+    __hash__ = None
+
+    # ── Derivations ────────────────────────────────────────────────────
+
+    def with_text(self, text: str, title: str | None = None) -> "SummaryArtifact":
+        """A revised body (e.g. verifier corrections); appendix sections are kept."""
+        return SummaryArtifact(text, title or self.title, self.appendix, self.revision + 1)
+
+    def with_appendix(self, section: str) -> "SummaryArtifact":
+        """The same body with one more section appended (e.g. visual descriptions)."""
+        return SummaryArtifact(self.text, self.title, self.appendix + (section,), self.revision)
+
+    def to_storage(self):
+        """Value written to learning_space.summary_notes."""
+        if self.title:
+            return {"title": self.title, "summary": self.markdown}
+        return self.markdown
+
+    # ── Memoized views ─────────────────────────────────────────────────
+
+    def _view(self, name: str, build):
+        try:
+            return self._views[name]
+        except KeyError:
+            value = self._views[name] = build()
+            return value
+
+    @property
+    def markdown(self) -> str:
+        """Body and appendix sections, as stored and as sent to the LLMs."""
+        if not self.appendix:
+            return self.text
+        return self._view("markdown", lambda: "\n\n".join((self.text, *self.appendix)))
+
+    @property
+    def sections(self) -> tuple:
+        """(heading, body) pairs split on markdown headings; text before the first heading has heading ''."""
+        return self._view("sections", self._split_sections)
+
+    @property
+    def plain_text(self) -> str:
+        """Markdown with the markup removed."""
+        return self._view("plain_text", lambda: _strip_markdown(self.markdown))
+
+    @property
+    def speech_text(self) -> str:
+        """Plain text without symbols or emoji, whitespace collapsed - ready for TTS."""
+        return self._view("speech_text", lambda: " ".join(_UNSPOKEN.sub(" ", self.plain_text).split()))
+
+    @property
+    def token_count(self) -> int:
+        return self._view("token_count", lambda: estimate_tokens(self.markdown))
+
+    @property
+    def shared_context(self) -> SharedContext:
+        """Shared prompt prefix, built (and hashed) once for every node that sends the summary."""
+        return self._view("shared_context", lambda: SharedContext(self.markdown))
+
+    def _split_sections(self) -> tuple:
+        text = self.markdown
+        sections, heading, start = [], "", 0
+        for match in _HEADING.finditer(text):
+            body = text[start:match.start()].strip()
+            if heading or body:
+                sections.append((heading, body))
+            heading, start = match.group(2), match.end()
+        body = text[start:].strip()
+        if heading or body:
+            sections.append((heading, body))
+        return tuple(sections)
+
+
+def _strip_markdown(text: str) -> str:
+    text = _FENCE.sub("", text)
+    text = _HEADING.sub(r"\2", text)
+    text = _LINK.sub(r"\1", text)
+    text = _BLOCK_MARKUP.sub("", text)
+    text = _LIST_MARKER.sub("", text)
+    text = _EMPHASIS.sub(r"\2", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+EMPTY_SUMMARY = SummaryArtifact()
+
+
+def summary_of(state: dict) -> SummaryArtifact:
+    """The run's summary artifact (normalizing whatever the caller put in the state)."""
+    return SummaryArtifact.from_any(state.get("summary_notes"))
+
+
+def merge_summary(left, right) -> SummaryArtifact:
+    """
+    Reducer for summary_notes. The body with the higher revision wins (ties go
+    to the newer update) and appendix sections from both sides are kept, so a
+    verifier correction and an enrichment appendix landing in the same
+    superstep are both applied.
+    """
+    if right is None:
+        return SummaryArtifact.from_any(left)
+    left, right = SummaryArtifact.from_any(left), SummaryArtifact.from_any(right)
+    if not left or left is right:
+        return right
+    body = right if right.revision >= left.revision else left
+    appendix = left.appendix + tuple(s for s in right.appendix if s not in left.appendix)
+    if body.appendix == appendix:
+        return body
+    return SummaryArtifact(body.text, body.title or left.title or right.title, appendix, body.revision)
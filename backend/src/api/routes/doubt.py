@@ -1,10 +1,28 @@
+import base64
+import contextvars
+import hashlib
+import json
 import logging
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
-from langchain_core.prompts import ChatPromptTemplate
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from src.agents.output_structures import DoubtAnswerList
+from src.agents.summary_artifact import SummaryArtifact
+from src.configs.config import (
+    DOUBT_BATCH_CONCURRENCY, DOUBT_BATCH_MAX_QUESTIONS, DOUBT_BATCH_MODE, prompt_budget,
+)
+from src.services.conversation_state import conversation_store
+from src.services.doubt_cache import doubt_cache
 from src.services.supabase_service import supabase_service
+from src.utils.deadline import DeadlineExceeded
 from src.utils.model_router import call_with_fallback
+from src.utils.prompt_builder import PromptAssembly, SharedContext
+from src.utils.token_budget import PromptSection, count_tokens, fit_sections, truncate_to_tokens
+from src.utils.tracing import set_span_attributes
 
 # Doubt Solver route
 # Primary model: Groq Llama 3  |  Fallback: Gemini Flash
@@ -26,78 +44,36 @@ class DoubtResponse(BaseModel):
     success: bool
 
 
-@router.post("/ask", response_model=DoubtResponse)
-async def ask_doubt(request: DoubtRequest):
-    """
-    AI Doubt Solver: Answers a student's follow-up question
-    grounded in their learning space's summary notes.
-    Primary: Groq Llama 3 | Fallback: Gemini Flash
-    """
-    try:
-        # 1. Fetch learning space data
-        learning_space = supabase_service.get_learning_space(request.learning_space_id)
-        if not learning_space:
-            raise HTTPException(status_code=404, detail="Learning space not found.")
-
-        # 2. Fetch student profile
-        student_profile = supabase_service.get_student_profile(request.user_id)
-
-        # 3. Extract summary notes as context
-        raw_summary = learning_space.get("summary_notes", "")
-        if isinstance(raw_summary, dict):
-            context = raw_summary.get("summary", str(raw_summary))
-        else:
-            context = str(raw_summary) if raw_summary else ""
+class DoubtBatchRequest(BaseModel):
+    learning_space_id: str
+    user_id: str
+    questions: List[str] = Field(min_length=1, max_length=DOUBT_BATCH_MAX_QUESTIONS)
+    language: Optional[str] = None
 
-        topic = learning_space.get("topic", "the current topic")
 
-        # 4. Determine language
-        target_lang = (
-            request.language
-            or (learning_space.get("language") or "").strip()
-            or (student_profile or {}).get("language", "English")
-        )
-        grade_level = (student_profile or {}).get("grade_level", "general")
-
-        # 5. Fetch recent chat history for context (last 5 messages)
-        history_context = ""
-        try:
-            history_response = (
-                supabase_service.client
-                .table("doubt_messages")
-                .select("role, content")
-                .eq("learning_space_id", request.learning_space_id)
-                .eq("user_id", request.user_id)
-                .order("created_at", desc=True)
-                .limit(5)
-                .execute()
-            )
-            if history_response.data:
-                # Reverse to get chronological order
-                history_msgs = history_response.data[::-1]
-                history_context = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in history_msgs])
-        except Exception as h_err:
-            logger.warning(f"Could not fetch history for context: {h_err}")
-
-        # 6. Build the prompt
-        prompt_template = ChatPromptTemplate([
-            ("system", """You are a warm, patient, and encouraging academic tutor helping a rural Indian student.
+class DoubtBatchItem(BaseModel):
+    question: str
+    answer: str
+    success: bool
+    source: str          # "cache", "combined", "single" or "error"
+    latency_ms: float
+
+
+class DoubtBatchResponse(BaseModel):
+    answers: List[DoubtBatchItem]
+    success: bool
+    llm_calls: int
+    latency_ms: float
+
+
+_RULES = """You are a warm, patient, and encouraging academic tutor helping a rural Indian student.
 
 Student Profile:
 - Grade Level: {grade_level}
 - Language: {language}
 
 You are helping the student with the topic: "{topic}"
-
-Here are the study notes the student has been learning from:
----
-{context}
----
-
-Recent Conversation History (for context):
----
-{history}
----
+The study notes above are what the student has been learning from.
 
 Rules:
 1. Answer the student's doubt clearly and simply, appropriate for {grade_level}.
@@ -107,77 +83,401 @@ Rules:
 5. Keep your answer concise (under 300 words) but thorough.
 6. Be encouraging — use phrases like "Great question!" in {language}.
 7. Use the Conversation History to understand follow-up questions (e.g., "What does that mean?").
-"""),
-            ("user", "{question}")
-        ])
+"""
 
-        logger.info(
-            f"Doubt Solver: answering in {target_lang} for space {request.learning_space_id} "
-            f"[history found: {bool(history_context)}]"
-        )
+_BATCH_RULES = _RULES + """8. You are given several numbered questions. Answer EACH one on its own, as if it
+   had been asked alone, and return every answer with the number of its question.
+"""
+
+
+@dataclass
+class _DoubtContext:
+    """Everything a doubt prompt needs besides the question, loaded once per request."""
+    learning_space_id: str
+    user_id: str
+    topic: str
+    language: str
+    grade_level: str
+    notes: SharedContext
+    history: str
+
+    @property
+    def cache_scope(self) -> tuple:
+        return (self.notes.key, self.topic, self.language.lower(), str(self.grade_level).lower())
+
+    def input_data(self, **extra) -> dict:
+        return {"grade_level": self.grade_level, "language": self.language, "topic": self.topic, **extra}
+
+
+def _load_context(learning_space_id: str, user_id: str, language: Optional[str]) -> _DoubtContext:
+    # Learning space, student profile and the summary notes as context
+    learning_space = supabase_service.get_learning_space(learning_space_id)
+    if not learning_space:
+        raise HTTPException(status_code=404, detail="Learning space not found.")
+    student_profile = supabase_service.get_student_profile(user_id)
+    notes = SummaryArtifact.from_any(learning_space.get("summary_notes")).markdown
+
+    target_lang = (
+        language
+        or (learning_space.get("language") or "").strip()
+        or (student_profile or {}).get("language", "English")
+    )
+
+    # The notes are capped on their own, so the shared prefix is identical
+    # across questions (and across single and batch requests)
+    budget = prompt_budget("doubt")
+    notes = fit_sections("doubt", [
+        PromptSection("notes", notes, max_tokens=budget * 2 // 3, marker="\n\n[... notes truncated ...]"),
+    ], task="chat", budget=budget)["notes"]
+
+    return _DoubtContext(
+        learning_space_id=learning_space_id,
+        user_id=user_id,
+        topic=learning_space.get("topic", "the current topic"),
+        language=target_lang,
+        grade_level=(student_profile or {}).get("grade_level", "general"),
+        notes=SharedContext(notes),
+        # Recent messages plus a rolling summary of older turns, kept in
+        # memory per conversation (read from the database only on first use)
+        history=conversation_store.history(learning_space_id, user_id),
+    )
+
+
+def _answer_one(ctx: _DoubtContext, question: str):
+    """A callable answering one question with its own LLM call (also used for cache audits)."""
+    # Question first, then as much recent history as the rest of the budget allows
+    budget = prompt_budget("doubt")
+    fitted = fit_sections("doubt", [
+        PromptSection("question", question, priority=0, max_tokens=budget // 6),
+        PromptSection("history", ctx.history, priority=1, keep="tail"),
+    ], task="chat", budget=budget - count_tokens(ctx.notes.text, "chat"))
 
-        # 7. Call LLM with Gemini fallback
+    # The notes form a stable shared prefix (reused across questions and
+    # cacheable provider-side); per-question parts come last.
+    prompt = PromptAssembly(
+        _RULES,
+        """Conversation History (for context):
+---
+{history}
+---
+
+{question}""",
+        shared_context=ctx.notes,
+    )
+
+    def answer() -> str:
         response = call_with_fallback(
             task="chat",
-            chain_fn=lambda llm: prompt_template | llm,
-            input_data={
-                "grade_level": grade_level,
-                "language": target_lang,
-                "topic": topic,
-                "context": context[:8000],
-                "history": history_context or "No previous history.",
-                "question": request.question,
-            },
+            chain_fn=prompt,
+            input_data=ctx.input_data(
+                history=fitted["history"] or "No previous history.",
+                question=fitted["question"],
+            ),
             structured_schema=None,
             temperature=0.3,
         )
+        return response.content if hasattr(response, 'content') else str(response)
+
+    return answer
+
+
+def _save_exchanges(ctx: _DoubtContext, exchanges: list[tuple[str, str]]):
+    """All question/answer pairs in one insert, then into the in-memory conversation."""
+    # A column default would give every row of the insert the same timestamp and leave
+    # their order to the id; one microsecond apart keeps question before answer
+    started = datetime.now(timezone.utc)
+    rows = []
+    for question, answer_text in exchanges:
+        for role, content in (("user", question), ("assistant", answer_text)):
+            created_at = started + timedelta(microseconds=len(rows))
+            rows.append({"learning_space_id": ctx.learning_space_id, "user_id": ctx.user_id,
+                         "role": role, "content": content,
+                         "created_at": created_at.isoformat(timespec="microseconds")})
+    if not rows:
+        return
+    try:
+        supabase_service.client.table("doubt_messages").insert(rows).execute()
+        logger.info(f"Saved {len(exchanges)} doubt exchange(s) to database")
+    except Exception as db_err:
+        logger.warning(f"Failed to save doubt messages: {db_err}")
+    for question, answer_text in exchanges:
+        conversation_store.record_exchange(ctx.learning_space_id, ctx.user_id, question, answer_text)
+
+
+@router.post("/ask", response_model=DoubtResponse)
+def ask_doubt(request: DoubtRequest):
+    """
+    AI Doubt Solver: Answers a student's follow-up question
+    grounded in their learning space's summary notes.
+    Primary: Groq Llama 3 | Fallback: Gemini Flash
+    Sync on purpose: FastAPI runs it in the threadpool, so blocking DB and
+    LLM calls don't stall the event loop (or its disconnect detection).
+    """
+    set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id)
+    try:
+        # 1. Space, profile, notes, language and conversation history
+        ctx = _load_context(request.learning_space_id, request.user_id, request.language)
+        answer = _answer_one(ctx, request.question)
+
+        logger.info(
+            f"Doubt Solver: answering in {ctx.language} for space {request.learning_space_id} "
+            f"[history found: {bool(ctx.history)}]"
+        )
 
-        answer_text = response.content if hasattr(response, 'content') else str(response)
-
-        # 7. Save conversation to Supabase
-        try:
-            supabase_service.client.table("doubt_messages").insert([
-                {
-                    "learning_space_id": request.learning_space_id,
-                    "user_id": request.user_id,
-                    "role": "user",
-                    "content": request.question,
-                },
-                {
-                    "learning_space_id": request.learning_space_id,
-                    "user_id": request.user_id,
-                    "role": "assistant",
-                    "content": answer_text,
-                }
-            ]).execute()
-            logger.info("Saved doubt conversation to database")
-        except Exception as db_err:
-            logger.warning(f"Failed to save doubt messages: {db_err}")
+        # 2. Reuse a cached answer to the same question on the same notes, or call the LLM
+        hit = doubt_cache.lookup(ctx.cache_scope, request.question)
+        if hit is not None:
+            logger.info(f"💾 Doubt cache hit (similarity {hit.similarity}) for space {request.learning_space_id}")
+            set_span_attributes(doubt_cache="hit")
+            answer_text = hit.answer
+            if doubt_cache.should_audit():
+                doubt_cache.audit_in_background(hit, request.question, answer)
+        else:
+            answer_text = answer()
+            doubt_cache.store(ctx.cache_scope, request.question, answer_text)
+
+        # 3. Save conversation to Supabase
+        _save_exchanges(ctx, [(request.question, answer_text)])
 
         return DoubtResponse(answer=answer_text, success=True)
 
-    except HTTPException:
+    except (HTTPException, DeadlineExceeded):
         raise
     except Exception as e:
         logger.error(f"Error in doubt solver: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to answer doubt: {str(e)}")
 
 
-@router.get("/history/{learning_space_id}/{user_id}")
-async def get_doubt_history(learning_space_id: str, user_id: str):
-    """Fetch chat history for a learning space."""
+def _answer_combined(ctx: _DoubtContext, questions: list[str]) -> dict[int, str]:
+    """One structured call for several questions; {position in `questions`: answer} for those it answered."""
+    budget = prompt_budget("doubt_batch")
+    numbered = "\n".join(f"{n}. {q}" for n, q in enumerate(questions, start=1))
+    fitted = fit_sections("doubt_batch", [
+        PromptSection("history", ctx.history, keep="tail"),
+    ], task="chat", budget=budget - count_tokens(ctx.notes.text, "chat") - count_tokens(numbered, "chat"))
+
+    prompt = PromptAssembly(
+        _BATCH_RULES,
+        """Conversation History (for context):
+---
+{history}
+---
+
+Questions:
+{questions}""",
+        shared_context=ctx.notes,
+    )
+    try:
+        response = call_with_fallback(
+            task="chat",
+            chain_fn=prompt,
+            input_data=ctx.input_data(history=fitted["history"] or "No previous history.", questions=numbered),
+            structured_schema=DoubtAnswerList,
+            temperature=0.3,
+        )
+        answers = DoubtAnswerList.model_validate(
+            response.model_dump() if hasattr(response, "model_dump") else response
+        ).answers
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.warning(f"Combined doubt call failed, answering one by one: {e}")
+        return {}
+    return {
+        item.number - 1: item.answer.strip()
+        for item in answers
+        if 1 <= item.number <= len(questions) and item.answer and item.answer.strip()
+    }
+
+
+@router.post("/batch", response_model=DoubtBatchResponse)
+def ask_doubt_batch(request: DoubtBatchRequest):
+    """
+    Answer a list of questions about one learning space (a teacher's list, or
+    questions a student queued offline). Context and history are loaded once;
+    cached answers are reused; the rest are answered by one structured call
+    (DOUBT_BATCH_MODE=combined) with per-question calls, at most
+    DOUBT_BATCH_CONCURRENCY at a time, for whatever it leaves out. All
+    messages are saved in one insert. Each answer reports its own latency.
+    """
+    set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id,
+                        doubt_batch_size=len(request.questions))
+    started = time.perf_counter()
     try:
-        response = (
-            supabase_service.client
-            .table("doubt_messages")
-            .select("*")
-            .eq("learning_space_id", learning_space_id)
-            .eq("user_id", user_id)
-            .order("created_at", desc=False)
-            .limit(50)
-            .execute()
+        # 1. Context and history, once for the whole batch
+        ctx = _load_context(request.learning_space_id, request.user_id, request.language)
+        questions = [q.strip() for q in request.questions]
+        items: list[Optional[DoubtBatchItem]] = [None] * len(questions)
+        llm_calls = 0
+
+        # 2. Cached answers
+        pending = []
+        for i, question in enumerate(questions):
+            t0 = time.perf_counter()
+            if not question:
+                items[i] = DoubtBatchItem(question=question, answer="", success=False, source="error", latency_ms=0.0)
+                continue
+            hit = doubt_cache.lookup(ctx.cache_scope, question)
+            if hit is None:
+                pending.append(i)
+                continue
+            items[i] = DoubtBatchItem(question=question, answer=hit.answer, success=True, source="cache",
+                                      latency_ms=round((time.perf_counter() - t0) * 1000, 1))
+            if doubt_cache.should_audit():
+                doubt_cache.audit_in_background(hit, question, _answer_one(ctx, question))
+
+        # 3. One structured call for as many questions as fit its budget
+        if DOUBT_BATCH_MODE == "combined" and len(pending) > 1:
+            question_budget = prompt_budget("doubt_batch") // 3
+            group, used = [], 0
+            for i in pending:
+                clipped = truncate_to_tokens(questions[i], prompt_budget("doubt") // 6, task="chat")
+                tokens = count_tokens(clipped, "chat") + 4
+                if group and used + tokens > question_budget:
+                    break
+                group.append((i, clipped))
+                used += tokens
+            if len(group) > 1:
+                t0 = time.perf_counter()
+                answered = _answer_combined(ctx, [q for _, q in group])
+                llm_calls += 1
+                elapsed = round((time.perf_counter() - t0) * 1000, 1)
+                for position, (i, _) in enumerate(group):
+                    if position in answered:
+                        items[i] = DoubtBatchItem(question=questions[i], answer=answered[position], success=True,
+                                                  source="combined", latency_ms=elapsed)
+                pending = [i for i in pending if items[i] is None]
+                logger.info(f"📚 Doubt batch: combined call answered {len(answered)}/{len(group)} question(s)")
+
+        # 4. Per-question calls for the rest, a bounded number at a time
+        def answer_single(i: int) -> DoubtBatchItem:
+            t0 = time.perf_counter()
+            try:
+                answer_text = _answer_one(ctx, questions[i])()
+                return DoubtBatchItem(question=questions[i], answer=answer_text, success=True, source="single",
+                                      latency_ms=round((time.perf_counter() - t0) * 1000, 1))
+            except Exception as e:
+                # Keep what the rest of the batch produced, even past the deadline
+                logger.warning(f"Doubt batch: question {i + 1} failed: {e}")
+                return DoubtBatchItem(question=questions[i], answer="", success=False, source="error",
+                                      latency_ms=round((time.perf_counter() - t0) * 1000, 1))
+
+        if pending:
+            # Each worker runs in a copy of this context, so the request deadline applies
+            context = contextvars.copy_context()
+            with ThreadPoolExecutor(max_workers=max(1, min(DOUBT_BATCH_CONCURRENCY, len(pending))),
+                                    thread_name_prefix="doubt-batch") as pool:
+                for i, item in zip(pending, pool.map(lambda i: context.copy().run(answer_single, i), pending)):
+                    items[i] = item
+            llm_calls += len(pending)
+
+        # 5. Cache new answers, then save every exchange in one insert
+        for item in items:
+            if item.source in ("combined", "single"):
+                doubt_cache.store(ctx.cache_scope, item.question, item.answer)
+        _save_exchanges(ctx, [(item.question, item.answer) for item in items if item.success])
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"📚 Doubt batch for space {request.learning_space_id}: {len(items)} question(s), "
+            f"{llm_calls} LLM call(s), {latency_ms} ms"
         )
-        return {"messages": response.data or [], "success": True}
+        return DoubtBatchResponse(answers=items, success=all(item.success for item in items),
+                                  llm_calls=llm_calls, latency_ms=latency_ms)
+
+    except (HTTPException, DeadlineExceeded):
+        raise
     except Exception as e:
-        logger.error(f"Error fetching doubt history: {str(e)}")
+        logger.error(f"Error in doubt batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to answer doubts: {str(e)}")
+
+
+@router.get("/cache/stats")
+async def doubt_cache_stats():
+    """Hit rate, size and false-hit audit results of the doubt answer cache."""
+    return doubt_cache.stats()
+
+
+# Columns a client may ask for; id and created_at always come back (they make the cursor)
+_HISTORY_COLUMNS = ("id", "created_at", "role", "content", "learning_space_id", "user_id")
+_DEFAULT_HISTORY_FIELDS = "role,content"
+
+
+def _encode_cursor(message: dict) -> str:
+    raw = f"{message['created_at']}|{message['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, message_id = raw.split("|", 1)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor.")
+    if not created_at or not message_id or '"' in raw:
+        raise HTTPException(status_code=400, detail="Invalid history cursor.")
+    return created_at, message_id
+
+
+def _history_columns(fields: str) -> str:
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in _HISTORY_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown history fields: {', '.join(unknown)}")
+    return ", ".join(c for c in _HISTORY_COLUMNS if c in ("id", "created_at") or c in requested)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+@router.get("/history/{learning_space_id}/{user_id}")
+def get_doubt_history(
+    learning_space_id: str,
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = Query(None, description="Cursor: page of messages older than this one"),
+    since: Optional[str] = Query(None, description="Cursor: only messages newer than this one"),
+    fields: str = Query(_DEFAULT_HISTORY_FIELDS, description="Comma-separated columns to return"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Fetch chat history for a learning space, oldest first.
+
+    Without a cursor this is the latest page; `before` pages back through older
+    messages and `since` returns only what was added after a known message (a
+    delta sync on reopen). `before_cursor` / `since_cursor` in the response feed
+    the next request, and `has_more` says whether the page was cut at `limit`.
+    Responses carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    if before and since:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'since', not both.")
+    columns = _history_columns(fields)
+    after_key = _decode_cursor(since) if since else None
+    before_key = _decode_cursor(before) if before else None
+
+    # One extra row tells whether another page exists
+    rows = supabase_service.get_doubt_messages(
+        learning_space_id, user_id, columns, limit + 1, before=before_key, after=after_key)
+    if rows is None:
         return {"messages": [], "success": False}
+    has_more = len(rows) > limit
+    if has_more:
+        rows = rows[:limit] if since else rows[1:]
+
+    body = {
+        "messages": rows,
+        "success": True,
+        "has_more": has_more,
+        "before_cursor": _encode_cursor(rows[0]) if rows else before,
+        "since_cursor": _encode_cursor(rows[-1]) if rows else since,
+    }
+    payload = json.dumps(body, separators=(",", ":"), ensure_ascii=False, default=str)
+    etag = 'W/"' + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
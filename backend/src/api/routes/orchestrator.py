@@ -23,6 +23,9 @@ from typing import Optional, Any
 from langchain_core.prompts import ChatPromptTemplate
 
 from src.services.supabase_service import supabase_service
+from src.utils.deadline import DeadlineExceeded
+from src.utils.intent_classifier import IntentResult, intent_classifier
+from src.utils.metrics import metrics
 from src.utils.model_router import call_with_fallback, TASK_MODEL_MAP
 from src.agents.output_structures import (
     SummaryNoteOutput, QuizOutput, FlashcardList, RecommendationList
@@ -34,6 +37,11 @@ VERSION_ID = "v2"
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+TASK_DETECTIONS = metrics.counter(
+    "orchestrator_task_detections", "Detected orchestrator tasks by deciding stage (hint, rules, model, default).",
+    ["task", "source"],
+)
+
 
 # ── Request / Response schemas ─────────────────────────────────────────
 
@@ -47,29 +55,16 @@ class OrchestratorResponse(BaseModel):
     task: str
     model: str
     output: Any
+    confidence: Optional[float] = None     # of the task detection (1.0 when task_type was given)
 
 
 # ── Task Detection ─────────────────────────────────────────────────────
 
-def detect_task(content: str, hint: Optional[str]) -> str:
-    """Classify content into a task type."""
+def detect_task(content: str, hint: Optional[str]) -> IntentResult:
+    """Classify content into a task type (see src/utils/intent_classifier.py)."""
     if hint and hint.lower() in TASK_MODEL_MAP:
-        return hint.lower()
-
-    lower = content.lower()
-    if any(k in lower for k in ["quiz", "mcq", "test me", "question"]):
-        return "quiz"
-    if any(k in lower for k in ["flashcard", "flash card", "term", "definition"]):
-        return "flashcard"
-    if any(k in lower for k in ["summarize", "summarise", "summary", "notes"]):
-        return "summary"
-    if any(k in lower for k in ["recommend", "resource", "book", "lecture", "article"]):
-        return "recommendation"
-    if any(k in lower for k in ["audio", "podcast", "listen", "speak"]):
-        return "audio"
-    if any(k in lower for k in ["document", "pdf", "analyze", "analyse", "extract"]):
-        return "document_analysis"
-    return "chat"
+        return IntentResult(hint.lower(), 1.0, "hint")
+    return intent_classifier.classify(content)
 
 
 # ── Individual task generators ─────────────────────────────────────────
@@ -168,14 +163,17 @@ Keep it conversational and engaging."""),
 # ── Main Route ─────────────────────────────────────────────────────────
 
 @router.post("/route", response_model=OrchestratorResponse)
-async def orchestrate(request: OrchestratorRequest):
+def orchestrate(request: OrchestratorRequest):
     """
     AI Orchestrator endpoint.
     Detects task type, routes to the appropriate model, and returns
-    a strict JSON envelope: { task, model, output }.
+    a strict JSON envelope: { task, model, output, confidence }.
+    Sync so FastAPI runs the blocking DB and LLM calls in its threadpool.
     """
     # 1. Detect task
-    task = detect_task(request.content, request.task_type)
+    intent = detect_task(request.content, request.task_type)
+    task = intent.task
+    TASK_DETECTIONS.labels(task, intent.source).inc()
 
     # 2. Build student profile (defaults if not provided)
     raw_profile = request.student_profile or {}
@@ -222,7 +220,9 @@ async def orchestrate(request: OrchestratorRequest):
     }
     display_model = MODEL_DISPLAY.get(model_name, "Gemini Flash")
 
-    logger.info(f"[Orchestrator] task='{task}' → model='{display_model}'")
+    logger.info(
+        f"[Orchestrator] task='{task}' ({intent.source}, confidence {intent.confidence:.2f}) → model='{display_model}'"
+    )
 
     # 4. Resilience: Content Caching
     # Skip caching for 'chat' as it's stateful and usually low-cost
@@ -245,7 +245,8 @@ async def orchestrate(request: OrchestratorRequest):
                 return OrchestratorResponse(
                     task=task, 
                     model=f"{display_model} (Cached)", 
-                    output=cached_result.data["output"]
+                    output=cached_result.data["output"],
+                    confidence=intent.confidence,
                 )
         except Exception:
             # Table might not exist or other DB error, proceed to generation
@@ -298,8 +299,10 @@ async def orchestrate(request: OrchestratorRequest):
             except Exception:
                 pass
 
-        return OrchestratorResponse(task=task, model=display_model, output=output)
+        return OrchestratorResponse(task=task, model=display_model, output=output, confidence=intent.confidence)
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"[Orchestrator] Fatal error for task '{task}': {e}")
         raise HTTPException(
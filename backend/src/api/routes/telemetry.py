@@ -0,0 +1,59 @@
+import time
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from src.utils.tracing import ATTRIBUTION_KEYS, latency_report, span_exporter, usage_report
+
+# Telemetry routes: latency percentiles, token usage and cost from the
+# in-process span buffer (see src/utils/tracing.py)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_LATENCY_GROUP_KEYS = {"task", "provider", "model", "fallback", "node", *ATTRIBUTION_KEYS}
+
+
+def _since(window_minutes: Optional[float]) -> Optional[float]:
+    return time.time() - window_minutes * 60 if window_minutes else None
+
+
+@router.get("/latency")
+async def latency(
+    group_by: str = "task,provider",
+    span: str = "llm.call",
+    window_minutes: Optional[float] = None,
+):
+    """p50/p95/p99 latency per group, e.g. ?group_by=task,provider or ?span=graph.node&group_by=node."""
+    keys = tuple(k.strip() for k in group_by.split(",") if k.strip())
+    unknown = set(keys) - _LATENCY_GROUP_KEYS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(sorted(unknown))}")
+    return {"span": span, "group_by": list(keys), "groups": latency_report(span, keys, since=_since(window_minutes))}
+
+
+@router.get("/usage")
+async def usage(
+    group_by: str = "learning_space_id",
+    learning_space_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    window_minutes: Optional[float] = None,
+):
+    """Token, retry, fallback and cost totals of LLM calls per learning space, user, node or request."""
+    if group_by not in _LATENCY_GROUP_KEYS:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {group_by}")
+    rows = usage_report(
+        group_by, since=_since(window_minutes), learning_space_id=learning_space_id, user_id=user_id,
+    )
+    return {"group_by": group_by, "groups": rows}
+
+
+@router.get("/traces/{trace_id}")
+async def trace(trace_id: str):
+    """All buffered spans of one trace, in start order."""
+    spans = sorted(
+        (s for s in span_exporter.spans() if s["trace_id"] == trace_id), key=lambda s: s["start"]
+    )
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have left the buffer).")
+    return {"trace_id": trace_id, "spans": spans}
@@ -1,18 +1,31 @@
 import time
+import json
+import uuid
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import threading
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from src.services.agent_workflow import invoke_agent_workflow
-from src.services.supabase_service import supabase_service
+from src.services.agent_workflow import invoke_agent_workflow, WORKFLOW_SPACE_COLUMNS
+from src.services.supabase_service import IN_QUERY_CHUNK, supabase_service, LearningSpaceLoader
+from src.services.event_bus import event_bus, workflow_channel
+from src.services.run_lease import RunLease
+from src.services.shared_state import SharedState, shared_state
 from src.services.text_to_speech import generate_tts
+from src.agents.summary_artifact import SummaryArtifact
 from src.agents.nodes.node_quiz import run_node_quiz
 from src.agents.nodes.node_flashcards import run_node_flashcards
 from src.agents.nodes.node_recommendation import run_node_recommendation
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from src.agents.output_structures import PodcastContent
+from src.configs.config import STALE_GENERATING_SECONDS, prompt_budget
+from src.utils.deadline import DeadlineExceeded
 from src.utils.llm_utils import invoke_with_retry
 from src.utils.model_router import call_with_fallback
+from src.utils.metrics import metrics
+from src.utils.token_budget import truncate_to_tokens
+from src.utils.tracing import set_span_attributes
 
 logger = logging.getLogger(__name__)
 
@@ -29,44 +42,106 @@ class WorkflowRequest(BaseModel):
 
 
 # --- JOB MANAGEMENT ---
+class BulkJob:
+    """Handle of one bulk regeneration; cancelled once a newer request bumps the user's bulk generation."""
+
+    def __init__(self, manager: "JobManager", user_id: str, generation: int):
+        self._manager = manager
+        self.user_id = user_id
+        self.generation = generation
+
+    @property
+    def cancelled(self) -> bool:
+        return self._manager.current_generation(self.user_id) != self.generation
+
+    def finish(self):
+        self._manager.forget_user_job(self)
+
+
 class JobManager:
-    """Manages background jobs to allow cancellation and prioritize/limit concurrency."""
+    """
+    Manages background jobs to allow cancellation and prioritize/limit concurrency.
+    Slots and cancellations live in shared_state, so the per-user limit and
+    "newer request cancels bulk jobs" hold across all workers.
+    """
     MAX_CONCURRENT_JOBS_PER_USER = 2
-
-    def __init__(self):
-        self.active_user_jobs = {} # {user_id: [cancel_flag_list]}
-        self.active_invokes = {}   # {user_id: count}
-
-    def register_user_job(self, user_id: str):
-        """Registers a cancelable flag for a user (bulk jobs). returns the flag."""
-        cancel_flag = {"cancelled": False}
-        if user_id not in self.active_user_jobs:
-            self.active_user_jobs[user_id] = []
-        self.active_user_jobs[user_id].append(cancel_flag)
-        return cancel_flag
-
-    def cancel_all_user_jobs(self, user_id: str):
-        """Cancels all currently running background jobs for a user."""
-        if user_id in self.active_user_jobs:
-            logger.info(f"🛑 Cancelling {len(self.active_user_jobs[user_id])} bulk jobs for user {user_id}")
-            for flag in self.active_user_jobs[user_id]:
-                flag["cancelled"] = True
-            self.active_user_jobs[user_id] = []
-
-    def can_start_invoke(self, user_id: str) -> bool:
-        """Check if user has reached the max concurrent individual jobs."""
-        count = self.active_invokes.get(user_id, 0)
-        return count < self.MAX_CONCURRENT_JOBS_PER_USER
-
-    def register_invoke(self, user_id: str):
-        self.active_invokes[user_id] = self.active_invokes.get(user_id, 0) + 1
-
-    def unregister_invoke(self, user_id: str):
-        if user_id in self.active_invokes and self.active_invokes[user_id] > 0:
-            self.active_invokes[user_id] -= 1
+    # A slot whose run never reported back (crashed worker) is freed after this long
+    SLOT_TTL_SECONDS = STALE_GENERATING_SECONDS
+
+    def __init__(self, state: SharedState | None = None):
+        self._state = state if state is not None else shared_state
+        # What this process runs, for the in-flight gauge
+        self._lock = threading.Lock()
+        self._invokes = 0
+        self._bulk_jobs: set[BulkJob] = set()
+
+    def register_user_job(self, user_id: str, generation: int) -> BulkJob:
+        """
+        Registers a cancelable bulk job for a user. `generation` is what this
+        request's cancel_all_user_jobs() returned: re-reading the counter here
+        could pick up a newer request's bump and leave this job uncancelled.
+        """
+        job = BulkJob(self, user_id, generation)
+        with self._lock:
+            self._bulk_jobs.add(job)
+        return job
+
+    def forget_user_job(self, job: BulkJob):
+        with self._lock:
+            self._bulk_jobs.discard(job)
+
+    def cancel_all_user_jobs(self, user_id: str) -> int:
+        """Cancels all currently running background jobs for a user, in any worker. Returns the new generation."""
+        # No TTL: a bulk run can outlive any expiry, and a reset counter would cancel it
+        generation = self._state.incr("bulk_jobs", user_id)
+        with self._lock:
+            local = [job for job in self._bulk_jobs if job.user_id == user_id]
+            self._bulk_jobs.difference_update(local)
+        if local:
+            logger.info(f"🛑 Cancelling {len(local)} bulk jobs for user {user_id}")
+        return generation
+
+    def current_generation(self, user_id: str) -> int:
+        """The user's bulk generation: bumped by every cancel_all_user_jobs(), in any worker."""
+        return self._state.counter("bulk_jobs", user_id)
+
+    def try_start_invoke(self, user_id: str) -> str | None:
+        """Take one of the user's concurrent-invoke slots; None when all are in use."""
+        slot_id = uuid.uuid4().hex
+
+        def claim(record: dict) -> bool:
+            now = time.time()
+            slots = {s: expiry for s, expiry in record.get("slots", {}).items() if expiry > now}
+            if len(slots) >= self.MAX_CONCURRENT_JOBS_PER_USER:
+                record["slots"] = slots
+                return False
+            slots[slot_id] = now + self.SLOT_TTL_SECONDS
+            record["slots"] = slots
+            return True
+
+        if not self._state.update("job_slots", user_id, claim, ttl=self.SLOT_TTL_SECONDS):
+            return None
+        with self._lock:
+            self._invokes += 1
+        return slot_id
+
+    def finish_invoke(self, user_id: str, slot_id: str):
+        self._state.update("job_slots", user_id, lambda record: record.get("slots", {}).pop(slot_id, None),
+                           ttl=self.SLOT_TTL_SECONDS)
+        with self._lock:
+            self._invokes = max(0, self._invokes - 1)
+
+    def in_flight(self) -> dict:
+        with self._lock:
+            return {("invoke",): self._invokes, ("bulk",): len(self._bulk_jobs)}
 
 job_manager = JobManager()
 
+metrics.gauge(
+    "workflow_jobs_in_flight", "Workflow jobs run by this worker: single invokes and cancellable bulk jobs.", ["kind"],
+    callback=job_manager.in_flight,
+)
+
 
 @router.get("/status/{workflow_id}")
 async def workflow_status(workflow_id: str):
@@ -76,32 +151,99 @@ async def workflow_status(workflow_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def _invoke_with_tracking(learning_space_id: str, user_id: str, language: str | None):
+# Seconds between SSE keep-alive comments so proxies don't drop idle streams
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@router.get("/events/{learning_space_id}")
+async def workflow_events(learning_space_id: str, request: Request):
+    """
+    Server-Sent Events stream of workflow progress for a learning space.
+    Emits `node_completed` as each graph node lands (with its output), and
+    closes after `run_completed` / `run_failed`.
+    """
+    channel = workflow_channel(learning_space_id)
+    queue = event_bus.subscribe(channel)
+
+    async def event_stream():
+        try:
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if event["type"] in ("run_completed", "run_failed"):
+                    break
+        finally:
+            event_bus.unsubscribe(channel, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _invoke_with_tracking(learning_space_id: str, user_id: str, language: str | None, lease: RunLease,
+                          slot_id: str):
     try:
-        invoke_agent_workflow(learning_space_id, user_id, language)
+        invoke_agent_workflow(learning_space_id, user_id, language, lease=lease)
     finally:
-        job_manager.unregister_invoke(user_id)
+        job_manager.finish_invoke(user_id, slot_id)
 
 @router.post("/invoke")
-async def workflow_invoke(request: WorkflowRequest, background_tasks: BackgroundTasks):
+def workflow_invoke(request: WorkflowRequest, background_tasks: BackgroundTasks):
     try:
         # 1. Cancel any background bulk regenerations for this user to prioritize this space
         job_manager.cancel_all_user_jobs(request.user_id)
         
         # 2. Check concurrency limit
-        if not job_manager.can_start_invoke(request.user_id):
+        slot_id = job_manager.try_start_invoke(request.user_id)
+        if slot_id is None:
             raise HTTPException(
                 status_code=429, 
                 detail="You have too many AI generations running simultaneously. Please wait for them to finish."
             )
-        
-        job_manager.register_invoke(request.user_id)
 
-        # 3. Invoke the workflow
-        background_tasks.add_task(
-            _invoke_with_tracking, request.learning_space_id, request.user_id, request.language)
-        
-        return {"message": "Workflow started successfully.", "learning_space_id": request.learning_space_id}
+        # 3. Claim the space; a duplicate invoke gets the running run instead of a second one
+        lease = RunLease(request.learning_space_id)
+        acquired = lease.acquire()
+        if acquired is None:
+            # The claim itself failed: nothing is running, so don't report a run the client can't follow
+            job_manager.finish_invoke(request.user_id, slot_id)
+            raise HTTPException(status_code=503, detail="Could not start the workflow right now. Please retry.")
+        if not acquired:
+            job_manager.finish_invoke(request.user_id, slot_id)
+            holder = supabase_service.get_run_lease(request.learning_space_id)
+            if not holder:
+                raise HTTPException(status_code=404, detail="Learning space not found.")
+            return {
+                "message": "Workflow already running.",
+                "learning_space_id": request.learning_space_id,
+                "run_id": holder.get("run_id"),
+                "already_running": True,
+            }
+
+        try:
+            # 4. Invoke the workflow
+            background_tasks.add_task(
+                _invoke_with_tracking, request.learning_space_id, request.user_id, request.language, lease, slot_id)
+        except Exception:
+            job_manager.finish_invoke(request.user_id, slot_id)
+            lease.release("failed")
+            raise
+
+        return {
+            "message": "Workflow started successfully.",
+            "learning_space_id": request.learning_space_id,
+            "run_id": lease.run_id,
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -111,32 +253,49 @@ class RegenerateAllRequest(BaseModel):
     language: str | None = None
 
 
-def _regenerate_all_spaces_sequentially(user_id: str, language: str | None, cancel_flag: dict):
+def _regenerate_all_spaces_sequentially(user_id: str, language: str | None, cancel_flag: BulkJob,
+                                        space_ids: list[str] | None = None):
     """Process all learning spaces sequentially with cancellation support."""
     try:
-        spaces = supabase_service.client.table("learning_space") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .execute()
+        if space_ids is None:
+            space_ids = [s["id"] for s in supabase_service.get_user_learning_spaces(user_id)]
 
-        if not spaces.data:
+        if not space_ids:
             logger.info(f"No learning spaces found for user {user_id}")
             return
 
-        total = len(spaces.data)
+        total = len(space_ids)
         logger.info(f"🔄 Starting background regeneration of {total} spaces for user {user_id}")
 
-        for i, space in enumerate(spaces.data):
+        # The profile once for the whole batch and the spaces one in_() query per chunk.
+        # A prefetched row can go stale while the job waits; the lease acquire in each
+        # run re-checks status, so a space deleted or claimed meanwhile is still skipped
+        student_profile = supabase_service.get_student_profile(user_id)
+        loader = LearningSpaceLoader(supabase_service, WORKFLOW_SPACE_COLUMNS)
+        spaces = {}
+
+        for i, space_id in enumerate(space_ids):
             # Check if this job has been cancelled by a newer request
-            if cancel_flag.get("cancelled"):
+            if cancel_flag.cancelled:
                 logger.info(f"🛑 Bulk regeneration CANCELLED for user {user_id} at space {i+1}/{total}")
                 return
 
-            space_id = space["id"]
+            if i % IN_QUERY_CHUNK == 0:
+                chunk = space_ids[i:i + IN_QUERY_CHUNK]
+                spaces = dict(zip(chunk, loader.load_many(chunk)))
+
             logger.info(f"⚡ Regenerating space {i+1}/{total}: {space_id}")
             
             try:
-                invoke_agent_workflow(space_id, user_id, language)
+                learning_space = spaces.get(space_id)
+                if learning_space is None:
+                    logger.warning(f"Space {space_id} could not be loaded (deleted or DB error); skipping")
+                    continue
+                invoke_agent_workflow(
+                    space_id, user_id, language,
+                    learning_space=learning_space,
+                    student_profile=student_profile,
+                )
             except Exception as inner_e:
                 logger.error(f"Failed to regenerate space {space_id}: {str(inner_e)}")
 
@@ -147,7 +306,7 @@ def _regenerate_all_spaces_sequentially(user_id: str, language: str | None, canc
                 
                 # Sleep in small increments to respond to cancellation quickly
                 for _ in range(wait_time):
-                    if cancel_flag.get("cancelled"):
+                    if cancel_flag.cancelled:
                         logger.info(f"🛑 Bulk regeneration CANCELLED during wait for user {user_id}")
                         return
                     time.sleep(1)
@@ -155,31 +314,31 @@ def _regenerate_all_spaces_sequentially(user_id: str, language: str | None, canc
         logger.info(f"✅ Finished background regeneration for user {user_id}")
     except Exception as e:
         logger.error(f"Critical error in background regeneration: {str(e)}")
+    finally:
+        cancel_flag.finish()
 
 
 @router.post("/regenerate-all")
 async def regenerate_all(request: RegenerateAllRequest, background_tasks: BackgroundTasks):
     try:
         # 1. Cancel any existing jobs for this user first
-        job_manager.cancel_all_user_jobs(request.user_id)
+        generation = job_manager.cancel_all_user_jobs(request.user_id)
         
-        # 2. Register a new cancellation flag for this specific run
-        cancel_flag = job_manager.register_user_job(request.user_id)
+        # 2. Register a new cancellation flag for this specific run, at the generation it started
+        cancel_flag = job_manager.register_user_job(request.user_id, generation)
 
-        # 3. Get space count for response
-        spaces = supabase_service.client.table("learning_space") \
-            .select("id") \
-            .eq("user_id", request.user_id) \
-            .execute()
+        # 3. Get space ids once; the background task reuses them
+        space_ids = [s["id"] for s in supabase_service.get_user_learning_spaces(request.user_id)]
 
-        count = len(spaces.data) if spaces.data else 0
+        count = len(space_ids)
 
         if count == 0:
+            cancel_flag.finish()
             return {"message": "No learning spaces to regenerate.", "count": 0}
 
         # 4. Start sequential background task
         background_tasks.add_task(
-            _regenerate_all_spaces_sequentially, request.user_id, request.language, cancel_flag)
+            _regenerate_all_spaces_sequentially, request.user_id, request.language, cancel_flag, space_ids)
 
         return {
             "message": f"Started background regeneration for {count} spaces. New creations will prioritize over this task.",
@@ -192,10 +351,11 @@ async def regenerate_all(request: RegenerateAllRequest, background_tasks: Backgr
 
 
 @router.post("/audio-summary")
-async def audio_summary(request: WorkflowRequest):
+def audio_summary(request: WorkflowRequest):
     try:
         # Cancel background bulk jobs to prioritize this manual request
         job_manager.cancel_all_user_jobs(request.user_id)
+        set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id, node="audio_summary")
         
         # get the learning space
         learning_space = supabase_service.get_learning_space(
@@ -206,7 +366,7 @@ async def audio_summary(request: WorkflowRequest):
 
         # If no audio script, try to generate one from summary notes
         if not audio_script:
-            summary_notes = learning_space.get('summary_notes') if learning_space else None
+            summary_notes = SummaryArtifact.from_any(learning_space.get('summary_notes') if learning_space else None)
             if not summary_notes:
                 return {
                     "message": "No summary notes available yet. Please wait for the AI workflow to finish generating content first.",
@@ -214,8 +374,10 @@ async def audio_summary(request: WorkflowRequest):
                     "success": False
                 }
 
-            # Sanitize and limit context length for LLM stability
-            context_summary = summary_notes[:15000] # Safety limit
+            # Limit context to the prompt's token budget for LLM stability
+            context_summary = truncate_to_tokens(
+                summary_notes.markdown, prompt_budget("audio_summary"), task="audio"
+            )
             
             target_lang = request.language or (student_profile or {}).get("language", "English")
             grade_level = (student_profile or {}).get("grade_level", "general")
@@ -280,6 +442,8 @@ async def audio_summary(request: WorkflowRequest):
             'audio_url': tts['public_url']
         }
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in audio-summary: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -289,20 +453,6 @@ def _build_node_state(learning_space, student_profile, request):
     """Build a minimal AgentState for running a single node."""
     target_lang = request.language or (student_profile or {}).get('language', 'English')
     
-    # Extract summary_notes - could be JSON object or string
-    raw_summary = learning_space.get('summary_notes', '') if learning_space else ''
-    if isinstance(raw_summary, dict):
-        summary_notes = raw_summary.get('summary', str(raw_summary))
-    elif isinstance(raw_summary, str):
-        try:
-            import json
-            parsed = json.loads(raw_summary)
-            summary_notes = parsed.get('summary', raw_summary) if isinstance(parsed, dict) else raw_summary
-        except (json.JSONDecodeError, TypeError):
-            summary_notes = raw_summary
-    else:
-        summary_notes = str(raw_summary)
-
     return {
         "learning_space_id": request.learning_space_id,
         "student_profile": {
@@ -314,15 +464,16 @@ def _build_node_state(learning_space, student_profile, request):
             "topic": learning_space.get('topic', 'Untitled') if learning_space else 'Untitled',
             "file_url": learning_space.get('pdf_source', '') if learning_space else '',
         },
-        "summary_notes": summary_notes,
+        "summary_notes": SummaryArtifact.from_any(learning_space.get('summary_notes') if learning_space else None),
     }
 
 
 @router.post("/generate-quiz")
-async def generate_quiz(request: WorkflowRequest):
+def generate_quiz(request: WorkflowRequest):
     try:
         # Cancel background bulk jobs to prioritize this manual request
         job_manager.cancel_all_user_jobs(request.user_id)
+        set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id, node="quiz")
         
         learning_space = supabase_service.get_learning_space(request.learning_space_id)
         student_profile = supabase_service.get_student_profile(request.user_id)
@@ -337,16 +488,19 @@ async def generate_quiz(request: WorkflowRequest):
             return {"success": False, "message": "Quiz generation failed. This may be due to API rate limits — please try again in a minute."}
 
         return {"success": True, "quiz": result.get("quiz")}
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error generating quiz: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/generate-flashcards")
-async def generate_flashcards(request: WorkflowRequest):
+def generate_flashcards(request: WorkflowRequest):
     try:
         # Cancel background bulk jobs to prioritize this manual request
         job_manager.cancel_all_user_jobs(request.user_id)
+        set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id, node="flashcards")
         
         learning_space = supabase_service.get_learning_space(request.learning_space_id)
         student_profile = supabase_service.get_student_profile(request.user_id)
@@ -361,16 +515,19 @@ async def generate_flashcards(request: WorkflowRequest):
             return {"success": False, "message": "Flashcards generation failed. This may be due to API rate limits — please try again in a minute."}
  
         return {"success": True, "flashcards": result.get("flashcards")}
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error generating flashcards: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/generate-recommendations")
-async def generate_recommendations(request: WorkflowRequest):
+def generate_recommendations(request: WorkflowRequest):
     try:
         # Cancel background bulk jobs to prioritize this manual request
         job_manager.cancel_all_user_jobs(request.user_id)
+        set_span_attributes(learning_space_id=request.learning_space_id, user_id=request.user_id, node="recommendation")
         
         learning_space = supabase_service.get_learning_space(request.learning_space_id)
         student_profile = supabase_service.get_student_profile(request.user_id)
@@ -385,6 +542,8 @@ async def generate_recommendations(request: WorkflowRequest):
             return {"success": False, "message": "Recommendations generation failed. This may be due to API rate limits — please try again in a minute."}
 
         return {"success": True, "recommendations": result.get("recommendations")}
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error generating recommendations: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,239 @@
+# ----
+# Runtime configuration, read once from the environment.
+# Every value has a safe default so the backend runs without extra setup.
+# ----
+
+import os
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_str(name: str, default: str) -> str:
+    return (os.getenv(name) or default).strip()
+
+
+# ── Agent graph budgets (seconds) ──────────────────────────────────────
+
+# Wall-clock budget for a whole workflow run; nodes never get more than what's left
+WORKFLOW_RUN_BUDGET_SECONDS = env_float("WORKFLOW_RUN_BUDGET_SECONDS", 420)
+
+# Default per-node budget, overridable per node with NODE_TIMEOUT_<NODE_NAME>
+NODE_TIMEOUT_SECONDS = env_float("NODE_TIMEOUT_SECONDS", 120)
+
+_DEFAULT_NODE_TIMEOUTS = {
+    "summarise":  180,
+    "enrichment": 90,
+    "verify":     90,
+}
+
+
+def node_timeout(node: str) -> float:
+    """Budget for a single graph node, e.g. NODE_TIMEOUT_ENRICHMENT=60."""
+    default = _DEFAULT_NODE_TIMEOUTS.get(node, NODE_TIMEOUT_SECONDS)
+    return env_float(f"NODE_TIMEOUT_{node.upper()}", default)
+
+
+# ── Verifier ───────────────────────────────────────────────────────────
+
+# "diff": model returns span corrections that are applied locally (cheap, non-blocking)
+# "rewrite": model returns a full corrected summary (legacy behaviour)
+VERIFIER_MODE = env_str("VERIFIER_MODE", "diff").lower()
+
+# Start the audio script from the draft summary while verification runs,
+# and only regenerate it if the verifier changed more than this share of the
+# summary's words (0.01 ≈ one replaced sentence in a ~1500-word summary)
+SPECULATIVE_AUDIO = env_str("SPECULATIVE_AUDIO", "true").lower() in ("1", "true", "yes")
+AUDIO_RERUN_CHANGE_RATIO = env_float("AUDIO_RERUN_CHANGE_RATIO", 0.01)
+
+
+# ── Request deadlines (seconds) ────────────────────────────────────────
+
+# Budget for one HTTP request, overridable per route prefix with
+# REQUEST_TIMEOUT_<PREFIX> (e.g. REQUEST_TIMEOUT_API_DOUBT=30). Clients may
+# shorten it with an X-Request-Timeout header but never extend it. 0 = unbounded.
+REQUEST_TIMEOUT_SECONDS = env_float("REQUEST_TIMEOUT_SECONDS", 60)
+
+_DEFAULT_ROUTE_TIMEOUTS = {
+    "/api/doubt":              45,
+    "/api/doubt/batch":        120,
+    "/api/orchestrator":       90,
+    "/api/workflows":          120,
+    "/api/workflows/events":   0,    # long-lived SSE stream
+}
+
+
+def route_timeout(path: str) -> float:
+    """Budget for a request path; the longest matching prefix wins."""
+    prefix = max((p for p in _DEFAULT_ROUTE_TIMEOUTS if path.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return REQUEST_TIMEOUT_SECONDS
+    env_name = "REQUEST_TIMEOUT_" + prefix.strip("/").replace("/", "_").upper()
+    return env_float(env_name, _DEFAULT_ROUTE_TIMEOUTS[prefix])
+
+
+# Don't start an LLM attempt (retry or fallback) with less budget than this left
+LLM_MIN_ATTEMPT_SECONDS = env_float("LLM_MIN_ATTEMPT_SECONDS", 3)
+# HTTP timeout of a single LLM call when no tighter deadline applies
+LLM_CALL_TIMEOUT_SECONDS = env_float("LLM_CALL_TIMEOUT_SECONDS", 120)
+
+
+# ── Prompt token budgets ───────────────────────────────────────────────
+
+# Input-token budget of a prompt's variable sections, overridable per prompt
+# with PROMPT_BUDGET_<NAME> (e.g. PROMPT_BUDGET_DOUBT=4000). Counted per
+# provider and script (see src/utils/token_budget.py), so Hindi notes aren't
+# cut at the same character count as English ones.
+_DEFAULT_PROMPT_BUDGETS = {
+    "doubt":          3000,   # notes + recent history + question
+    "doubt_batch":    6000,   # notes + recent history + a batch of numbered questions
+    "audio_summary":  4000,   # summary for the on-demand podcast script
+    "source":         6500,   # extracted PDF / transcript text for the summariser
+    "verifier":       9000,   # summary + source material
+}
+
+
+def prompt_budget(name: str) -> int:
+    return int(env_float(f"PROMPT_BUDGET_{name.upper()}", _DEFAULT_PROMPT_BUDGETS.get(name, 4000)))
+
+
+# "estimate": calibrated characters-per-token by provider and script (no downloads)
+# "tiktoken": count with TIKTOKEN_ENCODING when tiktoken and its encoding file are available
+PROMPT_TOKENIZER = env_str("PROMPT_TOKENIZER", "estimate").lower()
+TIKTOKEN_ENCODING = env_str("TIKTOKEN_ENCODING", "o200k_base")
+# Inline JSON overriding characters per token, e.g. {"groq": {"devanagari": 2.4}}
+TOKEN_CALIBRATION_JSON = env_str("TOKEN_CALIBRATION_JSON", "")
+
+
+# ── Doubt answer cache ─────────────────────────────────────────────────
+
+# Near-identical questions on the same notes, language and grade reuse a
+# stored answer instead of calling the LLM (see src/services/doubt_cache.py)
+DOUBT_CACHE_ENABLED = env_str("DOUBT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Cosine similarity a cached question needs to count as the same question
+DOUBT_CACHE_THRESHOLD = env_float("DOUBT_CACHE_THRESHOLD", 0.9)
+DOUBT_CACHE_TTL_SECONDS = env_float("DOUBT_CACHE_TTL_SECONDS", 24 * 3600)
+DOUBT_CACHE_MAX_ENTRIES = int(env_float("DOUBT_CACHE_MAX_ENTRIES", 5000))
+# Share of cache hits re-answered by the LLM in the background to audit for
+# false hits; answers agreeing less than DOUBT_CACHE_AUDIT_MIN_AGREEMENT are evicted
+DOUBT_CACHE_AUDIT_RATE = env_float("DOUBT_CACHE_AUDIT_RATE", 0.02)
+DOUBT_CACHE_AUDIT_MIN_AGREEMENT = env_float("DOUBT_CACHE_AUDIT_MIN_AGREEMENT", 0.5)
+
+# "hashed" (no download) or "sentence-transformers" (optional package + local model)
+EMBEDDER = env_str("EMBEDDER", "hashed").lower()
+EMBEDDING_MODEL = env_str("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+
+# ── Doubt conversation state ───────────────────────────────────────────
+
+# Recent messages sent verbatim with each question (see src/services/conversation_state.py)
+CONVERSATION_WINDOW_MESSAGES = int(env_float("CONVERSATION_WINDOW_MESSAGES", 6))
+# A long answer in the window is cut to this many tokens
+CONVERSATION_MESSAGE_TOKENS = int(env_float("CONVERSATION_MESSAGE_TOKENS", 250))
+# Older turns are folded into a rolling summary capped at this many tokens
+CONVERSATION_SUMMARY_TOKENS = int(env_float("CONVERSATION_SUMMARY_TOKENS", 300))
+# Messages read from doubt_messages when a conversation is first seen by this process
+CONVERSATION_BOOTSTRAP_MESSAGES = int(env_float("CONVERSATION_BOOTSTRAP_MESSAGES", 30))
+CONVERSATION_MAX_ACTIVE = int(env_float("CONVERSATION_MAX_ACTIVE", 2000))
+# An idle conversation is dropped and reloaded from the database on its next question
+CONVERSATION_IDLE_SECONDS = env_float("CONVERSATION_IDLE_SECONDS", 1800)
+
+
+# ── Doubt batches ──────────────────────────────────────────────────────
+
+# Questions accepted by one POST /api/doubt/batch (classroom lists, offline queues)
+DOUBT_BATCH_MAX_QUESTIONS = int(env_float("DOUBT_BATCH_MAX_QUESTIONS", 20))
+# "combined": one structured call answers the questions that fit the
+#             doubt_batch budget; the rest, and any it leaves out, get their own call
+# "parallel": one call per question
+DOUBT_BATCH_MODE = env_str("DOUBT_BATCH_MODE", "combined").lower()
+# Per-question calls in flight at once for one batch
+DOUBT_BATCH_CONCURRENCY = int(env_float("DOUBT_BATCH_CONCURRENCY", 4))
+
+
+# ── Study artifact generation ──────────────────────────────────────────
+
+# "separate": quiz, flashcards and recommendations are three structured calls
+# "combined": one call returns all three; only artifacts that fail to parse
+#             fall back to their own per-artifact call
+GENERATION_MODE = env_str("GENERATION_MODE", "separate").lower()
+
+
+# ── Startup ────────────────────────────────────────────────────────────
+
+# Compile the agent graph in the background right after startup (otherwise
+# the first workflow run does it). Either way it is never done at import.
+PRELOAD_AGENT_GRAPH = env_str("PRELOAD_AGENT_GRAPH", "true").lower() in ("1", "true", "yes")
+
+
+# ── Stale run watchdog ─────────────────────────────────────────────────
+
+# A space left in 'generating' longer than this is considered abandoned
+STALE_GENERATING_SECONDS = env_float("STALE_GENERATING_SECONDS", 900)
+WATCHDOG_INTERVAL_SECONDS = env_float("WATCHDOG_INTERVAL_SECONDS", 60)
+
+# A workflow run holds a lease on its learning space and renews it every
+# RUN_HEARTBEAT_SECONDS; a lease not renewed for RUN_LEASE_SECONDS can be taken over
+RUN_LEASE_SECONDS = env_float("RUN_LEASE_SECONDS", 120)
+RUN_HEARTBEAT_SECONDS = env_float("RUN_HEARTBEAT_SECONDS", 30)
+
+
+# ── Shared worker state ────────────────────────────────────────────────
+
+# "memory" keeps limits, leases and breaker state per process (one worker);
+# "sqlite" shares them between all workers on the host through
+# SHARED_STATE_DB. gunicorn.conf.py picks sqlite for more than one worker.
+SHARED_STATE_BACKEND = env_str("SHARED_STATE_BACKEND", "memory").lower()
+SHARED_STATE_DB = env_str("SHARED_STATE_DB", "/tmp/smarttutor_shared_state.sqlite3")
+
+
+# ── LLM circuit breaker ────────────────────────────────────────────────
+
+# Where breaker state lives; follows the shared worker state unless set
+CIRCUIT_BREAKER_STORE = env_str("CIRCUIT_BREAKER_STORE", SHARED_STATE_BACKEND).lower()
+CIRCUIT_BREAKER_DB = env_str("CIRCUIT_BREAKER_DB", SHARED_STATE_DB)
+CIRCUIT_FAILURE_THRESHOLD = int(env_float("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_WINDOW_SECONDS = env_float("CIRCUIT_WINDOW_SECONDS", 300)
+CIRCUIT_COOLDOWN_SECONDS = env_float("CIRCUIT_COOLDOWN_SECONDS", 120)
+# A half-open probe that never reports back frees its slot after this long
+CIRCUIT_PROBE_TIMEOUT_SECONDS = env_float("CIRCUIT_PROBE_TIMEOUT_SECONDS", 90)
+
+
+# ── LLM retries ────────────────────────────────────────────────────────
+
+# Retries per provider may not exceed this share of its calls in the window
+# (plus a small floor), so retries can't multiply load during an outage
+RETRY_BUDGET_RATIO = env_float("RETRY_BUDGET_RATIO", 0.2)
+RETRY_BUDGET_MIN_RETRIES = int(env_float("RETRY_BUDGET_MIN_RETRIES", 10))
+RETRY_BUDGET_WINDOW_SECONDS = env_float("RETRY_BUDGET_WINDOW_SECONDS", 60)
+# Retries shared by all LLM calls of one HTTP request or workflow run
+RETRY_MAX_PER_REQUEST = int(env_float("RETRY_MAX_PER_REQUEST", 8))
+# Longest Retry-After we are willing to wait; longer waits fail the attempt
+RETRY_AFTER_MAX_SECONDS = env_float("RETRY_AFTER_MAX_SECONDS", 60)
+
+
+# ── Offline benchmarking ───────────────────────────────────────────────
+
+# "memory" swaps the Supabase client for an in-process stand-in (no network)
+SUPABASE_BACKEND = env_str("SUPABASE_BACKEND", "supabase").lower()
+
+# Replace every LLM provider with a deterministic fake (see src/utils/fake_llm.py).
+# FAKE_LLM_PROFILE is inline JSON or a path to a JSON file with per-provider
+# latency / error / rate-limit settings.
+FAKE_LLM = env_str("FAKE_LLM", "false").lower() in ("1", "true", "yes")
+FAKE_LLM_PROFILE = env_str("FAKE_LLM_PROFILE", "")
+FAKE_LLM_SEED = int(env_float("FAKE_LLM_SEED", 1234))
+# Multiplies every simulated latency, e.g. 0.1 to run a benchmark 10x faster
+FAKE_LLM_TIME_SCALE = env_float("FAKE_LLM_TIME_SCALE", 1.0)
+
+# Record / replay of LLM calls (see src/utils/cassette.py): off | record | replay
+LLM_CASSETTE_MODE = env_str("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE_PATH = env_str("LLM_CASSETTE_PATH", "llm_cassette.jsonl.gz")
+# Multiplies recorded latencies on replay; 0 replays instantly
+LLM_CASSETTE_LATENCY_SCALE = env_float("LLM_CASSETTE_LATENCY_SCALE", 1.0)
+# Replay of a request that was never recorded: "error" (raise) or "live" (call the provider)
+LLM_CASSETTE_ON_MISS = env_str("LLM_CASSETTE_ON_MISS", "error").lower()
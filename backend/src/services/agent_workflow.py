@@ -1,94 +1,269 @@
 # Orchestrate the agent workflow
 
 import logging
-from src.services.supabase_service import supabase_service
-from src.agents.graph import AgentGraphWorkflow
+import time
+from datetime import datetime, timezone
+from src.services.supabase_service import run_write_scope, supabase_service
+from src.services.event_bus import event_bus, workflow_channel
+from src.services.run_lease import RunLease
+from src.configs.config import WORKFLOW_RUN_BUDGET_SECONDS
+from src.utils.deadline import deadline_scope
+from src.utils.retry_policy import retry_budget_scope
+from src.utils.tracing import start_span, usage_scope
+from src.agents.fingerprint import merge_fingerprints
+from src.agents.summary_artifact import SummaryArtifact
 
 logger = logging.getLogger(__name__)
 
+# Columns the workflow actually reads; bulk jobs project to these
+WORKFLOW_SPACE_COLUMNS = (
+    "id, status, language, topic, pdf_source, summary_notes, "
+    "quiz, flashcards, recommendations, audio_script, artifact_fingerprints"
+)
 
-def invoke_agent_workflow(learning_space_id: str, user_id: str, language: str | None = None):
-    """Orchestrate the agent workflow with error handling."""
+
+def invoke_agent_workflow(
+    learning_space_id: str,
+    user_id: str,
+    language: str | None = None,
+    learning_space: dict | None = None,
+    student_profile: dict | None = None,
+    lease: RunLease | None = None,
+):
+    """
+    Orchestrate the agent workflow with error handling.
+
+    Bulk callers can pass an already loaded `learning_space` row and
+    `student_profile` to avoid re-fetching them for every space. Callers
+    that already claimed the space pass their acquired `lease`.
+    """
     logger.info(f"Starting agent workflow for space {learning_space_id} with language override: {language}")
     
-    # get the input data from supabase
-    student_profile = supabase_service.get_student_profile(user_id)
-    learning_space = supabase_service.get_learning_space(learning_space_id)
+    # get the input data from supabase (unless the caller preloaded it)
+    try:
+        if student_profile is None:
+            student_profile = supabase_service.get_student_profile(user_id)
+        if learning_space is None:
+            learning_space = supabase_service.get_learning_space(learning_space_id)
+    except Exception:
+        if lease is not None:
+            lease.release("failed")
+        raise
 
     if not learning_space:
+        # The reads return None on DB errors too: a caller's lease must not keep the space 'generating'
         logger.error(f"Learning space not found: {learning_space_id}")
+        if lease is not None:
+            lease.release("failed")
         return None
     
-    # Concurrency check: If already generating, avoid parallel runs unless it's been stuck a long time
-    current_status = learning_space.get('status')
-    if current_status == 'generating':
-        logger.warning(f"Workflow already in progress for space {learning_space_id}. Skipping to avoid collision.")
-        return None
+    # Claim the space atomically: fails while another run holds an unexpired lease
+    if lease is None:
+        lease = RunLease(learning_space_id)
+        acquired = lease.acquire()
+        if acquired is None:
+            logger.error(f"Could not claim space {learning_space_id} (DB error). Skipping this run.")
+            return None
+        if not acquired:
+            logger.warning(f"Workflow already in progress for space {learning_space_id}. Skipping to avoid collision.")
+            return None
 
-    # Try to set status to 'generating' immediately
-    supabase_service.update_learning_space(learning_space_id, {"status": "generating"})
+    run = {"run_id": lease.run_id, "lease": lease, "learning_space_id": learning_space_id, "started": time.time()}
+    event_bus.reset(workflow_channel(learning_space_id))
+    _publish(run, "run_started", status="generating")
     
-    try:
-        if not student_profile:
-            logger.error(f"Student profile not found for user {user_id}")
-            supabase_service.update_learning_space(learning_space_id, {"status": "failed"})
-            return None
+    # Everything this run writes to the space is fenced by its lease (see run_write_scope);
+    # its LLM usage is tallied as each call finishes, for the workflow_runs record
+    with run_write_scope(lease.run_id), usage_scope() as usage:
+        run["usage"] = usage
+        try:
+            if not student_profile:
+                logger.error(f"Student profile not found for user {user_id}")
+                _finish_run(run, "failed")
+                return None
 
-        # Determine target language: override > space_stored > profile > default English
-        space_language = learning_space.get('language')
-        profile_language = student_profile.get('language')
+            # Determine target language: override > space_stored > profile > default English
+            space_language = learning_space.get('language')
+            profile_language = student_profile.get('language')
         
-        target_language = 'English' # Default
-        if language:
-            target_language = language
-        elif space_language:
-            target_language = space_language
-        elif profile_language:
-            target_language = profile_language
+            target_language = 'English' # Default
+            if language:
+                target_language = language
+            elif space_language:
+                target_language = space_language
+            elif profile_language:
+                target_language = profile_language
             
-        # Ensure target_language is formatted correctly (e.g. 'English', 'Hindi')
-        target_language = target_language.capitalize() if target_language else 'English'
+            # Ensure target_language is formatted correctly (e.g. 'English', 'Hindi')
+            target_language = target_language.capitalize() if target_language else 'English'
 
-        # CRITICAL: Always sync the language back to the database to ensure all items generated use it
-        logger.info(f"Syncing target language '{target_language}' to space {learning_space_id}")
-        supabase_service.update_learning_space(learning_space_id, {"language": target_language})
+            # CRITICAL: Always sync the language back to the database to ensure all items generated use it
+            logger.info(f"Syncing target language '{target_language}' to space {learning_space_id}")
+            supabase_service.update_learning_space(learning_space_id, {"language": target_language})
         
-        # prepare the initial state for agent
-        initial_state = {
-            "learning_space_id": learning_space_id,
-            "student_profile": {
-                "gender": student_profile.get('gender', ''),
-                "grade_level": student_profile.get('grade_level', 'general'),
-                "language": target_language
-            },
-            "user_prompt": {
-                "topic": learning_space.get('topic', 'Untitled'),
-                "file_url": learning_space.get('pdf_source', '')
-            },
-            # Load existing data (should be null if cleared by frontend)
-            "summary_notes": learning_space.get('summary_notes', ''),
-            "quiz": learning_space.get('quiz', None),
-            "flashcards": learning_space.get('flashcards', None),
-            "recommendations": learning_space.get('recommendations', None),
-            "podcast_script": learning_space.get('audio_script', '')
-        }
-
-        # invoke the agent
-        agent_workflow = AgentGraphWorkflow
-        response = agent_workflow.invoke(initial_state)
+            # prepare the initial state for agent
+            initial_state = {
+                "learning_space_id": learning_space_id,
+                "student_profile": {
+                    "gender": student_profile.get('gender', ''),
+                    "grade_level": student_profile.get('grade_level', 'general'),
+                    "language": target_language
+                },
+                "user_prompt": {
+                    "topic": learning_space.get('topic', 'Untitled'),
+                    "file_url": learning_space.get('pdf_source', '')
+                },
+                # Load existing data (should be null if cleared by frontend)
+                "summary_notes": SummaryArtifact.from_any(learning_space.get('summary_notes')),
+                "quiz": learning_space.get('quiz', None),
+                "flashcards": learning_space.get('flashcards', None),
+                "recommendations": learning_space.get('recommendations', None),
+                "podcast_script": learning_space.get('audio_script', ''),
+                # Fingerprints of the stored artifacts, used to skip unchanged nodes
+                "stored_fingerprints": learning_space.get('artifact_fingerprints') or {},
+            }
+
+            # invoke the agent, publishing each node's output as soon as it lands.
+            # The whole run shares one wall-clock budget; each node gets at most what's left.
+            # LLM calls made by the nodes are attributed to this run, space and user,
+            # and share one retry budget. If another run takes the lease over, this one stops.
+            with deadline_scope(WORKFLOW_RUN_BUDGET_SECONDS) as deadline, retry_budget_scope(), start_span(
+                "workflow.run", run_id=run["run_id"], learning_space_id=learning_space_id, user_id=user_id,
+            ):
+                lease.on_lost(deadline.cancel)
+                response = _stream_workflow(run, initial_state)
+
+            if response:
+                _persist_fingerprints(learning_space_id, initial_state["stored_fingerprints"], response)
+                _persist_merged_summary(learning_space_id, response)
         
-        # Check if any content was generated
-        if not response or (not response.get("summary_notes") and not response.get("quiz") and not response.get("flashcards")):
-            logger.warning(f"Workflow completed but no content generated for {learning_space_id}")
-            supabase_service.update_learning_space(learning_space_id, {"status": "failed"})
+            # Check if any content was generated
+            if not response or (not response.get("summary_notes") and not response.get("quiz") and not response.get("flashcards")):
+                logger.warning(f"Workflow completed but no content generated for {learning_space_id}")
+                _finish_run(run, "failed", response)
+                return response
+
+            # Set status back to normal
+            _finish_run(run, "normal", response)
+            logger.info(f"Successfully completed agent workflow for space {learning_space_id}")
             return response
 
-        # Set status back to normal
-        supabase_service.update_learning_space(learning_space_id, {"status": "normal"})
-        logger.info(f"Successfully completed agent workflow for space {learning_space_id}")
-        return response
+        except Exception as e:
+            logger.error(f"Error in agent workflow for space {learning_space_id}: {str(e)}")
+            _finish_run(run, "failed")
+            return None
 
-    except Exception as e:
-        logger.error(f"Error in agent workflow for space {learning_space_id}: {str(e)}")
-        supabase_service.update_learning_space(learning_space_id, {"status": "failed"})
-        return None
+
+# State keys forwarded to progress subscribers (internal bookkeeping is left out)
+_PUBLISHED_KEYS = ("summary_notes", "quiz", "flashcards", "recommendations", "podcast_script")
+
+
+def _jsonable(value):
+    if isinstance(value, SummaryArtifact):
+        return value.to_storage()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
+def _publish(run: dict, event_type: str, **payload):
+    now = time.time()
+    event_bus.publish(workflow_channel(run["learning_space_id"]), {
+        "type": event_type,
+        "run_id": run["run_id"],
+        "learning_space_id": run["learning_space_id"],
+        "at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        "elapsed": round(now - run["started"], 3),
+        **payload,
+    })
+
+
+def _stream_workflow(run: dict, initial_state: dict) -> dict | None:
+    """Run the graph node by node, emitting a `node_completed` event per update."""
+    # LangGraph and the compiled graph load with the first run, not with the app
+    from src.agents.graph import get_agent_workflow
+
+    final_state = None
+    for mode, chunk in get_agent_workflow().stream(initial_state, stream_mode=["updates", "values"]):
+        if mode == "values":
+            final_state = chunk
+            continue
+        for node, update in (chunk or {}).items():
+            update = update or {}
+            _publish(
+                run, "node_completed",
+                node=node,
+                duration=(update.get("node_timings") or {}).get(node),
+                skipped=node in (update.get("skipped_nodes") or []),
+                data={k: _jsonable(update[k]) for k in _PUBLISHED_KEYS if update.get(k)},
+            )
+    return final_state
+
+
+def _finish_run(run: dict, status: str, response: dict | None = None):
+    """Set the final status, notify subscribers and record per-node timings for the run."""
+    learning_space_id = run["learning_space_id"]
+    if not run["lease"].release(status):
+        # Taken over by a newer run; its status is the one that counts
+        status = "superseded"
+
+    response = response or {}
+    total = round(time.time() - run["started"], 3)
+    node_timings = response.get("node_timings") or {}
+    timed_out = response.get("timed_out_nodes") or []
+    from src.agents.graph import critical_path
+    critical_latency, critical_nodes = critical_path(node_timings)
+    token_usage = run["usage"].report(group_by="node") if run.get("usage") else []
+    cost = round(sum(row["cost_usd"] for row in token_usage), 6)
+    logger.info(
+        f"⏱️ Run for space {learning_space_id}: {total:.2f}s total, "
+        f"critical path {critical_latency:.2f}s ({' → '.join(critical_nodes) or 'n/a'}), "
+        f"~${cost:.4f} across {sum(row['calls'] for row in token_usage)} LLM call(s)"
+    )
+    if timed_out:
+        logger.warning(f"⌛ Run for space {learning_space_id} finished degraded; timed out: {', '.join(timed_out)}")
+    _publish(
+        run, "run_completed" if status == "normal" else "run_failed",
+        status=status, total_latency=total, node_timings=node_timings, timed_out_nodes=timed_out,
+        critical_path_latency=critical_latency, critical_path=critical_nodes,
+    )
+    supabase_service.log_workflow_run({
+        "run_id": run["run_id"],
+        "learning_space_id": learning_space_id,
+        "status": status,
+        "total_latency": total,
+        "node_timings": node_timings,
+        "skipped_nodes": response.get("skipped_nodes") or [],
+        "timed_out_nodes": timed_out,
+        "verification_stats": response.get("verification_stats"),
+        "critical_path_latency": critical_latency,
+        "critical_path": critical_nodes,
+        "audio_speculation": response.get("audio_speculation"),
+        "generation_stats": response.get("generation_stats"),
+        "token_usage": token_usage,
+        "cost_usd": cost,
+    })
+
+
+def _persist_fingerprints(learning_space_id: str, stored: dict, response: dict):
+    """Store the artifact fingerprints of this run and report how many nodes were skipped."""
+    skipped = response.get("skipped_nodes") or []
+    logger.info(
+        f"⏭️ Workflow for space {learning_space_id} skipped {len(skipped)} unchanged node(s)"
+        + (f": {', '.join(sorted(skipped))}" if skipped else "")
+    )
+    fingerprints = merge_fingerprints(stored, response.get("fingerprints"))
+    if fingerprints != stored:
+        supabase_service.update_learning_space(
+            learning_space_id, {"artifact_fingerprints": fingerprints}
+        )
+
+
+def _persist_merged_summary(learning_space_id: str, response: dict):
+    """
+    Verify and enrichment each save their own view of the summary; when both
+    changed it in the same run, store the merged result so neither is lost.
+    """
+    summary = response.get("summary_notes")
+    if isinstance(summary, SummaryArtifact) and summary.revision and summary.appendix:
+        supabase_service.update_learning_space(learning_space_id, {"summary_notes": summary.to_storage()})
@@ -0,0 +1,185 @@
+# Conversation state for the doubt solver
+#
+# Each (learning space, user) chat keeps, in process:
+#   - a window of the last CONVERSATION_WINDOW_MESSAGES messages, sent
+#     verbatim (long answers cut to CONVERSATION_MESSAGE_TOKENS), and
+#   - a rolling summary of everything older: a message leaving the window is
+#     folded into it as a one-line digest (the question, or the gist of the
+#     answer), and the oldest digests drop off past CONVERSATION_SUMMARY_TOKENS.
+#
+# doubt_messages stays the source of truth. A conversation is read from it
+# once, when this process first sees it (or after it idled out), and is then
+# updated incrementally after every answer - no database read per question,
+# and the history part of the prompt stays bounded however long the chat runs.
+#
+# With several workers, every recorded exchange bumps a shared version
+# counter for the conversation (src/services/shared_state.py); a worker
+# whose copy is behind - another worker answered in between - reloads it
+# instead of prompting with a history that misses those turns. Idle
+# conversations are dropped after CONVERSATION_IDLE_SECONDS.
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from src.configs.config import (
+    CONVERSATION_BOOTSTRAP_MESSAGES, CONVERSATION_IDLE_SECONDS, CONVERSATION_MAX_ACTIVE,
+    CONVERSATION_MESSAGE_TOKENS, CONVERSATION_SUMMARY_TOKENS, CONVERSATION_WINDOW_MESSAGES,
+)
+from src.services.shared_state import shared_state
+from src.services.supabase_service import supabase_service
+from src.utils.metrics import metrics
+from src.utils.token_budget import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_HISTORY_READS = metrics.counter(
+    "conversation_history_reads", "Doubt history lookups by source (memory, database).", ["source"]
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+")
+_MARKUP = re.compile(r"[#*_`>|]+")
+_QUESTION_DIGEST_TOKENS = 40
+_ANSWER_DIGEST_TOKENS = 60
+
+
+def _gist(text: str) -> str:
+    """First sentence that says something (answers tend to open with "Great question!")."""
+    flat = " ".join(_MARKUP.sub(" ", text or "").split())
+    sentences = _SENTENCE_END.split(flat)
+    for sentence in sentences:
+        if len(sentence.split()) >= 5:
+            return sentence
+    return sentences[0] if sentences else ""
+
+
+def _digest(role: str, content: str) -> str:
+    if role == "user":
+        return "- Student asked: " + truncate_to_tokens(
+            " ".join(content.split()), _QUESTION_DIGEST_TOKENS, task="chat", marker=" …")
+    return "- Tutor explained: " + truncate_to_tokens(
+        _gist(content), _ANSWER_DIGEST_TOKENS, task="chat", marker=" …")
+
+
+@dataclass
+class _Conversation:
+    window: deque
+    summary: list = field(default_factory=list)  # digest lines, oldest first
+    summary_tokens: int = 0
+    last_used: float = field(default_factory=time.time)
+    version: int = 0   # exchanges recorded for this chat (by any worker) when this copy was current
+
+
+class ConversationStore:
+    def __init__(self, window_messages: int = CONVERSATION_WINDOW_MESSAGES,
+                 message_tokens: int = CONVERSATION_MESSAGE_TOKENS,
+                 summary_tokens: int = CONVERSATION_SUMMARY_TOKENS,
+                 max_active: int = CONVERSATION_MAX_ACTIVE,
+                 idle_seconds: float = CONVERSATION_IDLE_SECONDS):
+        self.window_messages = window_messages
+        self.message_tokens = message_tokens
+        self.summary_tokens = summary_tokens
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._conversations: OrderedDict[tuple, _Conversation] = OrderedDict()  # LRU order, oldest first
+
+    def _append_locked(self, conversation: _Conversation, role: str, content: str):
+        if role == "assistant":
+            content = truncate_to_tokens(content, self.message_tokens, task="chat", marker=" […]")
+        conversation.window.append((role, content))
+        while len(conversation.window) > self.window_messages:
+            line = _digest(*conversation.window.popleft())
+            conversation.summary.append(line)
+            conversation.summary_tokens += count_tokens(line, "chat")
+        while conversation.summary_tokens > self.summary_tokens and len(conversation.summary) > 1:
+            conversation.summary_tokens -= count_tokens(conversation.summary.pop(0), "chat")
+
+    def _load(self, learning_space_id: str, user_id: str) -> _Conversation:
+        conversation = _Conversation(window=deque())
+        try:
+            response = (
+                supabase_service.client
+                .table("doubt_messages")
+                .select("role, content")
+                .eq("learning_space_id", learning_space_id)
+                .eq("user_id", user_id)
+                .order("created_at", desc=True)
+                .limit(CONVERSATION_BOOTSTRAP_MESSAGES)
+                .execute()
+            )
+            for message in reversed(response.data or []):
+                self._append_locked(conversation, message["role"], message["content"] or "")
+        except Exception as e:
+            logger.warning(f"Could not load doubt history for context: {e}")
+        return conversation
+
+    def _evict_locked(self, now: float):
+        while self._conversations:
+            key, oldest = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_active and now - oldest.last_used <= self.idle_seconds:
+                break
+            del self._conversations[key]
+
+    @staticmethod
+    def _version_key(learning_space_id: str, user_id: str) -> str:
+        return f"{learning_space_id}:{user_id}"
+
+    def history(self, learning_space_id: str, user_id: str) -> str:
+        """Rolling summary plus recent messages, ready for the prompt ("" for a new chat)."""
+        key = (learning_space_id, user_id)
+        now = time.time()
+        version = shared_state.counter("conversation", self._version_key(*key))
+        with self._lock:
+            self._evict_locked(now)
+            conversation = self._conversations.get(key)
+            if conversation is not None and conversation.version != version:
+                # Another worker answered since this copy was loaded
+                del self._conversations[key]
+                conversation = None
+            if conversation is not None:
+                conversation.last_used = now
+                self._conversations.move_to_end(key)
+        if conversation is None:
+            CONVERSATION_HISTORY_READS.labels("database").inc()
+            loaded = self._load(learning_space_id, user_id)
+            loaded.version = version
+            with self._lock:
+                conversation = self._conversations.setdefault(key, loaded)
+                self._conversations.move_to_end(key)
+        else:
+            CONVERSATION_HISTORY_READS.labels("memory").inc()
+        with self._lock:
+            return self._render_locked(conversation)
+
+    @staticmethod
+    def _render_locked(conversation: _Conversation) -> str:
+        recent = "\n".join(f"{role.capitalize()}: {content}" for role, content in conversation.window)
+        if not conversation.summary:
+            return recent
+        return "Earlier in this conversation:\n" + "\n".join(conversation.summary) + "\n\nRecent messages:\n" + recent
+
+    def record_exchange(self, learning_space_id: str, user_id: str, question: str, answer: str):
+        """Add an answered question. A conversation not held here is left to load from the database."""
+        key = (learning_space_id, user_id)
+        # Outlives the idle timeout, so a held copy never sees the counter restart
+        version = shared_state.incr("conversation", self._version_key(*key), ttl=self.idle_seconds * 2)
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                return
+            if conversation.version != version - 1:
+                del self._conversations[key]
+                return
+            self._append_locked(conversation, "user", question)
+            self._append_locked(conversation, "assistant", answer)
+            conversation.version = version
+            conversation.last_used = time.time()
+
+
+conversation_store = ConversationStore()
+
+metrics.gauge("conversation_states_active", "Doubt conversations held in memory.",
+              callback=lambda: len(conversation_store._conversations))
@@ -0,0 +1,277 @@
+# Semantic answer cache for the doubt solver
+#
+# Students on the same notes ask the same thing in different words
+# ("what is photosynthesis?" / "explain photosynthesis"). Questions are
+# embedded on CPU (src/utils/embeddings.py) into an in-process index
+# partitioned by scope - the hash of the notes sent as context, the answer
+# language and the grade level - so an answer is only reused where the
+# prompt would have been the same apart from the wording of the question.
+#
+# A hit needs cosine similarity >= DOUBT_CACHE_THRESHOLD and the same
+# numbers and negations in both questions ("2+3" vs "2+4" embed almost
+# identically). Follow-ups that lean on the conversation ("explain that
+# again") are never cached. Entries expire after DOUBT_CACHE_TTL_SECONDS
+# and the least recently used go first once DOUBT_CACHE_MAX_ENTRIES is hit.
+#
+# A sample of hits (DOUBT_CACHE_AUDIT_RATE) is re-answered by the LLM in the
+# background; if the fresh answer disagrees with the cached one, the hit is
+# counted as a suspected false hit, kept for review and the entry evicted.
+
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+import numpy as np
+from src.configs.config import (
+    DOUBT_CACHE_AUDIT_MIN_AGREEMENT, DOUBT_CACHE_AUDIT_RATE, DOUBT_CACHE_ENABLED, DOUBT_CACHE_MAX_ENTRIES,
+    DOUBT_CACHE_THRESHOLD, DOUBT_CACHE_TTL_SECONDS,
+)
+from src.utils.embeddings import get_embedder, normalize_text
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DOUBT_CACHE_LOOKUPS = metrics.counter(
+    "doubt_cache_lookups", "Doubt answer cache lookups by outcome (hit, miss, bypass).", ["outcome"]
+)
+DOUBT_CACHE_AUDITS = metrics.counter(
+    "doubt_cache_audits", "Audited cache hits by verdict (agree, false_hit).", ["verdict"]
+)
+
+# Wording that doesn't change what is being asked
+_FILLER_PREFIXES = (
+    "can you please", "could you please", "can you", "could you", "please",
+    "what is meant by", "what is the meaning of", "meaning of", "what is", "what are", "what s", "whats",
+    "explain to me", "explain", "tell me about", "describe", "define",
+)
+_FILLER_SUFFIXES = (
+    "please", "क्या है", "क्या हैं", "का अर्थ क्या है", "समझाइए", "समझाओ", "बताइए", "बताओ",
+    "के बारे में बताइए", "के बारे में बताओ",
+)
+# Questions that only make sense with the conversation so far
+_REFERENTIAL = {
+    "that", "it", "this", "these", "those", "above", "again", "previous", "earlier", "last",
+    "वह", "यह", "इसे", "इसका", "इसकी", "उसका", "उसकी", "उसे", "फिर",
+}
+_NEGATIONS = {"not", "no", "never", "without", "नहीं", "न", "बिना"}
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def canonical_question(question: str) -> str:
+    text = normalize_text(question)
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in _FILLER_PREFIXES:
+            if text.startswith(prefix + " "):
+                text, stripped = text[len(prefix) + 1:], True
+        for suffix in _FILLER_SUFFIXES:
+            if text.endswith(" " + suffix):
+                text, stripped = text[:-len(suffix) - 1], True
+    return text
+
+
+def _guard_tokens(canonical: str) -> tuple:
+    words = set(canonical.split())
+    # Numbers in order ("4-2" is not "2-4"); negations as a set
+    return tuple(_NUMBER.findall(canonical)), tuple(sorted(words & _NEGATIONS))
+
+
+@dataclass
+class _Entry:
+    id: int
+    scope: tuple
+    question: str
+    guards: tuple
+    vector: np.ndarray
+    answer: str
+    created: float
+    hits: int = 0
+
+
+@dataclass
+class CacheHit:
+    entry_id: int
+    answer: str
+    similarity: float
+    cached_question: str
+
+
+@dataclass
+class _Scope:
+    ids: list = field(default_factory=list)
+    matrix: Optional[np.ndarray] = None  # rows follow `ids`; rebuilt after changes
+
+
+class DoubtAnswerCache:
+    def __init__(self, threshold: float = DOUBT_CACHE_THRESHOLD, ttl_seconds: float = DOUBT_CACHE_TTL_SECONDS,
+                 max_entries: int = DOUBT_CACHE_MAX_ENTRIES, audit_rate: float = DOUBT_CACHE_AUDIT_RATE,
+                 enabled: bool = DOUBT_CACHE_ENABLED):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()  # LRU order, oldest first
+        self._scopes: dict[tuple, _Scope] = {}
+        self._ids = itertools.count(1)
+        self._counts = {"hit": 0, "miss": 0, "bypass": 0, "agree": 0, "false_hit": 0}
+        self._suspects: deque = deque(maxlen=50)
+
+    @staticmethod
+    def cacheable(question: str) -> bool:
+        """Self-contained questions only: not follow-ups, not one-word fragments."""
+        words = normalize_text(question).split()
+        return len(words) >= 2 and not (set(words) & _REFERENTIAL)
+
+    def _count(self, outcome: str):
+        self._counts[outcome] += 1
+        DOUBT_CACHE_LOOKUPS.labels(outcome).inc()
+
+    def lookup(self, scope: tuple, question: str) -> Optional[CacheHit]:
+        if not self.enabled:
+            return None
+        if not self.cacheable(question):
+            with self._lock:
+                self._count("bypass")
+            return None
+
+        canonical = canonical_question(question)
+        vector = get_embedder().embed(canonical)
+        guards = _guard_tokens(canonical)
+        now = time.time()
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            best = None
+            if bucket and bucket.ids:
+                if bucket.matrix is None:
+                    bucket.matrix = np.stack([self._entries[i].vector for i in bucket.ids])
+                similarities = bucket.matrix @ vector
+                for row in np.argsort(similarities)[::-1]:
+                    similarity = float(similarities[row])
+                    if similarity < self.threshold:
+                        break
+                    entry = self._entries[bucket.ids[row]]
+                    if now - entry.created > self.ttl_seconds or entry.guards != guards:
+                        continue
+                    best = (entry, similarity)
+                    break
+            if best is None:
+                self._count("miss")
+                return None
+            entry, similarity = best
+            entry.hits += 1
+            self._entries.move_to_end(entry.id)
+            self._count("hit")
+            return CacheHit(entry.id, entry.answer, round(similarity, 4), entry.question)
+
+    def store(self, scope: tuple, question: str, answer: str):
+        if not self.enabled or not answer or not self.cacheable(question):
+            return
+        canonical = canonical_question(question)
+        entry = _Entry(
+            id=0, scope=scope, question=question, guards=_guard_tokens(canonical),
+            vector=get_embedder().embed(canonical), answer=answer, created=time.time(),
+        )
+        with self._lock:
+            entry.id = next(self._ids)
+            self._entries[entry.id] = entry
+            bucket = self._scopes.setdefault(scope, _Scope())
+            bucket.ids.append(entry.id)
+            bucket.matrix = None
+            self._evict_locked(time.time())
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket = self._scopes.get(entry.scope)
+        if bucket is not None:
+            bucket.ids.remove(entry_id)
+            bucket.matrix = None
+            if not bucket.ids:
+                del self._scopes[entry.scope]
+
+    def _evict_locked(self, now: float):
+        expired = [i for i, e in self._entries.items() if now - e.created > self.ttl_seconds]
+        for entry_id in expired:
+            self._remove_locked(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove_locked(next(iter(self._entries)))
+
+    # ── False-hit audits ───────────────────────────────────────────────
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def audit_in_background(self, hit: CacheHit, question: str, answer_fn: Callable[[], str]):
+        """Re-answer a served hit off the request path and compare with the cached answer."""
+
+        def run():
+            try:
+                self.record_audit(hit, question, answer_fn())
+            except Exception as e:
+                logger.warning(f"Doubt cache audit failed: {e}")
+
+        threading.Thread(target=run, name="doubt-cache-audit", daemon=True).start()
+
+    def record_audit(self, hit: CacheHit, question: str, fresh_answer: str):
+        embedder = get_embedder()
+        agreement = float(embedder.embed(hit.answer) @ embedder.embed(fresh_answer))
+        verdict = "agree" if agreement >= DOUBT_CACHE_AUDIT_MIN_AGREEMENT else "false_hit"
+        DOUBT_CACHE_AUDITS.labels(verdict).inc()
+        with self._lock:
+            self._counts[verdict] += 1
+            if verdict == "false_hit":
+                self._suspects.append({
+                    "at": time.time(), "question": question, "cached_question": hit.cached_question,
+                    "similarity": hit.similarity, "answer_agreement": round(agreement, 4),
+                })
+                self._remove_locked(hit.entry_id)
+        if verdict == "false_hit":
+            logger.warning(
+                f"🧐 Doubt cache: suspected false hit {question!r} ≈ {hit.cached_question!r} "
+                f"(similarity {hit.similarity}, answer agreement {agreement:.2f}); entry evicted"
+            )
+
+    # ── Introspection ──────────────────────────────────────────────────
+
+    def hit_rate(self) -> float:
+        looked_up = self._counts["hit"] + self._counts["miss"]
+        return self._counts["hit"] / looked_up if looked_up else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            audited = self._counts["agree"] + self._counts["false_hit"]
+            return {
+                "enabled": self.enabled,
+                "embedder": get_embedder().name,
+                "entries": len(self._entries),
+                "scopes": len(self._scopes),
+                "threshold": self.threshold,
+                "lookups": {k: self._counts[k] for k in ("hit", "miss", "bypass")},
+                "hit_rate": round(self.hit_rate(), 4),
+                "audits": audited,
+                "suspected_false_hits": self._counts["false_hit"],
+                "false_hit_rate": round(self._counts["false_hit"] / audited, 4) if audited else None,
+                "recent_suspects": list(self._suspects),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+
+doubt_cache = DoubtAnswerCache()
+
+metrics.gauge("doubt_cache_entries", "Answers held in the doubt answer cache.",
+              callback=lambda: len(doubt_cache._entries))
+metrics.gauge("doubt_cache_hit_ratio", "Share of cacheable doubt lookups answered from the cache.",
+              callback=doubt_cache.hit_rate)
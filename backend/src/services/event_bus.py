@@ -0,0 +1,97 @@
+# In-process pub/sub for workflow progress events
+#
+# The agent graph runs in BackgroundTasks threads while SSE clients wait on
+# the asyncio event loop, so publishing is thread-safe and hands events to
+# each subscriber's loop via call_soon_threadsafe.
+
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    Channel-based pub/sub. Each channel keeps a short replay history of the
+    current run so a client that connects mid-run still sees earlier events.
+    """
+
+    HISTORY_SIZE = 50         # events replayed per channel
+    MAX_CHANNELS = 1000       # channels with history kept in memory (LRU)
+    QUEUE_SIZE = 100          # per-subscriber buffer before events are dropped
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._history: OrderedDict[str, deque] = OrderedDict()
+
+    def reset(self, channel: str):
+        """Forget the replay history of a channel (called when a new run starts)."""
+        with self._lock:
+            self._history.pop(channel, None)
+
+    def publish(self, channel: str, event: dict):
+        with self._lock:
+            history = self._history.get(channel)
+            if history is None:
+                history = self._history[channel] = deque(maxlen=self.HISTORY_SIZE)
+                while len(self._history) > self.MAX_CHANNELS:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(channel)
+            history.append(event)
+            subscribers = list(self._subscribers.get(channel, []))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # Subscriber's loop is closed; it will be removed on unsubscribe
+                pass
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Event subscriber is too slow, dropping event")
+
+    def subscribe(self, channel: str, replay: bool = True) -> asyncio.Queue:
+        """Subscribe from inside a running event loop. Returns the queue to await on."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append((loop, queue))
+            backlog = list(self._history.get(channel, [])) if replay else []
+        for event in backlog:
+            self._offer(queue, event)
+        return queue
+
+    def stats(self) -> dict:
+        """Subscriber count and total queued (undelivered) events, for metrics."""
+        with self._lock:
+            queues = [q for subscribers in self._subscribers.values() for _, q in subscribers]
+        return {"subscribers": len(queues), "queued": sum(q.qsize() for q in queues)}
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, [])
+            self._subscribers[channel] = [(l, q) for l, q in subscribers if q is not queue]
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+
+# Singleton instance shared across all requests in the process lifetime
+event_bus = EventBus()
+
+metrics.gauge("event_bus_subscribers", "Connected progress-event subscribers.",
+              callback=lambda: event_bus.stats()["subscribers"])
+metrics.gauge("event_bus_queue_depth", "Events waiting in subscriber queues.",
+              callback=lambda: event_bus.stats()["queued"])
+
+
+def workflow_channel(learning_space_id: str) -> str:
+    return f"workflow:{learning_space_id}"
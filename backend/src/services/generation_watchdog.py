@@ -0,0 +1,63 @@
+# Watchdog for learning spaces stuck in 'generating'
+#
+# A crashed worker or a killed container can leave a space in 'generating'.
+# A new invoke already takes such a space over once its run lease expires
+# (see run_lease.py); this sweeps the ones nobody re-runs back to 'failed'
+# so the UI stops showing them as in progress. Live runs heartbeat
+# updated_at, so they are never swept.
+#
+# Every worker runs a watchdog; a shared lease lets only one of them sweep
+# per interval.
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from src.configs.config import STALE_GENERATING_SECONDS, WATCHDOG_INTERVAL_SECONDS
+from src.services.shared_state import shared_state
+from src.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationWatchdog:
+    """Background thread that periodically resets stale 'generating' spaces."""
+
+    def __init__(self, interval: float = WATCHDOG_INTERVAL_SECONDS,
+                 stale_after: float = STALE_GENERATING_SECONDS):
+        self.interval = interval
+        self.stale_after = stale_after
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def sweep(self) -> list:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        reset_ids = supabase_service.reset_stale_generating(cutoff.isoformat())
+        if reset_ids:
+            logger.warning(f"🐕 Watchdog reset {len(reset_ids)} stale 'generating' space(s): {reset_ids}")
+        return reset_ids
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                # Held (not released) until just before the next tick, so one worker sweeps per interval
+                if shared_state.try_lock("generation_watchdog", self._owner, ttl=self.interval * 0.9):
+                    self.sweep()
+            except Exception as e:
+                logger.error(f"Watchdog sweep failed: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="generation-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"🐕 Generation watchdog started (stale after {self.stale_after:.0f}s)")
+
+    def stop(self):
+        self._stop.set()
+
+
+generation_watchdog = GenerationWatchdog()
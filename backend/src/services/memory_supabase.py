@@ -0,0 +1,266 @@
+# -----------------------------------------------------------------------
+# memory_supabase.py
+# In-memory stand-in for the subset of the supabase-py client this backend
+# uses (table queries and storage), for offline benchmarks and load tests.
+#
+# Enabled with SUPABASE_BACKEND=memory. MEMORY_DB_LATENCY_MS adds a fixed
+# round-trip delay per query so benchmarks keep a realistic DB share.
+# MEMORY_DB_SEED names a JSON file {table: [rows]} loaded into every new
+# client - how several worker processes start with the same fixtures
+# (each then has its own copy).
+# -----------------------------------------------------------------------
+
+import copy
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from src.configs.config import env_float, env_str
+
+MEMORY_DB_LATENCY_MS = env_float("MEMORY_DB_LATENCY_MS", 0)
+MEMORY_DB_SEED = env_str("MEMORY_DB_SEED", "")
+
+# Upserts match on these columns; everything else is keyed by "id"
+_CONFLICT_KEYS = {"content_cache": "cache_key"}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MemoryAPIError(Exception):
+    """Raised where PostgREST would return an error (e.g. .single() without exactly one row)."""
+
+
+def _split_top_level(filters: str) -> list[str]:
+    """Split "a,and(b,c),d" on the commas outside parentheses."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(filters):
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            parts.append(filters[start:i])
+            start = i + 1
+    parts.append(filters[start:])
+    return parts
+
+
+def _parse_condition(expression: str):
+    expression = expression.strip()
+    if expression.startswith("and(") and expression.endswith(")"):
+        conditions = [_parse_condition(part) for part in _split_top_level(expression[4:-1])]
+        return lambda row: all(condition(row) for condition in conditions)
+    column, op, value = expression.split(".", 2)
+    value = value.strip('"')
+    if op == "is":
+        expected = None if value == "null" else value == "true"
+        return lambda row: row.get(column) is expected
+    if op == "eq":
+        return lambda row: row.get(column) is not None and str(row.get(column)) == value
+    if op == "neq":
+        return lambda row: row.get(column) is not None and str(row.get(column)) != value
+    if op == "lt":
+        return lambda row: row.get(column) is not None and str(row.get(column)) < value
+    if op == "gt":
+        return lambda row: row.get(column) is not None and str(row.get(column)) > value
+    raise MemoryAPIError(f"Unsupported filter operator '{op}' in '{expression}'")
+
+
+class _Query:
+    """Chainable query mirroring supabase-py's builder; runs on execute()."""
+
+    def __init__(self, db: "InMemorySupabaseClient", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._single = False
+
+    # ── operations ──
+    def select(self, columns: str = "*", **_):
+        self._op, self._columns = "select", columns
+        return self
+
+    def insert(self, rows, **_):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, values: dict, **_):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict: str = "", **_):
+        self._op, self._payload = "upsert", rows
+        self._conflict = on_conflict or _CONFLICT_KEYS.get(self._table, "id")
+        return self
+
+    def delete(self, **_):
+        self._op = "delete"
+        return self
+
+    # ── filters / modifiers ──
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def or_(self, filters: str, **_):
+        """PostgREST `or` filter: "col.op.value,..." with eq, neq, lt, gt, is.null and nested and(...)."""
+        conditions = [_parse_condition(part) for part in _split_top_level(filters)]
+        self._filters.append(lambda row: any(condition(row) for condition in conditions))
+        return self
+
+    def order(self, column, desc: bool = False, **_):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int, **_):
+        self._limit = count
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    # ── execution ──
+    def execute(self):
+        if MEMORY_DB_LATENCY_MS:
+            time.sleep(MEMORY_DB_LATENCY_MS / 1000)
+        with self._db._lock:
+            data = getattr(self, f"_run_{self._op}")(self._db._tables.setdefault(self._table, []))
+        if self._single:
+            if len(data) != 1:
+                raise MemoryAPIError(f"JSON object requested, multiple (or no) rows returned ({len(data)})")
+            data = data[0]
+        return SimpleNamespace(data=data, count=len(data) if isinstance(data, list) else 1)
+
+    def _matches(self, row) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row) -> dict:
+        if self._columns.strip() == "*":
+            return copy.deepcopy(row)
+        return {c.strip(): copy.deepcopy(row.get(c.strip())) for c in self._columns.split(",")}
+
+    def _run_select(self, rows):
+        found = [r for r in rows if self._matches(r)]
+        # Stable sorts from the last key to the first give a multi-column order
+        for column, desc in reversed(self._order):
+            found.sort(key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=desc)
+        if self._limit is not None:
+            found = found[: self._limit]
+        return [self._project(r) for r in found]
+
+    @staticmethod
+    def _prepare(row: dict) -> dict:
+        row = {k: (_now_iso() if v == "now()" else v) for k, v in copy.deepcopy(row).items()}
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", _now_iso())
+        return row
+
+    def _run_insert(self, rows):
+        new_rows = [self._prepare(r) for r in (self._payload if isinstance(self._payload, list) else [self._payload])]
+        rows.extend(new_rows)
+        return copy.deepcopy(new_rows)
+
+    def _run_update(self, rows):
+        changed = []
+        for row in rows:
+            if self._matches(row):
+                row.update(copy.deepcopy(self._payload))
+                changed.append(copy.deepcopy(row))
+        return changed
+
+    def _run_upsert(self, rows):
+        result = []
+        for new in (self._payload if isinstance(self._payload, list) else [self._payload]):
+            new = self._prepare(new)
+            existing = next((r for r in rows if r.get(self._conflict) == new.get(self._conflict)), None)
+            if existing is not None:
+                new.pop("id", None)
+                existing.update(new)
+                result.append(copy.deepcopy(existing))
+            else:
+                rows.append(new)
+                result.append(copy.deepcopy(new))
+        return result
+
+    def _run_delete(self, rows):
+        removed = [r for r in rows if self._matches(r)]
+        rows[:] = [r for r in rows if not self._matches(r)]
+        return removed
+
+
+class _Bucket:
+    def __init__(self, db: "InMemorySupabaseClient", name: str):
+        self._db = db
+        self._name = name
+
+    def upload(self, path: str, data, file_options=None):
+        with self._db._lock:
+            self._db._files[(self._name, path)] = bytes(data or b"")
+        return SimpleNamespace(path=path, full_path=f"{self._name}/{path}")
+
+    def get_public_url(self, path: str) -> str:
+        return f"memory://{self._name}/{path}"
+
+
+class _Storage:
+    def __init__(self, db: "InMemorySupabaseClient"):
+        self._db = db
+
+    def from_(self, bucket: str) -> _Bucket:
+        return _Bucket(self._db, bucket)
+
+
+class InMemorySupabaseClient:
+    """Thread-safe, process-local tables and storage with the supabase-py call shapes."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables: dict[str, list[dict]] = {}
+        self._files: dict[tuple[str, str], bytes] = {}
+        self.storage = _Storage(self)
+        if MEMORY_DB_SEED:
+            with open(MEMORY_DB_SEED, encoding="utf-8") as f:
+                for table, rows in json.load(f).items():
+                    self.seed(table, rows)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def seed(self, table: str, rows: list[dict]):
+        """Insert fixture rows directly (no latency, ids kept as given)."""
+        with self._lock:
+            self._tables.setdefault(table, []).extend(_Query._prepare(r) for r in rows)
+
+    def rows(self, table: str) -> list[dict]:
+        with self._lock:
+            return copy.deepcopy(self._tables.get(table, []))
+
+    def reset(self):
+        with self._lock:
+            self._tables.clear()
+            self._files.clear()
@@ -0,0 +1,82 @@
+# Lease-based run lock on a learning space
+#
+# A workflow run claims its space with one conditional update (status not
+# 'generating', or the current lease expired) that also stores its run_id and
+# lease expiry, so two invokes - in one worker or across workers - can't both
+# win. A heartbeat thread renews the lease while the run works; if renewal
+# finds another run_id the lease was taken over, and the run is told to stop.
+# The final status is only written while the run still holds the lease.
+
+import logging
+import threading
+import uuid
+from typing import Callable, Optional
+from src.configs.config import RUN_HEARTBEAT_SECONDS, RUN_LEASE_SECONDS
+from src.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+
+class RunLease:
+    """Lease held by one workflow run on one learning space."""
+
+    def __init__(self, learning_space_id: str, run_id: Optional[str] = None,
+                 lease_seconds: float = RUN_LEASE_SECONDS, heartbeat_seconds: float = RUN_HEARTBEAT_SECONDS):
+        self.learning_space_id = learning_space_id
+        self.run_id = run_id or uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._on_lost: list[Callable[[], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def acquire(self) -> Optional[bool]:
+        """Claim the space; on success keep the lease alive until release().
+        False if another run holds it, None if the claim itself failed (DB error)."""
+        acquired = supabase_service.acquire_run_lease(self.learning_space_id, self.run_id, self.lease_seconds)
+        if not acquired:
+            return acquired
+        logger.info(f"🔒 Run {self.run_id[:8]} holds the lease on space {self.learning_space_id}")
+        self._thread = threading.Thread(
+            target=self._heartbeat, name=f"run-lease-{self.run_id[:8]}", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def on_lost(self, callback: Callable[[], None]):
+        """Call `callback` if the lease is taken over (immediately if it already was)."""
+        with self._lock:
+            if not self.lost.is_set():
+                self._on_lost.append(callback)
+                return
+        callback()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            renewed = supabase_service.renew_run_lease(self.learning_space_id, self.run_id, self.lease_seconds)
+            if renewed is False:
+                logger.warning(
+                    f"🔓 Run {self.run_id[:8]} lost its lease on space {self.learning_space_id}; stopping it."
+                )
+                with self._lock:
+                    self.lost.set()
+                    callbacks, self._on_lost = self._on_lost, []
+                for callback in callbacks:
+                    callback()
+                return
+            # None (DB error): keep trying; the lease only lapses if renewals keep failing
+
+    def release(self, status: str) -> bool:
+        """Stop the heartbeat and set the final status if we still hold the lease."""
+        self._stop.set()
+        if self.lost.is_set():
+            return False
+        released = supabase_service.release_run_lease(self.learning_space_id, self.run_id, status)
+        if not released:
+            logger.warning(
+                f"🔓 Run {self.run_id[:8]} no longer holds space {self.learning_space_id}; "
+                f"not overwriting its status with '{status}'."
+            )
+        return released
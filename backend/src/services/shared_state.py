@@ -0,0 +1,287 @@
+# -----------------------------------------------------------------------
+# shared_state.py
+# State that every worker process on a host must agree on, behind one
+# interface: small JSON records with an optional TTL, atomic read-modify-
+# write, and counters and leases built on top of it.
+#
+#   memory  → a dict in this process; right for a single worker (default)
+#   sqlite  → one SQLite file (SHARED_STATE_DB) opened by every worker; each
+#             update is one BEGIN IMMEDIATE transaction, so workers serialise
+#
+# gunicorn.conf.py selects sqlite when it starts more than one worker. If
+# the file can't be used the SQLite backend keeps serving from process
+# memory (and says so) rather than failing requests.
+#
+# Per-process state and how it behaves with N workers:
+#   health_tracker (LLM circuit breaker)  shared, namespace "circuit"
+#   job_manager (per-user invoke limit)   shared, "job_slots"
+#   job_manager (bulk-job cancellation)   shared, "bulk_jobs"
+#   generation_watchdog                   one sweep per interval, lease "generation_watchdog"
+#   conversation_store                    per process; a shared version counter
+#                                         ("conversation") marks a copy stale
+#   doubt_cache, prompt render cache,     per process: a miss recomputes, it is
+#   Gemini context cache                  never wrong, only N times colder
+#   provider_retry_budget                 per process: a ratio of the worker's own calls
+#   supabase_service                      per process by design (HTTP client, no state)
+#   event_bus (SSE progress)              per process: only clients on the worker
+#                                         running a workflow see its events
+#   metrics                               per process: scrape each worker
+# -----------------------------------------------------------------------
+
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Callable, Optional
+from src.configs.config import SHARED_STATE_BACKEND, SHARED_STATE_DB
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState(ABC):
+    """Counters and leases on top of a backend's update()."""
+
+    backend = "base"
+
+    @abstractmethod
+    def update(self, namespace: str, key: str, fn: Callable[[dict], object],
+               default: Optional[Callable[[], dict]] = None, ttl: Optional[float] = None):
+        """
+        Atomically apply `fn` to the record (a dict, `default()` or {} when
+        missing or expired), store it - expiring `ttl` seconds from now, or
+        never - and return what `fn` returned.
+        """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        """A copy of the live record, or None when missing or expired."""
+
+    def set(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        self.update(namespace, key, lambda record: record.update(value), ttl=ttl)
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        """Remove a record (a no-op when there is none)."""
+
+    @abstractmethod
+    def items(self, namespace: str) -> dict[str, dict]:
+        """Every live record of a namespace, by key."""
+
+    @abstractmethod
+    def clear(self, namespace: Optional[str] = None):
+        """Remove the records of one namespace, or of all of them."""
+
+    # ── Counters ──
+
+    def incr(self, namespace: str, key: str, delta: int = 1, ttl: Optional[float] = None) -> int:
+        def add(record: dict) -> int:
+            record["value"] = record.get("value", 0) + delta
+            return record["value"]
+
+        return self.update(namespace, key, add, ttl=ttl)
+
+    def counter(self, namespace: str, key: str) -> int:
+        record = self.get(namespace, key)
+        return record.get("value", 0) if record else 0
+
+    # ── Leases ──
+
+    def try_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """Take (or renew) the lease `name` for `ttl` seconds unless someone else holds it."""
+        def claim(record: dict) -> bool:
+            now = time.time()
+            if record.get("owner") not in (None, owner) and record.get("expires_at", 0) > now:
+                return False
+            record.update(owner=owner, expires_at=now + ttl)
+            return True
+
+        return self.update("locks", name, claim)
+
+    def unlock(self, name: str, owner: str) -> bool:
+        def free(record: dict) -> bool:
+            if record.get("owner") != owner:
+                return False
+            record.update(owner=None, expires_at=0)
+            return True
+
+        return self.update("locks", name, free)
+
+
+class MemorySharedState(SharedState):
+    """Process-local records; one lock serialises all updates."""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: dict[tuple[str, str], tuple[dict, Optional[float]]] = {}  # -> (value, expires_at)
+
+    def _live_locked(self, namespace: str, key: str, now: float) -> Optional[dict]:
+        entry = self._records.get((namespace, key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._records[(namespace, key)]
+            return None
+        return value
+
+    def update(self, namespace, key, fn, default=None, ttl=None):
+        with self._lock:
+            now = time.time()
+            current = self._live_locked(namespace, key, now)
+            # Work on a copy, so a failing fn leaves the record as it was (like a rollback)
+            record = copy.deepcopy(current) if current is not None else (default() if default else {})
+            result = fn(record)
+            self._records[(namespace, key)] = (record, now + ttl if ttl is not None else None)
+            return result
+
+    def get(self, namespace, key):
+        with self._lock:
+            value = self._live_locked(namespace, key, time.time())
+            return copy.deepcopy(value) if value is not None else None
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._records.pop((namespace, key), None)
+
+    def items(self, namespace):
+        with self._lock:
+            now = time.time()
+            keys = [k for ns, k in self._records if ns == namespace]
+            return {k: copy.deepcopy(v) for k in keys if (v := self._live_locked(namespace, k, now)) is not None}
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._records.clear()
+            else:
+                for key in [key for key in self._records if key[0] == namespace]:
+                    del self._records[key]
+
+
+class SQLiteSharedState(SharedState):
+    """Records shared between processes through a SQLite file (one row per namespace and key)."""
+
+    backend = "sqlite"
+    # Expired rows are deleted every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._fallback = MemorySharedState()
+        self._failing = False
+        self._writes = 0
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; autocommit mode so transactions are explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _run(self, operation: Callable[[sqlite3.Connection], object], fallback: Callable[[SharedState], object]):
+        try:
+            result = operation(self._connect())
+        except sqlite3.Error as e:
+            if not self._failing:
+                self._failing = True
+                logger.warning(f"⚠️ Shared state {self.path} unavailable ({e}); using per-process state.")
+            return fallback(self._fallback)
+        if self._failing:
+            self._failing = False
+            logger.info(f"✅ Shared state {self.path} available again.")
+        return result
+
+    def update(self, namespace, key, fn, default=None, ttl=None):
+        def operation(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT value FROM shared_state WHERE namespace = ? AND key = ? "
+                    "AND (expires_at IS NULL OR expires_at > ?)", (namespace, key, now),
+                ).fetchone()
+                record = json.loads(row[0]) if row else (default() if default else {})
+                result = fn(record)
+                conn.execute(
+                    "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(record), now + ttl if ttl is not None else None),
+                )
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return self._run(operation, lambda store: store.update(namespace, key, fn, default, ttl))
+
+    def get(self, namespace, key):
+        def operation(conn: sqlite3.Connection):
+            row = conn.execute(
+                "SELECT value FROM shared_state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)", (namespace, key, time.time()),
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+
+        return self._run(operation, lambda store: store.get(namespace, key))
+
+    def delete(self, namespace, key):
+        self._run(
+            lambda conn: conn.execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key)),
+            lambda store: store.delete(namespace, key),
+        )
+
+    def items(self, namespace):
+        def operation(conn: sqlite3.Connection):
+            rows = conn.execute(
+                "SELECT key, value FROM shared_state WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)", (namespace, time.time()),
+            ).fetchall()
+            return {key: json.loads(value) for key, value in rows}
+
+        return self._run(operation, lambda store: store.items(namespace))
+
+    def clear(self, namespace=None):
+        self._fallback.clear(namespace)
+        if namespace is None:
+            self._run(lambda conn: conn.execute("DELETE FROM shared_state"), lambda store: None)
+        else:
+            self._run(lambda conn: conn.execute("DELETE FROM shared_state WHERE namespace = ?", (namespace,)),
+                      lambda store: None)
+
+
+@lru_cache(maxsize=None)
+def get_shared_state(backend: str = SHARED_STATE_BACKEND, path: str = SHARED_STATE_DB) -> SharedState:
+    """One store per (backend, path) in this process."""
+    if backend == "sqlite":
+        try:
+            store = SQLiteSharedState(path)
+            logger.info(f"🔗 Sharing worker state through {path}")
+            return store
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Can't open shared state {path} ({e}); using per-process state.")
+    elif backend != "memory":
+        logger.warning(f"⚠️ Unknown SHARED_STATE_BACKEND '{backend}'; using per-process state.")
+    return MemorySharedState()
+
+
+# Singleton instance shared across all requests in the process lifetime
+shared_state = get_shared_state()
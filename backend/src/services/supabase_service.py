@@ -1,17 +1,57 @@
 from dotenv import load_dotenv
 import os
 import logging
-from supabase import create_client, Client
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+from src.configs.config import SUPABASE_BACKEND
+from src.utils.deadline import check_deadline, current_deadline
+from src.utils.metrics import metrics, timed
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+DB_LATENCY = metrics.histogram(
+    "supabase_request_duration_seconds", "Supabase calls made through SupabaseService.", ["operation", "outcome"]
+)
+FENCED_WRITES_DROPPED = metrics.counter(
+    "learning_space_fenced_writes_dropped", "Workflow writes dropped because the run was over.", ["reason"]
+)
+
+# Ids per `in_()` query; each id is ~40 characters of URL
+IN_QUERY_CHUNK = 100
+
+# Run whose writes the current context makes (follows node threads like the deadline does)
+_fenced_run_id: ContextVar[Optional[str]] = ContextVar("fenced_run_id", default=None)
+
+
+@contextmanager
+def run_write_scope(run_id: str):
+    """
+    Fence learning_space writes made in this block to the run holding the
+    lease: they only apply while the row's run_id is still `run_id` and the
+    writer's deadline hasn't run out. A node that outlived its budget, or a
+    run that was finished or taken over, can't overwrite newer output.
+    """
+    token = _fenced_run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _fenced_run_id.reset(token)
+
 
 class SupabaseService:
     _instance = None
     _client = None
+    _client_lock = threading.Lock()
     bucket_name = 'learning-sources'
 
     def __new__(cls):
@@ -19,12 +59,22 @@ class SupabaseService:
             cls._instance = super(SupabaseService, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self):
-        if self._client is None:
-            self._initialize_client()
+    def connect(self) -> "Client":
+        """
+        Create the client now rather than on the first query. Called from the
+        app's lifespan, so importing this module stays cheap (scripts and
+        workers that never touch the database don't pay for it).
+        """
+        return self.client
 
     def _initialize_client(self):
         """Initialize Supabase client"""
+        if SUPABASE_BACKEND == "memory":
+            from src.services.memory_supabase import InMemorySupabaseClient
+            self._client = InMemorySupabaseClient()
+            logger.info("Supabase client replaced by in-memory stand-in (SUPABASE_BACKEND=memory)")
+            return
+
         try:
             # FIX: Use the correct environment variable names
             url = os.environ.get("SUPABASE_URL") or os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
@@ -34,6 +84,7 @@ class SupabaseService:
                 raise ValueError(
                     "Supabase environment variables are required")
 
+            from supabase import create_client
             self._client = create_client(url, key)
             logger.info("Supabase client initialized successfully")
 
@@ -42,12 +93,15 @@ class SupabaseService:
             raise
 
     @property
-    def client(self) -> Client:
-        """Get the Supabase client instance"""
+    def client(self) -> "Client":
+        """Get the Supabase client instance (created on first use)"""
         if self._client is None:
-            self._initialize_client()
+            with self._client_lock:
+                if self._client is None:
+                    self._initialize_client()
         return self._client
 
+    @timed(DB_LATENCY, operation="update_learning_space")
     def update_learning_space(self, learning_space_id: str, updates: dict):
         """Update learning space with given data - with error handling"""
         logger.info(f'Updating learning space {learning_space_id}')
@@ -57,7 +111,8 @@ class SupabaseService:
             valid_columns = [
               'summary_notes', 'audio_script', 'recommendations', 
               'quiz', 'audio_overview', 'updated_at',
-              'language', 'status', 'pdf_source', 'audio_source', 'flashcards'
+              'language', 'status', 'pdf_source', 'audio_source', 'flashcards',
+              'artifact_fingerprints'
         ]
         
         # Filter updates to only include valid columns
@@ -72,14 +127,33 @@ class SupabaseService:
                 logger.warning(f"No valid columns to update for learning_space {learning_space_id}")
                 return None
         
+            run_id = _fenced_run_id.get()
+            deadline = current_deadline()
+            if run_id is not None and deadline is not None and deadline.expired:
+                FENCED_WRITES_DROPPED.labels("deadline").inc()
+                logger.warning(
+                    f"⌛ Not writing {list(valid_updates.keys())} to {learning_space_id}: "
+                    f"run {run_id[:8]} is out of time"
+                )
+                return None
+
             logger.info(f"📝 Updating learning_space {learning_space_id} with columns: {list(valid_updates.keys())}")
-            response = (
+            query = (
                 self.client
                 .table("learning_space")
                 .update(valid_updates)
                 .eq("id", learning_space_id)
-                .execute()
             )
+            if run_id is not None:
+                query = query.eq("run_id", run_id)
+            response = query.execute()
+            if run_id is not None and not response.data:
+                FENCED_WRITES_DROPPED.labels("lease").inc()
+                logger.warning(
+                    f"🔓 Not writing {list(valid_updates.keys())} to {learning_space_id}: "
+                    f"run {run_id[:8]} no longer holds the lease"
+                )
+                return None
             logger.info(f"Successfully updated learning space {learning_space_id}")
             return response
         
@@ -88,8 +162,10 @@ class SupabaseService:
         # Return None instead of raising exception to prevent crashes
             return None
 
+    @timed(DB_LATENCY, operation="get_student_profile")
     def get_student_profile(self, user_id: str):
         """get the student profile"""
+        check_deadline("Supabase read")
         try:
             logger.info(f"Getting student profile for {user_id}")
             response = (
@@ -108,8 +184,10 @@ class SupabaseService:
                 f"Failed to get student profile for {user_id}: {str(e)}")
             return None
 
+    @timed(DB_LATENCY, operation="get_learning_space")
     def get_learning_space(self, space_id: str):
         """get the learning space data"""
+        check_deadline("Supabase read")
         try:
             logger.info(f"Getting learning space for {space_id}")
             response = (
@@ -125,8 +203,199 @@ class SupabaseService:
                 f"Failed to get learning space for {space_id}: {str(e)}")
             return None
 
+    @timed(DB_LATENCY, operation="get_learning_spaces")
+    def get_learning_spaces(self, space_ids: list[str], columns: str = "*") -> dict:
+        """get many learning spaces with `in_()` queries of up to IN_QUERY_CHUNK ids each, keyed by id"""
+        ids = list(dict.fromkeys(i for i in space_ids if i))
+        if not ids:
+            return {}
+        check_deadline("Supabase read")
+        logger.info(f"Getting {len(ids)} learning spaces in {-(-len(ids) // IN_QUERY_CHUNK)} query(ies)")
+        rows = {}
+        # Ids go into the URL, so long lists are split to stay under PostgREST's URL limit
+        for start in range(0, len(ids), IN_QUERY_CHUNK):
+            chunk = ids[start:start + IN_QUERY_CHUNK]
+            try:
+                response = (
+                    self.client
+                    .table("learning_space")
+                    .select(_with_id(columns))
+                    .in_("id", chunk)
+                    .execute()
+                )
+                rows.update((row["id"], row) for row in (response.data or []))
+            except Exception as e:
+                logger.error(
+                    f"Failed to get learning spaces {chunk}: {str(e)}")
+        return rows
+
+    @timed(DB_LATENCY, operation="get_user_learning_spaces")
+    def get_user_learning_spaces(self, user_id: str, columns: str = "id") -> list:
+        """get all learning spaces owned by a user with a single query"""
+        check_deadline("Supabase read")
+        try:
+            logger.info(f"Getting learning spaces for user {user_id}")
+            response = (
+                self.client
+                .table("learning_space")
+                .select(_with_id(columns))
+                .eq("user_id", user_id)
+                .execute()
+            )
+            return response.data or []
+        except Exception as e:
+            logger.error(
+                f"Failed to get learning spaces for user {user_id}: {str(e)}")
+            return []
+
+    @timed(DB_LATENCY, operation="reset_stale_generating")
+    def reset_stale_generating(self, cutoff_iso: str) -> list:
+        """Flip spaces stuck in 'generating' since before `cutoff_iso` to 'failed'"""
+        try:
+            response = (
+                self.client
+                .table("learning_space")
+                .update({"status": "failed", "run_id": None, "lease_expires_at": None})
+                .eq("status", "generating")
+                .lt("updated_at", cutoff_iso)
+                .execute()
+            )
+            return [row["id"] for row in (response.data or [])]
+        except Exception as e:
+            logger.error(f"Failed to reset stale generating spaces: {str(e)}")
+            return []
+
+    @timed(DB_LATENCY, operation="acquire_run_lease")
+    def acquire_run_lease(self, space_id: str, run_id: str, lease_seconds: float):
+        """Claim the space for one run: a single conditional update, so only one caller can win.
+        True if claimed, False if another run holds it (or the space is gone), None on error"""
+        now = datetime.now(timezone.utc)
+        try:
+            response = (
+                self.client
+                .table("learning_space")
+                .update({
+                    "status": "generating",
+                    "run_id": run_id,
+                    "lease_expires_at": (now + timedelta(seconds=lease_seconds)).isoformat(),
+                    "updated_at": now.isoformat(),
+                })
+                .eq("id", space_id)
+                .or_(f'status.is.null,status.neq.generating,lease_expires_at.lt."{now.isoformat()}"')
+                .execute()
+            )
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Failed to acquire run lease for {space_id}: {str(e)}")
+            return None
+
+    @timed(DB_LATENCY, operation="renew_run_lease")
+    def renew_run_lease(self, space_id: str, run_id: str, lease_seconds: float):
+        """Extend our lease. True if renewed, False if another run holds it, None on error"""
+        now = datetime.now(timezone.utc)
+        try:
+            response = (
+                self.client
+                .table("learning_space")
+                .update({
+                    "lease_expires_at": (now + timedelta(seconds=lease_seconds)).isoformat(),
+                    "updated_at": now.isoformat(),
+                })
+                .eq("id", space_id)
+                .eq("run_id", run_id)
+                .eq("status", "generating")
+                .execute()
+            )
+            return bool(response.data)
+        except Exception as e:
+            logger.warning(f"Failed to renew run lease for {space_id}: {str(e)}")
+            return None
+
+    @timed(DB_LATENCY, operation="release_run_lease")
+    def release_run_lease(self, space_id: str, run_id: str, status: str) -> bool:
+        """Set the final status, but only if this run still holds the lease"""
+        try:
+            response = (
+                self.client
+                .table("learning_space")
+                .update({"status": status, "run_id": None, "lease_expires_at": None})
+                .eq("id", space_id)
+                .eq("run_id", run_id)
+                .execute()
+            )
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Failed to release run lease for {space_id}: {str(e)}")
+            return False
+
+    @timed(DB_LATENCY, operation="get_run_lease")
+    def get_run_lease(self, space_id: str):
+        """status, run_id and lease expiry of a space - a cheap read for duplicate invokes"""
+        check_deadline("Supabase read")
+        try:
+            response = (
+                self.client
+                .table("learning_space")
+                .select("status, run_id, lease_expires_at")
+                .eq("id", space_id)
+                .execute()
+            )
+            return response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Failed to get run lease for {space_id}: {str(e)}")
+            return None
+
+    @timed(DB_LATENCY, operation="get_doubt_messages")
+    def get_doubt_messages(self, space_id: str, user_id: str, columns: str, limit: int,
+                           before: tuple | None = None, after: tuple | None = None):
+        """
+        One page of a doubt chat, keyset-paginated on (created_at, id): the newest
+        `limit` messages before the `before` key, or the oldest `limit` after the
+        `after` key. Rows come back oldest first; None on error
+        """
+        newest_first = after is None
+        try:
+            query = (
+                self.client
+                .table("doubt_messages")
+                .select(columns)
+                .eq("learning_space_id", space_id)
+                .eq("user_id", user_id)
+            )
+            key, op = (after, "gt") if after else (before, "lt")
+            if key:
+                created_at, message_id = key
+                query = query.or_(
+                    f'created_at.{op}."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.{op}."{message_id}")'
+                )
+            response = (
+                query
+                .order("created_at", desc=newest_first)
+                .order("id", desc=newest_first)
+                .limit(limit)
+                .execute()
+            )
+            rows = response.data or []
+            return rows[::-1] if newest_first else rows
+        except Exception as e:
+            logger.error(f"Failed to get doubt messages for {space_id}: {str(e)}")
+            return None
+
+    @timed(DB_LATENCY, operation="log_workflow_run")
+    def log_workflow_run(self, record: dict):
+        """Record per-run timings for observability - never raises"""
+        try:
+            self.client.table("workflow_run_logs").insert([
+                {**record, "created_at": "now()"}
+            ]).execute()
+        except Exception as e:
+            logger.warning(f"Failed to log workflow run: {str(e)}")
+
+    @timed(DB_LATENCY, operation="upload_file")
     def upload_file(self, file_path: str, file_data, content_type: str = 'audio/mpeg'):
         """Upload file to Supabase storage"""
+        check_deadline("Supabase upload")
         try:
             response = (
                 self.client
@@ -145,6 +414,7 @@ class SupabaseService:
             logger.error(f"❌ Failed to upload file: {str(e)}")
             raise e
 
+    @timed(DB_LATENCY, operation="get_public_url")
     def get_public_url(self, file_path: str):
         """Get public URL for a file"""
         try:
@@ -160,5 +430,90 @@ class SupabaseService:
             raise e
 
 
-# FIX: Create and initialize the service immediately
+def _with_id(columns: str) -> str:
+    """Make sure projected reads always carry the primary key."""
+    if columns.strip() == "*":
+        return columns
+    names = [c.strip() for c in columns.split(",") if c.strip()]
+    if "id" not in names:
+        names.insert(0, "id")
+    return ", ".join(names)
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.ids: set[str] = set()
+        self.rows: dict = {}
+        self.done = threading.Event()
+
+
+class LearningSpaceLoader:
+    """
+    DataLoader-style batcher for learning space reads.
+
+    `load()` calls issued from any thread within the same short batch window
+    are merged into a single `in_()` query. Rows are cached for the lifetime
+    of the loader, so create one per bulk job / request rather than sharing
+    a long-lived instance.
+    """
+
+    BATCH_WINDOW_SECONDS = 0.005
+
+    def __init__(self, service: SupabaseService, columns: str = "*"):
+        self._service = service
+        self._columns = columns
+        self._cache: dict = {}
+        self._pending: _PendingBatch | None = None
+        self._lock = threading.Lock()
+
+    def prime(self, space: dict):
+        """Seed the cache with a row that was fetched elsewhere."""
+        if space and space.get("id"):
+            with self._lock:
+                self._cache[space["id"]] = space
+
+    def clear(self, space_id: str):
+        with self._lock:
+            self._cache.pop(space_id, None)
+
+    def load_many(self, space_ids: list[str]) -> list:
+        """Load several spaces at once; missing ids come back as None."""
+        with self._lock:
+            missing = [i for i in space_ids if i not in self._cache]
+        if missing:
+            rows = self._service.get_learning_spaces(missing, self._columns)
+            with self._lock:
+                self._cache.update(rows)
+        with self._lock:
+            return [self._cache.get(i) for i in space_ids]
+
+    def load(self, space_id: str):
+        """Load a single space, coalescing with concurrent callers."""
+        with self._lock:
+            if space_id in self._cache:
+                return self._cache[space_id]
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _PendingBatch()
+            batch.ids.add(space_id)
+
+        if not leader:
+            batch.done.wait()
+            return batch.rows.get(space_id)
+
+        # Let other callers from the same tick join this batch
+        time.sleep(self.BATCH_WINDOW_SECONDS)
+        with self._lock:
+            self._pending = None
+        try:
+            batch.rows = self._service.get_learning_spaces(list(batch.ids), self._columns)
+            with self._lock:
+                self._cache.update(batch.rows)
+        finally:
+            batch.done.set()
+        return batch.rows.get(space_id)
+
+
+# Module-level singleton; the client itself is created on first use
 supabase_service = SupabaseService()
\ No newline at end of file
@@ -4,10 +4,17 @@ import logging
 import os
 import tempfile
 from src.services.supabase_service import supabase_service
+from src.utils.deadline import DeadlineExceeded, call_timeout, check_deadline
+from src.utils.metrics import metrics, timed
+from src.utils.token_budget import clip_chars
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+TTS_LATENCY = metrics.histogram(
+    "tts_synthesis_duration_seconds", "Text-to-speech synthesis calls by provider.", ["provider", "outcome"]
+)
+
 # ── Language maps ──────────────────────────────────────────────────────
 
 # gTTS language codes (fallback)
@@ -32,6 +39,7 @@ ELEVENLABS_LANGUAGE_MAP = {
 
 # ── ElevenLabs helper ──────────────────────────────────────────────────
 
+@timed(TTS_LATENCY, provider="elevenlabs")
 def _generate_elevenlabs_audio(text: str, language: str) -> bytes:
     """
     Calls the ElevenLabs REST API to synthesise speech.
@@ -56,7 +64,7 @@ def _generate_elevenlabs_audio(text: str, language: str) -> bytes:
         "Accept": "audio/mpeg",
     }
     payload = {
-        "text": text[:5000],          # ElevenLabs limit
+        "text": clip_chars(text, 5000),  # ElevenLabs limit (characters, not tokens)
         "model_id": "eleven_multilingual_v2",
         "language_code": lang_code,
         "voice_settings": {
@@ -67,7 +75,7 @@ def _generate_elevenlabs_audio(text: str, language: str) -> bytes:
         },
     }
 
-    with httpx.Client(timeout=60) as client:
+    with httpx.Client(timeout=call_timeout(60)) as client:
         response = client.post(url, headers=headers, json=payload)
         response.raise_for_status()
         return response.content
@@ -75,6 +83,7 @@ def _generate_elevenlabs_audio(text: str, language: str) -> bytes:
 
 # ── gTTS fallback helper ───────────────────────────────────────────────
 
+@timed(TTS_LATENCY, provider="gtts")
 def _generate_gtts_audio(text: str, language: str) -> bytes:
     """Generates audio using gTTS as fallback. Returns raw MP3 bytes."""
     from gtts import gTTS
@@ -90,12 +99,12 @@ def _generate_gtts_audio(text: str, language: str) -> bytes:
     max_chars = 5000
     if len(text) > max_chars:
         logger.warning(f"Text too long ({len(text)} chars), truncating to {max_chars}")
-        text = text[:max_chars]
+        text = clip_chars(text, max_chars)
 
     for try_lang in fallback_chain:
         try:
             logger.info(f"🔊 gTTS generating in language: {try_lang}")
-            tts = gTTS(text=text, lang=try_lang, slow=False)
+            tts = gTTS(text=text, lang=try_lang, slow=False, timeout=call_timeout(60))
             with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp:
                 tts.save(tmp.name)
                 tmp_path = tmp.name
@@ -103,6 +112,8 @@ def _generate_gtts_audio(text: str, language: str) -> bytes:
                 audio_data = f.read()
             os.unlink(tmp_path)
             return audio_data
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.warning(f"⚠️ gTTS failed for '{try_lang}': {e}")
             if try_lang == fallback_chain[-1]:
@@ -130,11 +141,15 @@ def generate_tts(text_input: str, language_code: str) -> dict:
         audio_data = _generate_elevenlabs_audio(text_input, language_code)
         provider_used = "elevenlabs"
         logger.info("✅ ElevenLabs TTS succeeded")
+    except DeadlineExceeded:
+        raise
     except Exception as el_err:
         logger.warning(f"⚠️ ElevenLabs TTS failed ({el_err}), falling back to gTTS...")
 
     # ── 2. Fall back to gTTS ──
     if audio_data is None:
+        # A slow ElevenLabs failure may have used up the caller's budget
+        check_deadline("gTTS fallback")
         try:
             audio_data = _generate_gtts_audio(text_input, language_code)
             provider_used = "gtts"
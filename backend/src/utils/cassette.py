@@ -0,0 +1,179 @@
+# -----------------------------------------------------------------------
+# cassette.py
+# Record / replay of LLM calls made through call_with_fallback().
+#
+#   LLM_CASSETTE_MODE=record  LLM_CASSETTE_PATH=run.jsonl.gz   → live calls, appended to the file
+#   LLM_CASSETTE_MODE=replay  LLM_CASSETTE_PATH=run.jsonl.gz   → served from the file, no network
+#
+# Calls are keyed by task, output schema and the fully rendered prompt, so
+# a replay only matches when our side builds exactly the same request.
+# Entries are gzip-compressed JSON lines holding the prompt, the output,
+# the original wall-clock latency (including retries and fallback) and the
+# provider-reported tokens. Replays sleep for latency × LLM_CASSETTE_LATENCY_SCALE
+# (0 = instant), which separates our own CPU / DB cost from provider latency.
+# -----------------------------------------------------------------------
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Optional, Type
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+from src.configs.config import (
+    LLM_CASSETTE_LATENCY_SCALE, LLM_CASSETTE_MODE, LLM_CASSETTE_ON_MISS, LLM_CASSETTE_PATH,
+)
+from src.utils.deadline import sleep_with_deadline
+from src.utils.tracing import finalize_llm_span, span_exporter, start_span
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recording for this request."""
+
+
+def _render(chain_fn, input_data: dict) -> list:
+    """The exact messages the chain would send, captured with a stand-in model."""
+    captured = chain_fn(RunnableLambda(lambda prompt_value: prompt_value)).invoke(input_data)
+    messages = captured.to_messages() if hasattr(captured, "to_messages") else [captured]
+    return [{"role": getattr(m, "type", "text"), "content": getattr(m, "content", str(m))} for m in messages]
+
+
+def _key(task: str, schema: Optional[Type[BaseModel]], messages: list) -> str:
+    payload = json.dumps([task, schema.__name__ if schema else None, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCassette:
+    def __init__(self, path: str = LLM_CASSETTE_PATH, mode: str = LLM_CASSETTE_MODE,
+                 latency_scale: float = LLM_CASSETTE_LATENCY_SCALE, on_miss: str = LLM_CASSETTE_ON_MISS):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self._lock = threading.Lock()
+        self._entries: Optional[dict[str, list]] = None
+        self._cursor: dict[str, int] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("record", "replay")
+
+    # ── storage ──
+    def _load(self) -> dict[str, list]:
+        if self._entries is None:
+            entries: dict[str, list] = {}
+            try:
+                # Appends create extra gzip members; gzip.open reads them as one stream
+                with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries.setdefault(entry["key"], []).append(entry)
+            except FileNotFoundError:
+                if self.mode == "replay":
+                    logger.warning(f"[Cassette] No cassette at {self.path}; every call will miss.")
+            self._entries = entries
+            logger.info(f"[Cassette] Loaded {sum(len(v) for v in entries.values())} recordings from {self.path}")
+        return self._entries
+
+    def _append(self, entry: dict):
+        with self._lock:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self._load().setdefault(entry["key"], []).append(entry)
+            self.stats["recorded"] += 1
+
+    def _next(self, key: str) -> Optional[dict]:
+        """Recordings of the same request are replayed in order, cycling."""
+        with self._lock:
+            recordings = self._load().get(key)
+            if not recordings:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return recordings[index % len(recordings)]
+
+    # ── record / replay ──
+    def call(self, task: str, chain_fn, input_data: dict, structured_schema: Optional[Type[BaseModel]],
+             live: Callable[[], object]):
+        messages = _render(chain_fn, input_data)
+        key = _key(task, structured_schema, messages)
+
+        if self.mode == "replay":
+            entry = self._next(key)
+            if entry is not None:
+                return self._replay(task, entry, structured_schema)
+            with self._lock:
+                self.stats["missed"] += 1
+            if self.on_miss != "live":
+                raise CassetteMiss(f"No recording for task '{task}' (key {key[:12]}) in {self.path}")
+            logger.warning(f"[Cassette] Miss for task '{task}' — calling the provider live.")
+            return live()
+
+        return self._record(task, key, messages, structured_schema, live)
+
+    def _record(self, task, key, messages, structured_schema, live):
+        start = time.perf_counter()
+        with start_span("cassette.record", task=task) as span:
+            result = live()
+            latency = time.perf_counter() - start
+            # Token usage and provider come from the llm.call spans of this call
+            attempts = [s for s in span_exporter.spans(name="llm.call") if s["parent_span_id"] == span.span_id]
+        served_by = next((a["attributes"] for a in reversed(attempts) if a["status"] == "ok"), {})
+
+        if isinstance(result, BaseModel):
+            output = {"kind": "structured", "value": result.model_dump(mode="json")}
+        else:
+            output = {
+                "kind": "message",
+                "content": getattr(result, "content", str(result)),
+                "usage_metadata": getattr(result, "usage_metadata", None),
+                "response_metadata": getattr(result, "response_metadata", None) or {},
+            }
+        self._append({
+            "key": key,
+            "task": task,
+            "schema": structured_schema.__name__ if structured_schema else None,
+            "messages": messages,
+            "output": output,
+            "latency": round(latency, 4),
+            "provider": served_by.get("provider"),
+            "model": served_by.get("model"),
+            "fallback": bool(served_by.get("fallback")),
+            "attempts": len(attempts),
+            "input_tokens": sum(a["attributes"].get("input_tokens", 0) for a in attempts),
+            "output_tokens": sum(a["attributes"].get("output_tokens", 0) for a in attempts),
+            "recorded_at": time.time(),
+        })
+        return result
+
+    def _replay(self, task, entry, structured_schema):
+        with start_span("llm.call", task=task, provider=entry.get("provider"), model=entry.get("model"),
+                        fallback=entry.get("fallback"), replayed=True) as span:
+            delay = entry["latency"] * self.latency_scale
+            if delay > 0:
+                sleep_with_deadline(delay, "replayed LLM latency")
+            span.set(input_tokens=entry.get("input_tokens", 0), output_tokens=entry.get("output_tokens", 0))
+            finalize_llm_span(span, ok=True)
+        with self._lock:
+            self.stats["replayed"] += 1
+
+        output = entry["output"]
+        if output["kind"] == "structured":
+            if structured_schema is None:
+                raise CassetteMiss(f"Recording for task '{task}' is structured but no schema was requested")
+            return structured_schema.model_validate(output["value"])
+        return AIMessage(
+            content=output["content"],
+            usage_metadata=output.get("usage_metadata"),
+            response_metadata=output.get("response_metadata") or {},
+        )
+
+
+llm_cassette = LLMCassette()
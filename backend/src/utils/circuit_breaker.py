@@ -0,0 +1,136 @@
+# -----------------------------------------------------------------------
+# circuit_breaker.py
+# Per-provider circuit breaker used by model_router.call_with_fallback().
+#
+#   closed     → calls go through; failures are counted in a rolling window
+#   open       → FAILURE_THRESHOLD failures in WINDOW_SECONDS: provider is
+#                bypassed (DEGRADED) for COOLDOWN_SECONDS
+#   half-open  → after the cooldown exactly one caller gets a probe; everyone
+#                else keeps bypassing until the probe succeeds (closed) or
+#                fails (open again). A probe that never reports back frees
+#                its slot after PROBE_TIMEOUT_SECONDS.
+#
+# Every transition is one atomic read-modify-write on the provider's record
+# in src/services/shared_state.py (namespace "circuit"). With the sqlite
+# backend all workers on the host share the record, so one worker's
+# failures trip the breaker for all of them.
+# -----------------------------------------------------------------------
+
+import logging
+import time
+from typing import Callable
+from src.configs.config import (
+    CIRCUIT_BREAKER_DB, CIRCUIT_BREAKER_STORE, CIRCUIT_COOLDOWN_SECONDS, CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_PROBE_TIMEOUT_SECONDS, CIRCUIT_WINDOW_SECONDS,
+)
+from src.services.shared_state import SharedState, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "circuit"
+
+
+def _initial_state(now: float) -> dict:
+    return {"failures": 0, "window_start": now, "degraded_since": None, "probe_started": None}
+
+
+class ProviderHealthTracker:
+    """
+    Tracks per-provider failure counts.
+    If a provider exceeds FAILURE_THRESHOLD failures within WINDOW_SECONDS,
+    it is marked DEGRADED and bypassed until a half-open probe succeeds.
+    """
+
+    FAILURE_THRESHOLD     = CIRCUIT_FAILURE_THRESHOLD
+    WINDOW_SECONDS        = CIRCUIT_WINDOW_SECONDS
+    COOLDOWN_SECONDS      = CIRCUIT_COOLDOWN_SECONDS
+    PROBE_TIMEOUT_SECONDS = CIRCUIT_PROBE_TIMEOUT_SECONDS
+
+    def __init__(self, store: SharedState | None = None):
+        self._store = store if store is not None else get_shared_state(CIRCUIT_BREAKER_STORE, CIRCUIT_BREAKER_DB)
+
+    def _update(self, provider: str, fn: Callable[[dict], object]):
+        return self._store.update(NAMESPACE, provider, fn, default=lambda: _initial_state(time.time()))
+
+    def allow_request(self, provider: str) -> bool:
+        """
+        Gate for a real call. True while closed; after the cooldown it is
+        True for exactly one caller (the probe), who must then report
+        record_success() or record_failure().
+        """
+        def transition(s: dict) -> bool:
+            if s["degraded_since"] is None:
+                return True
+            now = time.time()
+            if now - s["degraded_since"] <= self.COOLDOWN_SECONDS:
+                return False
+            if s["probe_started"] is not None and now - s["probe_started"] <= self.PROBE_TIMEOUT_SECONDS:
+                return False
+            s["probe_started"] = now
+            logger.info(
+                f"[CircuitBreaker] 🟡 Provider '{provider}' cooldown elapsed "
+                f"({now - s['degraded_since']:.0f}s). Allowing one probe request."
+            )
+            return True
+
+        return self._update(provider, transition)
+
+    def is_degraded(self, provider: str) -> bool:
+        """Read-only check: True while calls to `provider` would be bypassed."""
+        # A plain read, so checks don't queue behind other workers' writes
+        s = self._store.get(NAMESPACE, provider)
+        if s is None or s["degraded_since"] is None:
+            return False
+        now = time.time()
+        if now - s["degraded_since"] <= self.COOLDOWN_SECONDS:
+            return True
+        return s["probe_started"] is not None and now - s["probe_started"] <= self.PROBE_TIMEOUT_SECONDS
+
+    def record_failure(self, provider: str):
+        def transition(s: dict):
+            now = time.time()
+            if s["probe_started"] is not None:
+                # Failed probe: straight back to open for another cooldown
+                s.update(degraded_since=now, probe_started=None)
+                logger.warning(f"[CircuitBreaker] 🔴 Probe to '{provider}' failed; still DEGRADED.")
+                return
+            if s["degraded_since"] is not None:
+                return  # a call that started before the breaker opened
+
+            # Reset window if expired
+            if now - s["window_start"] > self.WINDOW_SECONDS:
+                s.update(failures=0, window_start=now)
+            s["failures"] += 1
+            if s["failures"] >= self.FAILURE_THRESHOLD:
+                s["degraded_since"] = now
+                logger.warning(
+                    f"[CircuitBreaker] 🔴 Provider '{provider}' marked DEGRADED after "
+                    f"{s['failures']} failures in {self.WINDOW_SECONDS:.0f}s."
+                )
+
+        self._update(provider, transition)
+
+    def record_success(self, provider: str):
+        def transition(s: dict):
+            if s["degraded_since"] is not None:
+                logger.info(f"[CircuitBreaker] 🟢 Provider '{provider}' recovered.")
+            # Reset failure counter on success
+            s.update(_initial_state(time.time()))
+
+        self._update(provider, transition)
+
+    def snapshot(self) -> dict[str, dict]:
+        """Read-only view for metrics: {provider: {"degraded": bool, "failures": int}}."""
+        states = self._store.items(NAMESPACE)
+        return {
+            provider: {"degraded": s["degraded_since"] is not None, "failures": s["failures"]}
+            for provider, s in states.items()
+        }
+
+    def reset(self):
+        """Close every breaker (benchmarks and tests)."""
+        self._store.clear(NAMESPACE)
+
+
+# Singleton instance shared across all requests in the process lifetime
+health_tracker = ProviderHealthTracker()
@@ -0,0 +1,215 @@
+# -----------------------------------------------------------------------
+# deadline.py
+# Wall-clock budgets with cooperative cancellation.
+#
+# A Deadline is bound to the current context (contextvars), so it follows
+# the work into LangGraph's worker threads. Long-running helpers such as
+# invoke_with_retry() check it before each attempt and sleep on it instead
+# of time.sleep(), which lets a timed-out node stop retrying promptly.
+#
+# DeadlineMiddleware gives every HTTP request a Deadline (per-route default,
+# shortened by an X-Request-Timeout header) and cancels it when the client
+# disconnects, so LLM retries, fallbacks, DB reads and TTS stop early.
+# -----------------------------------------------------------------------
+
+import asyncio
+import logging
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from src.configs.config import route_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the current budget is spent or the work was cancelled."""
+
+
+class Deadline:
+    """A point in time after which work should stop, optionally nested in a parent."""
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        self._parent = parent
+        self._cancelled = threading.Event()
+        self._released = False
+        expires_at = time.monotonic() + seconds if seconds is not None else None
+        if parent is not None and parent.expires_at is not None:
+            expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+
+    def remaining(self) -> float:
+        """Seconds left (inf when unbounded, 0 once cancelled or expired)."""
+        if self.cancelled:
+            return 0.0
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self):
+        if not self._released:
+            self._cancelled.set()
+
+    def release(self):
+        """Stop bounding work, e.g. once a response is sent and only background tasks remain."""
+        self._released = True
+        self.expires_at = None
+
+    def check(self, what: str = "operation"):
+        if self.cancelled:
+            raise DeadlineExceeded(f"{what} cancelled")
+        if self.expired:
+            raise DeadlineExceeded(f"{what} exceeded its time budget")
+
+    def sleep(self, seconds: float, what: str = "retry wait", reserve: float = 0.0):
+        """
+        Sleep, waking early (and raising) if cancelled or the budget can't
+        cover it plus `reserve` seconds of work afterwards.
+        """
+        if seconds + reserve >= self.remaining():
+            raise DeadlineExceeded(f"{what} of {seconds:.1f}s exceeds remaining budget")
+        if self._cancelled.wait(seconds) or self.cancelled:
+            raise DeadlineExceeded(f"{what} cancelled")
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None, deadline: Optional[Deadline] = None):
+    """
+    Run a block under a budget nested inside the current one.
+    Pass an existing `deadline` to re-enter it (e.g. in a worker thread).
+    """
+    scoped = deadline or Deadline(seconds, parent=current_deadline())
+    token = _current_deadline.set(scoped)
+    try:
+        yield scoped
+    finally:
+        _current_deadline.reset(token)
+
+
+def check_deadline(what: str = "operation"):
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(what)
+
+
+def sleep_with_deadline(seconds: float, what: str = "retry wait", reserve: float = 0.0):
+    deadline = current_deadline()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds, what, reserve)
+
+
+def ensure_budget(seconds: float, what: str = "operation"):
+    """Raise DeadlineExceeded unless at least `seconds` of the current budget are left."""
+    deadline = current_deadline()
+    if deadline is None:
+        return
+    deadline.check(what)
+    if deadline.remaining() < seconds:
+        raise DeadlineExceeded(f"{what} needs {seconds:.1f}s, only {deadline.remaining():.1f}s left")
+
+
+def call_timeout(default: float) -> float:
+    """Timeout for one outbound call: `default`, capped by what's left of the current budget."""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    deadline.check("outbound call")
+    return min(default, deadline.remaining())
+
+
+# ── HTTP requests ──────────────────────────────────────────────────────
+
+def _request_budget(scope) -> Optional[float]:
+    budget = route_timeout(scope.get("path", ""))
+    for name, value in scope.get("headers") or []:
+        if name == b"x-request-timeout":
+            try:
+                requested = float(value)
+            except ValueError:
+                break
+            # Clients may ask for less time than the route allows, never more
+            if requested > 0:
+                budget = min(budget, requested) if budget > 0 else requested
+            break
+    return budget if budget > 0 else None
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware: runs each HTTP request under a Deadline.
+
+    One task is the only reader of the server's `receive`: it forwards body
+    messages to the app and cancels the deadline on http.disconnect. Once the
+    response is complete the deadline is released, so background tasks
+    started by the request aren't bounded (or cancelled) by it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(_request_budget(scope), parent=current_deadline())
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+        response_complete = False
+
+        async def watch_client():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_complete:
+                        logger.info(f"🔌 Client left {scope.get('path')}; cancelling its work.")
+                        deadline.cancel()
+                    disconnected.set()
+                    return
+                await messages.put(message)
+
+        async def receive_from_client():
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            get = asyncio.ensure_future(messages.get())
+            gone = asyncio.ensure_future(disconnected.wait())
+            done, _ = await asyncio.wait({get, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                gone.cancel()
+                return get.result()
+            get.cancel()
+            return {"type": "http.disconnect"}
+
+        async def send_and_track(message):
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+                deadline.release()
+            await send(message)
+
+        watcher = asyncio.ensure_future(watch_client())
+        try:
+            with deadline_scope(deadline=deadline):
+                await self.app(scope, receive_from_client, send_and_track)
+        finally:
+            deadline.release()
+            watcher.cancel()
@@ -0,0 +1,99 @@
+# -----------------------------------------------------------------------
+# embeddings.py
+# Small CPU text embeddings for similarity lookups (e.g. the doubt cache).
+#
+# The default "hashed" embedder needs no model download: word unigrams,
+# word bigrams and character n-grams are hashed into a fixed-size vector
+# (signed feature hashing) and L2-normalized, so cosine similarity is a dot
+# product. It is script-agnostic, which matters for Hindi and other Indic
+# questions, and embeds a question in well under a millisecond.
+#
+# EMBEDDER=sentence-transformers uses EMBEDDING_MODEL (a multilingual
+# MiniLM by default) when that optional package and the model are
+# available locally; otherwise the hashed embedder is used.
+# -----------------------------------------------------------------------
+
+import logging
+import threading
+import unicodedata
+import zlib
+import numpy as np
+from src.configs.config import EMBEDDER, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, case-folded, punctuation and symbols removed, whitespace collapsed."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    # By category rather than \w, which would also drop Indic vowel signs (combining marks)
+    return " ".join("".join(" " if unicodedata.category(ch)[0] in "PS" else ch for ch in text).split())
+
+
+class HashedNgramEmbedder:
+    """Feature-hashing embedder over word and character n-grams."""
+
+    name = "hashed"
+
+    def __init__(self, dim: int = 1024, char_ngrams: tuple = (3, 4, 5)):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    def _features(self, text: str):
+        words = normalize_text(text).split()
+        for word in words:
+            yield "w:" + word, 1.0
+        for left, right in zip(words, words[1:]):
+            yield f"b:{left} {right}", 0.7
+        for word in words:
+            padded = f" {word} "
+            for n in self.char_ngrams:
+                for i in range(max(1, len(padded) - n + 1)):
+                    yield "c:" + padded[i:i + n], 0.3
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    """Wraps a local sentence-transformers model (optional dependency)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, text: str) -> np.ndarray:
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Process-wide embedder, built on first use."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = _build_embedder()
+    return _embedder
+
+
+def _build_embedder():
+    if EMBEDDER == "sentence-transformers":
+        try:
+            embedder = SentenceTransformerEmbedder(EMBEDDING_MODEL)
+            logger.info(f"🧭 Embeddings: sentence-transformers '{EMBEDDING_MODEL}' ({embedder.dim} dims)")
+            return embedder
+        except Exception as e:
+            logger.warning(f"⚠️ sentence-transformers unavailable ({e}); using hashed n-gram embeddings.")
+    return HashedNgramEmbedder()
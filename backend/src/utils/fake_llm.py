@@ -0,0 +1,289 @@
+# -----------------------------------------------------------------------
+# fake_llm.py
+# Deterministic fake LLM providers for offline benchmarks and load tests.
+#
+# With FAKE_LLM=true every builder in model_router._MODEL_BUILDERS (and the
+# Gemini fallback) returns a FakeChatModel instead of a real client. Each
+# provider simulates a latency distribution, random failures and a
+# requests-per-minute limit that answers with 429s, so retries, fallbacks
+# and the circuit breaker behave as they would against the real APIs.
+#
+# Profiles (FAKE_LLM_PROFILE, inline JSON or a file path) override the
+# defaults below per provider, e.g.
+#   {"default": {"error_rate": 0.02},
+#    "groq": {"latency": {"dist": "lognormal", "median_ms": 400, "sigma": 0.3},
+#             "rate_limit_rpm": 30}}
+# -----------------------------------------------------------------------
+
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import typing
+from collections import deque
+from typing import Any, List, Optional, Type
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+from src.configs.config import FAKE_LLM_PROFILE, FAKE_LLM_SEED, FAKE_LLM_TIME_SCALE
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PROFILE = {
+    "latency": {"dist": "lognormal", "median_ms": 1200, "sigma": 0.35},
+    "ms_per_output_token": 0.0,   # extra latency per generated token
+    "output_tokens": 300,         # size of unstructured replies
+    "list_items": 5,              # items generated for list fields in structured output
+    "error_rate": 0.0,            # share of calls failing with a 503
+    "rate_limit_rpm": None,       # calls per minute before 429s (None = unlimited)
+}
+
+# Rough shape of the real providers; override with FAKE_LLM_PROFILE
+_PROVIDER_DEFAULTS = {
+    "groq":     {"latency": {"dist": "lognormal", "median_ms": 600,  "sigma": 0.3}},
+    "mistral":  {"latency": {"dist": "lognormal", "median_ms": 1500, "sigma": 0.35}},
+    "deepseek": {"latency": {"dist": "lognormal", "median_ms": 2500, "sigma": 0.4}},
+    "gemini":   {"latency": {"dist": "lognormal", "median_ms": 1800, "sigma": 0.35}},
+}
+
+
+class FakeProviderError(Exception):
+    """Error raised by a fake provider, shaped like an HTTP API error."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _load_overrides() -> dict:
+    if not FAKE_LLM_PROFILE:
+        return {}
+    try:
+        if os.path.exists(FAKE_LLM_PROFILE):
+            with open(FAKE_LLM_PROFILE, encoding="utf-8") as f:
+                return json.load(f)
+        return json.loads(FAKE_LLM_PROFILE)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[FakeLLM] Ignoring unreadable FAKE_LLM_PROFILE: {e}")
+        return {}
+
+
+def resolve_profile(provider: str, overrides: Optional[dict] = None) -> dict:
+    overrides = _load_overrides() if overrides is None else overrides
+    profile: dict = {}
+    for layer in (_DEFAULT_PROFILE, _PROVIDER_DEFAULTS.get(provider, {}),
+                  overrides.get("default", {}), overrides.get(provider, {})):
+        for key, value in layer.items():
+            profile[key] = {**profile.get(key, {}), **value} if isinstance(value, dict) else value
+    return profile
+
+
+class ProviderSimulator:
+    """Shared per-provider state: seeded RNG and the rate-limit window."""
+
+    def __init__(self, provider: str, profile: dict, seed: int = FAKE_LLM_SEED,
+                 time_scale: float = FAKE_LLM_TIME_SCALE):
+        self.provider = provider
+        self.profile = profile
+        self.time_scale = time_scale
+        self._rng = random.Random(f"{seed}:{provider}")
+        self._lock = threading.Lock()
+        self._calls: deque = deque()
+        self.stats = {"calls": 0, "errors": 0, "rate_limited": 0}
+
+    def _sample_latency(self) -> float:
+        spec = self.profile["latency"]
+        dist = spec.get("dist", "fixed")
+        if dist == "lognormal":
+            ms = self._rng.lognormvariate(math.log(spec["median_ms"]), spec.get("sigma", 0.3))
+        elif dist == "uniform":
+            ms = self._rng.uniform(spec["min_ms"], spec["max_ms"])
+        else:
+            ms = spec.get("ms", spec.get("median_ms", 0))
+        return ms / 1000
+
+    def before_call(self, output_tokens: int) -> float:
+        """Decide the outcome of one call. Raises 429/503 errors; returns the latency to simulate."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["calls"] += 1
+            rpm = self.profile.get("rate_limit_rpm")
+            if rpm:
+                window = 60 * self.time_scale
+                while self._calls and now - self._calls[0] > window:
+                    self._calls.popleft()
+                if len(self._calls) >= rpm:
+                    self.stats["rate_limited"] += 1
+                    retry_after = window - (now - self._calls[0])
+                    raise FakeProviderError(
+                        f"429 Too Many Requests: fake {self.provider} rate limit ({rpm} rpm)",
+                        status_code=429, retry_after=round(retry_after, 3),
+                    )
+                self._calls.append(now)
+            latency = self._sample_latency() + output_tokens * self.profile["ms_per_output_token"] / 1000
+            failed = self._rng.random() < self.profile["error_rate"]
+        if failed:
+            # Failures still take (part of) the time a real one would
+            time.sleep(latency * 0.5 * self.time_scale)
+            with self._lock:
+                self.stats["errors"] += 1
+            raise FakeProviderError(f"503 Service Unavailable: fake {self.provider} error", status_code=503)
+        return latency * self.time_scale
+
+
+_simulators: dict[str, ProviderSimulator] = {}
+_simulators_lock = threading.Lock()
+
+
+def get_simulator(provider: str) -> ProviderSimulator:
+    with _simulators_lock:
+        if provider not in _simulators:
+            _simulators[provider] = ProviderSimulator(provider, resolve_profile(provider))
+        return _simulators[provider]
+
+
+def reset_simulators():
+    """Drop simulator state (RNG position, rate windows) so a benchmark run starts fresh."""
+    with _simulators_lock:
+        _simulators.clear()
+
+
+def simulator_stats() -> dict:
+    with _simulators_lock:
+        return {name: dict(sim.stats) for name, sim in _simulators.items()}
+
+
+# ── Fake structured output ─────────────────────────────────────────────
+
+def _fake_value(annotation, name: str, items: int, index: int):
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        non_null = [a for a in args if a is not type(None)]
+        return _fake_value(non_null[0], name, items, index) if non_null else None
+    if origin in (list, List):
+        return [_fake_value(args[0] if args else str, name, items, i) for i in range(items)]
+    if origin is dict:
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation, items, index).model_dump()
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return index + 1
+    if annotation is float:
+        return float(index + 1)
+    return f"{name} {index + 1}"
+
+
+def fake_instance(schema: Type[BaseModel], items: int = 5, index: int = 0) -> BaseModel:
+    """A valid, deterministic instance of `schema` with placeholder values."""
+    values = {}
+    for field_name, field in schema.model_fields.items():
+        if not field.is_required():
+            continue
+        values[field_name] = _fake_value(field.annotation, field_name, items, index)
+    return schema.model_validate(values)
+
+
+def _fake_json_value(schema: dict, defs: dict, name: str, items: int, index: int):
+    """Like _fake_value, for a JSON schema as pydantic emits it."""
+    if "$ref" in schema:
+        return _fake_json_value(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, name, items, index)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return _fake_json_value(options[0], defs, name, items, index) if options else None
+    kind = schema.get("type")
+    if kind == "object":
+        required = schema.get("required", [])
+        return {field: _fake_json_value(sub, defs, field, items, index)
+                for field, sub in schema.get("properties", {}).items() if field in required}
+    if kind == "array":
+        return [_fake_json_value(schema.get("items", {}), defs, name, items, i) for i in range(items)]
+    if kind == "boolean":
+        return True
+    if kind == "integer":
+        return index + 1
+    if kind == "number":
+        return float(index + 1)
+    return f"{name} {index + 1}"
+
+
+def _requested_schemas(messages: List[BaseMessage]) -> Optional[dict]:
+    """A {key: JSON schema} map embedded in the prompt, as the combined study-pack call sends."""
+    decoder = json.JSONDecoder()
+    for message in messages:
+        text = str(message.content)
+        start = text.find('{"')
+        while start != -1:
+            try:
+                value, _ = decoder.raw_decode(text, start)
+            except ValueError:
+                value = None
+            if isinstance(value, dict) and value and all(
+                isinstance(schema, dict) and "properties" in schema for schema in value.values()
+            ):
+                return value
+            start = text.find('{"', start + 1)
+    return None
+
+
+# ── Chat model ─────────────────────────────────────────────────────────
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps like a provider and returns placeholder content with usage metadata."""
+
+    provider: str = "fake"
+    temperature: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return f"fake-{self.provider}"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        simulator = get_simulator(self.provider)
+        output_tokens = simulator.profile["output_tokens"]
+        time.sleep(simulator.before_call(output_tokens))
+
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        input_tokens = (prompt_chars + 3) // 4
+        schemas = _requested_schemas(messages)
+        if schemas:
+            # Prompts that embed JSON schemas get a JSON object matching them
+            items = simulator.profile["list_items"]
+            content = json.dumps({
+                key: _fake_json_value(schema, schema.get("$defs", {}), key, items, 0) for key, schema in schemas.items()
+            })
+        else:
+            words = ("lorem ipsum dolor sit amet consectetur adipiscing elit " * (output_tokens // 8 + 1)).split()
+            content = " ".join(words[:output_tokens])
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+            response_metadata={"model_name": f"fake-{self.provider}"},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, **kwargs: Any):
+        items = get_simulator(self.provider).profile["list_items"]
+        # Goes through _generate so latency, errors and token callbacks still apply
+        return self | RunnableLambda(lambda _message: fake_instance(schema, items))
+
+
+def build_fake_llm(provider: str, temperature: float = 0.1,
+                   structured_schema: Optional[Type[BaseModel]] = None, **_):
+    """Drop-in for the get_*_llm builders in model_router."""
+    llm = FakeChatModel(provider=provider, temperature=temperature)
+    if structured_schema:
+        return llm.with_structured_output(structured_schema)
+    return llm
@@ -0,0 +1,158 @@
+# -----------------------------------------------------------------------
+# intent_classifier.py
+# Task detection for the orchestrator: which task does a free-text request want?
+#
+# Two stages, both local and CPU-only:
+#   1. Rules - one compiled regex (a single pass over the head of the text)
+#      of request cues per task. Strong cues are explicit requests ("quiz
+#      me", "make flashcards", "summarise this"); weak cues are words that
+#      merely mention a task ("question", "notes", "term", "book"). One task
+#      with strong cues and no competitor is decided here.
+#   2. Model - anything else (no cues, competing cues, or only weak cues in
+#      a question like "What is the definition of a term?") goes to a
+#      multinomial logistic regression over the hashed word / character
+#      n-gram features of src/utils/embeddings.py. Weights live in
+#      intent_model.npz, produced by benchmarks/train_intent.py from
+#      labelled examples (benchmarks/intent_data plus exported request logs).
+#
+# Every result carries a confidence. Without the weights file the rules
+# fall back to their old priority order.
+# -----------------------------------------------------------------------
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from src.utils.embeddings import HashedNgramEmbedder
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz")
+
+TASKS = ("chat", "summary", "quiz", "flashcard", "recommendation", "audio", "document_analysis")
+
+# Only the start of the text is scanned: that's where the request is, and a
+# pasted document must not be classified by words deep inside it
+SCAN_CHARS = 600
+MODEL_CHARS = 300
+
+# (task, strength, pattern); strength 2 = explicit request, 1 = mention
+_CUES = [
+    ("quiz", 2, r"quiz(?:zes)?|mcqs?|test me|quiz me|practice (?:test|questions)|multiple[- ]choice|क्विज़?|प्रश्नोत्तरी"),
+    ("quiz", 1, r"questions?|test|exam"),
+    ("flashcard", 2, r"flash ?cards?|फ्लैश ?कार्ड"),
+    ("flashcard", 1, r"terms?|definitions?|glossary|memori[sz]e|revise"),
+    ("summary", 2, r"summari[sz]e|summary|sum up|key points|tl;?dr|short notes|सारांश"),
+    ("summary", 1, r"notes|overview|brief"),
+    ("recommendation", 2, r"recommend(?:ations?|ed)?|suggest (?:some )?(?:books?|resources?|videos?|courses?)|reading list"),
+    ("recommendation", 1, r"resources?|books?|lectures?|articles?|videos?|courses?"),
+    ("audio", 2, r"podcast|audio|aloud|पॉडकास्ट|ऑडियो"),
+    ("audio", 1, r"listen|speak|voice"),
+    ("document_analysis", 2, r"analy[sz]e (?:this|the|my) (?:document|pdf|file|paper|chapter)|extract|this (?:pdf|document)"),
+    ("document_analysis", 1, r"document|pdf|analy[sz]e|analysis"),
+]
+_CUE_INDEX = [(task, strength) for task, strength, _ in _CUES]
+# One capturing group per cue, so match.lastindex says which cue fired
+_AUTOMATON = re.compile(
+    r"\b(?:" + "|".join(f"({pattern})" for _, _, pattern in _CUES) + r")\b", re.IGNORECASE,
+)
+_QUESTION = re.compile(
+    r"^\s*(?:what|why|how|when|where|who|which|whom|whose|is|are|can|does|do|did|explain|क्या|क्यों|कैसे)\b|\?\s*$",
+    re.IGNORECASE,
+)
+
+# The legacy detector's order, for ties when no model is available
+_PRIORITY = ("quiz", "flashcard", "summary", "recommendation", "audio", "document_analysis")
+
+
+@dataclass(frozen=True)
+class IntentResult:
+    task: str
+    confidence: float
+    source: str   # "rules", "model" or "default" (or "hint" when the caller named the task)
+
+
+def rule_scores(text: str) -> dict[str, list[int]]:
+    """{task: [strong cues, weak cues]} found in the head of `text`."""
+    scores: dict[str, list[int]] = {}
+    for match in _AUTOMATON.finditer(text, 0, SCAN_CHARS):
+        task, strength = _CUE_INDEX[match.lastindex - 1]
+        counts = scores.setdefault(task, [0, 0])
+        counts[2 - strength] += 1
+    return scores
+
+
+class IntentModel:
+    """Softmax regression over hashed n-gram features."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: tuple, dim: int):
+        self.weights = weights.astype(np.float32)   # (classes, dim)
+        self.bias = bias.astype(np.float32)
+        self.labels = tuple(labels)
+        self.featurizer = HashedNgramEmbedder(dim=dim)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> Optional["IntentModel"]:
+        try:
+            with np.load(path) as data:
+                return cls(data["weights"], data["bias"], tuple(str(l) for l in data["labels"]), int(data["dim"]))
+        except FileNotFoundError:
+            logger.warning(f"⚠️ Intent model not found at {path}; task detection uses keyword rules only.")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load intent model {path}: {e}")
+        return None
+
+    def save(self, path: str = MODEL_PATH):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            labels=np.array(self.labels), dim=np.array(self.featurizer.dim))
+
+    def probabilities(self, text: str) -> np.ndarray:
+        logits = self.weights @ self.featurizer.embed(text[:MODEL_CHARS]) + self.bias
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+
+class IntentClassifier:
+    def __init__(self, model: Optional[IntentModel] = None, load_model: bool = True):
+        self._model = model
+        self._load_model = load_model and model is None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Optional[IntentModel]:
+        if self._load_model:
+            with self._lock:
+                if self._load_model:
+                    self._model = IntentModel.load()
+                    self._load_model = False
+        return self._model
+
+    def classify(self, content: str) -> IntentResult:
+        text = content or ""
+        if not text.strip():
+            return IntentResult("chat", 0.5, "default")
+        scores = rule_scores(text)
+        strong = [task for task, (s, _) in scores.items() if s]
+        if len(strong) == 1:
+            # An explicit request for one task; the more cues, the surer
+            return IntentResult(strong[0], round(min(0.99, 0.85 + 0.05 * scores[strong[0]][0]), 3), "rules")
+
+        model = self.model
+        if model is not None:
+            probabilities = model.probabilities(text)
+            best = int(probabilities.argmax())
+            return IntentResult(model.labels[best], round(float(probabilities[best]), 3), "model")
+
+        # No model: the old keyword priority, over strong cues first
+        candidates = strong or ([] if _QUESTION.search(text) else list(scores))
+        for task in _PRIORITY:
+            if task in candidates:
+                return IntentResult(task, 0.5, "rules")
+        return IntentResult("chat", 0.5, "default")
+
+
+intent_classifier = IntentClassifier()
@@ -2,21 +2,38 @@ import time
 import random
 import logging
 from typing import Any, Callable, TypeVar, Generic
+from src.configs.config import LLM_MIN_ATTEMPT_SECONDS, RETRY_AFTER_MAX_SECONDS
+from src.utils.deadline import DeadlineExceeded, check_deadline, sleep_with_deadline
+from src.utils.retry_policy import acquire_retry, classify_error, provider_retry_budget
+from src.utils.token_budget import count_tokens
+from src.utils.tracing import record_retry
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
 
+
+def estimate_tokens(text: str) -> int:
+    """Provider-agnostic token estimate (script-aware, see token_budget.py) for logging and comparisons."""
+    return count_tokens(text)
+
+
 def invoke_with_retry(
     chain_invoke_fn: Callable[..., T],
     input_data: dict,
     max_retries: int = 5,
     initial_delay: float = 2.0,
     max_delay: float = 30.0,
-    backoff_factor: float = 2.0
+    backoff_factor: float = 2.0,
+    provider: str = "unknown",
 ) -> T:
     """
     Invokes a LangChain chain with exponential backoff and jitter.
+
+    Errors are classified by exception type and HTTP status (see
+    retry_policy.classify_error); a provider's Retry-After replaces the
+    backoff delay. Each retry must fit the per-request and per-provider
+    retry budgets.
     
     Args:
         chain_invoke_fn: The invoke function of the chain/model.
@@ -25,46 +42,60 @@ def invoke_with_retry(
         initial_delay: Initial delay in seconds.
         max_delay: Maximum delay in seconds.
         backoff_factor: Factor by which the delay increases.
+        provider: Provider being called, for retry budgets and metrics.
         
     Returns:
         The result of the chain invocation.
         
     Raises:
         Exception: The last exception encountered if all retries fail.
+        DeadlineExceeded: If the current deadline is spent or cancelled.
     """
     delay = initial_delay
-    last_exception = None
+    provider_retry_budget.record_call(provider)
 
     for i in range(max_retries + 1):
+        check_deadline("LLM call")
         try:
             return chain_invoke_fn(input_data)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            last_exception = e
-            error_str = str(e).lower()
-            
-            # Detect "limit: 0" which means no access at all (Gemini specific)
-            if "limit: 0" in error_str:
-                logger.error(f"❌ Quota is 0 for this model. Failing immediately.")
+            decision = classify_error(e)
+
+            if not decision.retryable:
+                logger.error(f"❌ Unrecoverable LLM error ({decision.reason}): {str(e)}")
                 raise e
-                
-            # For most API errors (429, 5xx, timeouts), we should retry
-            # Some client errors like 400 (Bad Request) or 401 (Unauthorized) shouldn't be retried
-            if "400" in error_str or "401" in error_str or "403" in error_str:
-                logger.error(f"❌ Unrecoverable LLM error (auth/bad request): {str(e)}")
+
+            if i >= max_retries:
+                logger.error(f"❌ LLM Error hit and exhausted all {max_retries} retries.")
                 raise e
-                
-            if i < max_retries:
-                # Apply jitter to the delay
-                jitter = random.uniform(0, 0.1 * delay)
-                sleep_time = delay + jitter
-                
-                logger.warning(f"⚠️ LLM Error hit ({str(e)[:50]}...). Retry {i+1}/{max_retries} in {sleep_time:.2f}s...")
-                time.sleep(sleep_time)
-                
-                # Increase delay for next retry
-                delay = min(delay * backoff_factor, max_delay)
+
+            if decision.retry_after is not None:
+                if decision.retry_after > RETRY_AFTER_MAX_SECONDS:
+                    logger.error(f"❌ '{provider}' asked us to retry in {decision.retry_after:.0f}s; giving up.")
+                    raise e
+                # Small jitter so callers throttled together don't return together
+                sleep_time = decision.retry_after + random.uniform(0, 0.1 * max(decision.retry_after, 1.0))
             else:
-                logger.error(f"❌ LLM Error hit and exhausted all {max_retries} retries.")
+                # Apply jitter to the delay
+                sleep_time = delay + random.uniform(0, 0.1 * delay)
+
+            if not acquire_retry(provider, decision.reason):
+                logger.error(f"❌ Retry budget spent; not retrying '{provider}' ({decision.reason}).")
+                raise e
+
+            logger.warning(
+                f"⚠️ LLM Error hit ({decision.reason}: {str(e)[:50]}...). "
+                f"Retry {i+1}/{max_retries} in {sleep_time:.2f}s..."
+            )
+            record_retry(e, i + 1, sleep_time, decision.reason)
+            try:
+                # Only wait if there'll still be time for the attempt after it
+                sleep_with_deadline(sleep_time, "LLM retry wait", reserve=LLM_MIN_ATTEMPT_SECONDS)
+            except DeadlineExceeded:
+                logger.error("❌ No time budget left for another LLM retry.")
                 raise e
 
-    raise last_exception
+            # Increase delay for next retry
+            delay = min(delay * backoff_factor, max_delay)
@@ -0,0 +1,362 @@
+# -----------------------------------------------------------------------
+# metrics.py
+# In-process metrics (counters, gauges, histograms) rendered in the
+# Prometheus text exposition format at GET /metrics.
+#
+# Hot-path cost is one dict lookup for the label set plus a short locked
+# update (see benchmarks/bench_metrics.py). Gauges that describe existing
+# state (jobs in flight, circuit breaker states, queue depths) are read
+# through callbacks at scrape time, so nothing is tracked twice.
+# -----------------------------------------------------------------------
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Iterable, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers fast DB reads up to long LLM / TTS calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    """A named metric family; subclasses define the per-label-set child."""
+
+    kind = ""
+    sample_suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Read at scrape time instead of tracking values here: returns a number
+        # (unlabelled) or a {label_values_tuple: number} dict
+        self.callback = callback
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **labelvalues):
+        """Child for one label set. Cache the result on very hot paths."""
+        key = values if values else tuple(labelvalues.get(n, "") for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in key), self._new_child())
+                self._children.setdefault(key, child)
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child holding the value(s) of one label set."""
+
+    def _samples(self) -> Iterable[tuple[str, tuple, str, float]]:
+        if self.callback is not None:
+            yield from self._callback_samples()
+            return
+        seen = set()
+        for key, child in list(self._children.items()):
+            if id(child) in seen:
+                continue
+            seen.add(id(child))
+            yield from child.samples(self.name, tuple(str(v) for v in key))
+
+    def _callback_samples(self):
+        try:
+            observed = self.callback()
+        except Exception:
+            return
+        name = self.name + self.sample_suffix
+        if not isinstance(observed, dict):
+            yield name, (), "", float(observed)
+            return
+        for key, value in observed.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield name, tuple(str(v) for v in key), "", float(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for sample_name, values, extra, value in self._samples():
+            lines.append(f"{sample_name}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+# ── Counter ────────────────────────────────────────────────────────────
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, values):
+        yield f"{name}_total", values, "", self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    sample_suffix = "_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+# ── Gauge ──────────────────────────────────────────────────────────────
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def samples(self, name, values):
+        yield name, values, "", self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+# ── Histogram ──────────────────────────────────────────────────────────
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield f"{name}_bucket", values, f'le="{_format_value(bound)}"', cumulative
+        yield f"{name}_sum", values, "", total
+        yield f"{name}_count", values, "", cumulative
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+# ── Registry ───────────────────────────────────────────────────────────
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        # Same name and type returns the existing metric, so modules can share one
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, cls):
+                    raise ValueError(f"Metric '{name}' already registered as {existing.kind}")
+                if kwargs.get("callback") is not None:
+                    existing.callback = kwargs["callback"]
+                return existing
+            metric = cls(name, *args, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                callback: Optional[Callable] = None) -> Counter:
+        return self._register(Counter, name, documentation, labelnames, callback=callback)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, callback=callback)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def timed(histogram: Histogram, empty_is_failure: bool = False, **labels):
+    """
+    Decorator recording call duration in `histogram`, which must have an
+    `outcome` label ("ok", "error", or "empty" for helpers that signal
+    failure by returning an empty value instead of raising).
+    """
+
+    def decorator(fn):
+        # Label tuples are built once; children are created on first use
+        keys = {
+            outcome: tuple({**labels, "outcome": outcome}.get(n, "") for n in histogram.labelnames)
+            for outcome in ("ok", "error", "empty")
+        }
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "empty" if empty_is_failure and not result else "ok"
+                return result
+            finally:
+                histogram.labels(*keys[outcome]).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# ── ASGI middleware ────────────────────────────────────────────────────
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests", "HTTP requests by method, route template and status code.", ["method", "route", "status"]
+)
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template.", ["method", "route"]
+)
+HTTP_IN_PROGRESS = metrics.gauge("http_requests_in_progress", "HTTP requests currently being served.")
+
+
+def _route_template(scope) -> str:
+    """Request path with path-parameter values put back as {name} (router prefixes included)."""
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    params = {str(v): k for k, v in (scope.get("path_params") or {}).items()}
+    if not params:
+        return path
+    return "/".join("{" + params[part] + "}" if part in params else part for part in path.split("/"))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task like BaseHTTPMiddleware).
+    Routes are labelled by their template, e.g. /api/doubt/history/{learning_space_id}/{user_id},
+    so ids don't blow up label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            template = _route_template(scope)
+            method = scope.get("method", "")
+            HTTP_LATENCY.labels(method, template).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, template, str(status["code"])).inc()
@@ -3,7 +3,7 @@
 # Central routing utility: picks the right LLM for each educational task
 # and provides Gemini Flash as the universal fallback.
 #
-# ADDED: ProviderHealthTracker — Circuit Breaker pattern.
+# ADDED: ProviderHealthTracker — Circuit Breaker pattern (circuit_breaker.py).
 # If a provider fails 3× within a 5-min window it is marked DEGRADED and
 # call_with_fallback() skips straight to Gemini, avoiding redundant calls.
 # -----------------------------------------------------------------------
@@ -11,12 +11,27 @@
 import os
 import logging
 import time
+from functools import partial
 from typing import Any, Type, Optional
 from pydantic import BaseModel
 from src.services.supabase_service import supabase_service
+from src.configs.config import FAKE_LLM, LLM_CALL_TIMEOUT_SECONDS, LLM_MIN_ATTEMPT_SECONDS
+from src.utils.cassette import llm_cassette
+from src.utils.circuit_breaker import ProviderHealthTracker, health_tracker  # noqa: F401
+from src.utils.deadline import DeadlineExceeded, call_timeout, check_deadline, ensure_budget
+from src.utils.prompt_builder import PromptAssembly, gemini_context_cache
+from src.utils.metrics import metrics
+from src.utils.tracing import UsageCallback, current_span, finalize_llm_span, start_span
 
 logger = logging.getLogger(__name__)
 
+LLM_LATENCY = metrics.histogram(
+    "llm_call_duration_seconds", "LLM calls (including retries) by task, provider and outcome.",
+    ["task", "provider", "outcome"],
+)
+LLM_TOKENS = metrics.counter("llm_tokens", "Provider-reported LLM tokens.", ["provider", "direction"])
+LLM_FALLBACKS = metrics.counter("llm_fallbacks", "Tasks that fell back to Gemini.", ["task", "primary_provider"])
+
 def log_provider_health(provider: str, task: str, success: bool, latency: float, error: str = None):
     """Logs provider health to Supabase for observability dashboard."""
     try:
@@ -42,122 +57,77 @@ TASK_MODEL_MAP: dict[str, str] = {
     "audio":             "groq",
     "verification":      "gemini",
     "document_analysis": "gemini",
+    "study_pack":        "gemini",
     "fallback":          "gemini",
 }
 
 
-# ── Circuit Breaker: Provider Health Tracker ───────────────────────────
-
-class ProviderHealthTracker:
-    """
-    Tracks per-provider failure counts.
-    If a provider exceeds FAILURE_THRESHOLD failures within WINDOW_SECONDS,
-    it is marked DEGRADED and bypassed until the window resets.
-    """
-
-    FAILURE_THRESHOLD = 3        # failures before marking degraded
-    WINDOW_SECONDS    = 300      # 5-minute rolling window
-    COOLDOWN_SECONDS  = 120      # 2-minute cooldown before re-attempting
-
-    def __init__(self):
-        # provider → {"failures": int, "window_start": float, "degraded_since": float|None}
-        self._state: dict[str, dict] = {}
-
-    def _ensure(self, provider: str):
-        if provider not in self._state:
-            self._state[provider] = {
-                "failures":       0,
-                "window_start":   time.monotonic(),
-                "degraded_since": None,
-            }
-
-    def record_failure(self, provider: str):
-        self._ensure(provider)
-        s = self._state[provider]
-        now = time.monotonic()
-
-        # Reset window if expired
-        if now - s["window_start"] > self.WINDOW_SECONDS:
-            s["failures"]     = 0
-            s["window_start"] = now
-            s["degraded_since"] = None
-
-        s["failures"] += 1
-        if s["failures"] >= self.FAILURE_THRESHOLD and s["degraded_since"] is None:
-            s["degraded_since"] = now
-            logger.warning(
-                f"[CircuitBreaker] 🔴 Provider '{provider}' marked DEGRADED after "
-                f"{s['failures']} failures in {self.WINDOW_SECONDS}s."
-            )
+# ── Circuit Breaker (see circuit_breaker.py) ───────────────────────────
 
-    def record_success(self, provider: str):
-        self._ensure(provider)
-        s = self._state[provider]
-        # Reset failure counter on success
-        s["failures"]       = 0
-        s["window_start"]   = time.monotonic()
-        s["degraded_since"] = None
-
-    def is_degraded(self, provider: str) -> bool:
-        self._ensure(provider)
-        s = self._state[provider]
-        if s["degraded_since"] is None:
-            return False
-        # Check if cooldown has elapsed → allow one retry probe
-        elapsed = time.monotonic() - s["degraded_since"]
-        if elapsed > self.COOLDOWN_SECONDS:
-            logger.info(
-                f"[CircuitBreaker] 🟡 Provider '{provider}' cooldown elapsed "
-                f"({elapsed:.0f}s). Allowing probe request."
-            )
-            s["degraded_since"] = None   # reset; next failure will re-degrade
-            s["failures"]       = 0
-            return False
-        return True
+metrics.gauge(
+    "llm_circuit_open", "1 while a provider is marked DEGRADED by the circuit breaker.", ["provider"],
+    callback=lambda: {(p,): int(s["degraded"]) for p, s in health_tracker.snapshot().items()},
+)
+metrics.gauge(
+    "llm_circuit_failures", "Failures in the current circuit breaker window.", ["provider"],
+    callback=lambda: {(p,): s["failures"] for p, s in health_tracker.snapshot().items()},
+)
 
 
-# Singleton instance shared across all requests in the process lifetime
-health_tracker = ProviderHealthTracker()
+# ── Lazy model builders ────────────────────────────────────────────────
 
+GEMINI_MODEL   = "gemini-2.5-flash"
+GROQ_MODEL     = "llama-3.3-70b-versatile"
+DEEPSEEK_MODEL = "deepseek-chat"
+MISTRAL_MODEL  = "mistral-large-latest"
 
-# ── Lazy model builders ────────────────────────────────────────────────
 
-def get_gemini_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None):
-    """Returns Gemini 2.5 Flash (latest model)."""
+def get_gemini_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None,
+                   cached_content: Optional[str] = None, timeout: Optional[float] = None):
+    """Returns Gemini 2.5 Flash (latest model), optionally bound to provider-side cached content."""
+    if FAKE_LLM:
+        from src.utils.fake_llm import build_fake_llm
+        return build_fake_llm("gemini", temperature, structured_schema)
     from langchain_google_genai import ChatGoogleGenerativeAI
+    extra = {"cached_content": cached_content} if cached_content else {}
     llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
+        model=GEMINI_MODEL,
         temperature=temperature,
         max_retries=2,
+        timeout=timeout,
+        **extra,
     )
     if structured_schema:
         return llm.with_structured_output(structured_schema)
     return llm
 
 
-def get_groq_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None):
+def get_groq_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None,
+                 timeout: Optional[float] = None):
     """Returns Groq Llama3 model. Falls back to Gemini on error."""
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         logger.warning("GROQ_API_KEY not set — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
     try:
         from langchain_groq import ChatGroq
         llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
+            model=GROQ_MODEL,
             temperature=temperature,
             api_key=api_key,
             max_retries=2,
+            timeout=timeout,
         )
         if structured_schema:
             return llm.with_structured_output(structured_schema)
         return llm
     except Exception as e:
         logger.warning(f"Groq init failed ({e}) — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
 
 
-def get_deepseek_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None):
+def get_deepseek_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None,
+                     timeout: Optional[float] = None):
     """
     Returns a DeepSeek model via OpenAI-compatible endpoint.
     Falls back to Gemini on error.
@@ -165,44 +135,47 @@ def get_deepseek_llm(temperature: float = 0.1, structured_schema: Optional[Type[
     api_key = os.getenv("DEEPSEEK_API_KEY")
     if not api_key:
         logger.warning("DEEPSEEK_API_KEY not set — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
     try:
         from langchain_openai import ChatOpenAI
         llm = ChatOpenAI(
-            model="deepseek-chat",
+            model=DEEPSEEK_MODEL,
             openai_api_key=api_key,
             openai_api_base="https://api.deepseek.com/v1",
             temperature=temperature,
             max_retries=2,
+            timeout=timeout,
         )
         if structured_schema:
             return llm.with_structured_output(structured_schema)
         return llm
     except Exception as e:
         logger.warning(f"DeepSeek init failed ({e}) — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
 
 
-def get_mistral_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None):
+def get_mistral_llm(temperature: float = 0.1, structured_schema: Optional[Type[BaseModel]] = None,
+                    timeout: Optional[float] = None):
     """Returns Mistral AI model. Falls back to Gemini on error."""
     api_key = os.getenv("MISTRAL_API_KEY")
     if not api_key:
         logger.warning("MISTRAL_API_KEY not set — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
     try:
         from langchain_mistralai import ChatMistralAI
         llm = ChatMistralAI(
-            model="mistral-large-latest",
+            model=MISTRAL_MODEL,
             temperature=temperature,
             api_key=api_key,
             max_retries=2,
+            timeout=timeout,
         )
         if structured_schema:
             return llm.with_structured_output(structured_schema)
         return llm
     except Exception as e:
         logger.warning(f"Mistral init failed ({e}) — falling back to Gemini.")
-        return get_gemini_llm(temperature, structured_schema)
+        return get_gemini_llm(temperature, structured_schema, timeout=timeout)
 
 
 # ── Provider name lookup ───────────────────────────────────────────────
@@ -214,6 +187,13 @@ _TASK_TO_PROVIDER = {
     "gemini":   "gemini",
 }
 
+_PROVIDER_MODELS = {
+    "groq":     GROQ_MODEL,
+    "deepseek": DEEPSEEK_MODEL,
+    "mistral":  MISTRAL_MODEL,
+    "gemini":   GEMINI_MODEL,
+}
+
 _MODEL_BUILDERS = {
     "groq":     get_groq_llm,
     "deepseek": get_deepseek_llm,
@@ -221,9 +201,20 @@ _MODEL_BUILDERS = {
     "gemini":   get_gemini_llm,
 }
 
+if FAKE_LLM:
+    # Offline benchmarking: every provider is simulated (see src/utils/fake_llm.py)
+    from src.utils.fake_llm import build_fake_llm
+    _MODEL_BUILDERS.update({name: partial(build_fake_llm, name) for name in _MODEL_BUILDERS})
+    logger.warning("[Router] FAKE_LLM is on — all providers are simulated, no real API calls will be made.")
+
 
 # ── Public helpers ────────────────────────────────────────────────────
 
+def provider_for_task(task: str) -> str:
+    """The provider a task is routed to first (before any fallback)."""
+    return _TASK_TO_PROVIDER.get(TASK_MODEL_MAP.get(task, "gemini"), "gemini")
+
+
 def get_model_for_task(task: str, temperature: float = 0.1,
                        structured_schema: Optional[Type[BaseModel]] = None):
     """
@@ -246,28 +237,93 @@ def get_model_for_task(task: str, temperature: float = 0.1,
     return builder(temperature=temperature, structured_schema=structured_schema)
 
 
+def _gemini_chain(chain_fn, temperature: float, structured_schema: Optional[Type[BaseModel]],
+                  timeout: Optional[float] = None):
+    """
+    Builds the Gemini chain, reusing a cached copy of the prompt's shared context
+    when possible. Cached content can't be combined with tools, so structured
+    calls always send the full (prefix-stable) prompt instead.
+    """
+    if isinstance(chain_fn, PromptAssembly) and structured_schema is None and not FAKE_LLM:
+        cache_name = gemini_context_cache.lookup(GEMINI_MODEL, chain_fn.shared_context)
+        if cache_name:
+            return chain_fn.with_cached_context(
+                get_gemini_llm(temperature, cached_content=cache_name, timeout=timeout)
+            )
+    return chain_fn(get_gemini_llm(temperature, structured_schema, timeout=timeout))
+
+
+def _traced_invoke(chain, input_data: dict, max_retries: int):
+    """invoke_with_retry() with token usage captured on the current `llm.call` span."""
+    from src.utils.llm_utils import invoke_with_retry
+
+    span = current_span()
+    invoke = partial(chain.invoke, config={"callbacks": [UsageCallback(span)]})
+    provider = span.attributes.get("provider", "unknown") if span is not None else "unknown"
+    return invoke_with_retry(invoke, input_data, max_retries=max_retries, initial_delay=2.0, provider=provider)
+
+
+def _close_llm_span(span, ok: bool):
+    """
+    Price the span and record call metrics. `ok` is passed in rather than read
+    from sys.exc_info(), which also sees an exception the caller is handling.
+    """
+    finalize_llm_span(span, ok)
+    attributes = span.attributes
+    outcome = "ok" if ok else "error"
+    LLM_LATENCY.labels(attributes["task"], attributes["provider"], outcome).observe(time.time() - span.start)
+    LLM_TOKENS.labels(attributes["provider"], "input").inc(attributes.get("input_tokens", 0))
+    LLM_TOKENS.labels(attributes["provider"], "output").inc(attributes.get("output_tokens", 0))
+
+
 def call_with_fallback(
     task: str,
-    chain_fn,          # callable that accepts an LLM and returns a chain
+    chain_fn,          # callable that accepts an LLM and returns a chain (or a PromptAssembly)
     input_data: dict,
     structured_schema: Optional[Type[BaseModel]] = None,
     temperature: float = 0.1,
 ) -> Any:
     """
     Enhanced with timing and health logging for Observability.
+    Every attempt is traced as an `llm.call` span with tokens, retries and cost.
+    With LLM_CASSETTE_MODE=record|replay calls are recorded to / served from a cassette.
     """
-    from src.utils.llm_utils import invoke_with_retry
+    if llm_cassette.enabled:
+        return llm_cassette.call(
+            task, chain_fn, input_data, structured_schema,
+            live=lambda: _call_providers(task, chain_fn, input_data, structured_schema, temperature),
+        )
+    return _call_providers(task, chain_fn, input_data, structured_schema, temperature)
 
+
+def _call_providers(task: str, chain_fn, input_data: dict,
+                    structured_schema: Optional[Type[BaseModel]], temperature: float) -> Any:
+    """Primary provider with circuit breaker, then Gemini fallback."""
     model_name = TASK_MODEL_MAP.get(task, "gemini")
     provider   = _TASK_TO_PROVIDER.get(model_name, "gemini")
     start_time = time.time()
+    ensure_budget(LLM_MIN_ATTEMPT_SECONDS, f"Task '{task}'")
 
     # --- Primary model ---
-    if not health_tracker.is_degraded(provider):
+    # Claims the single half-open probe when the provider is recovering
+    if health_tracker.allow_request(provider):
         try:
-            primary_llm = get_model_for_task(task, temperature, structured_schema)
-            chain = chain_fn(primary_llm)
-            result = invoke_with_retry(chain.invoke, input_data, max_retries=1, initial_delay=2.0)
+            with start_span("llm.call", task=task, provider=provider,
+                            model=_PROVIDER_MODELS.get(model_name), fallback=False) as span:
+                ok = False
+                try:
+                    # The HTTP call itself can't outlive the caller's deadline
+                    timeout = call_timeout(LLM_CALL_TIMEOUT_SECONDS)
+                    if model_name == "gemini":
+                        chain = _gemini_chain(chain_fn, temperature, structured_schema, timeout)
+                    else:
+                        builder = _MODEL_BUILDERS.get(model_name, get_gemini_llm)
+                        chain = chain_fn(builder(temperature=temperature, structured_schema=structured_schema,
+                                                 timeout=timeout))
+                    result = _traced_invoke(chain, input_data, max_retries=1)
+                    ok = True
+                finally:
+                    _close_llm_span(span, ok)
             
             # Health Logging (Success)
             latency = time.time() - start_time
@@ -276,7 +332,11 @@ def call_with_fallback(
             
             logger.info(f"[Router] ✅ Task '{task}' succeeded with '{provider}' ({latency:.2f}s).")
             return result
+        except DeadlineExceeded:
+            raise
         except Exception as primary_err:
+            # A call cut short by our own deadline says nothing about the provider
+            check_deadline(f"Task '{task}'")
             latency = time.time() - start_time
             health_tracker.record_failure(provider)
             log_provider_health(provider, task, False, latency, str(primary_err))
@@ -284,11 +344,21 @@ def call_with_fallback(
             logger.warning(f"[Router] ⚠️ Provider '{provider}' failed: {primary_err}. Fallback starting.")
     
     # --- Gemini fallback ---
+    # Don't start a fallback the caller no longer has time to wait for
+    ensure_budget(LLM_MIN_ATTEMPT_SECONDS, f"Task '{task}' fallback")
+    LLM_FALLBACKS.labels(task, provider).inc()
     start_fallback = time.time()
     try:
-        fallback_llm = get_gemini_llm(temperature, structured_schema)
-        chain = chain_fn(fallback_llm)
-        result = invoke_with_retry(chain.invoke, input_data, max_retries=5, initial_delay=2.0)
+        with start_span("llm.call", task=task, provider="gemini", model=GEMINI_MODEL,
+                        fallback=True, primary_provider=provider) as span:
+            ok = False
+            try:
+                chain = _gemini_chain(chain_fn, temperature, structured_schema,
+                                      call_timeout(LLM_CALL_TIMEOUT_SECONDS))
+                result = _traced_invoke(chain, input_data, max_retries=5)
+                ok = True
+            finally:
+                _close_llm_span(span, ok)
         
         latency = time.time() - start_fallback
         log_provider_health("gemini_fallback", task, True, latency)
@@ -299,4 +369,3 @@ def call_with_fallback(
         latency = time.time() - start_fallback
         log_provider_health("gemini_fallback", task, False, latency, str(fallback_err))
         raise fallback_err
-
@@ -2,15 +2,20 @@ import logging
 import requests
 import tempfile
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+from src.configs.config import prompt_budget
+from src.utils.metrics import metrics, timed
+from src.utils.token_budget import count_tokens, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
-# Max characters to extract - roughly ~5,000 words
-MAX_EXTRACT_CHARS = 25000
+# Extractors return "" on failure, so empty results are counted separately
+EXTRACTION_LATENCY = metrics.histogram(
+    "source_extraction_duration_seconds", "Source material extraction by source type.", ["source", "outcome"]
+)
 
+TRUNCATION_MARKER = "\n\n[... DOCUMENT TRUNCATED DUE TO LENGTH ...]"
+
+@timed(EXTRACTION_LATENCY, empty_is_failure=True, source="pdf")
 def extract_text_from_url(pdf_url: str) -> str:
     """
     Downloads a PDF securely, extracts its text, and returns a truncated string
@@ -27,6 +32,8 @@ def extract_text_from_url(pdf_url: str) -> str:
         response.raise_for_status()
 
         extracted_text = ""
+        extracted_tokens = 0
+        max_tokens = prompt_budget("source")
         
         # write to temp file since PyPDFLoader requires a file path
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
@@ -35,14 +42,17 @@ def extract_text_from_url(pdf_url: str) -> str:
 
         # 2. Extract text block by block
         try:
+            # Imported on first use: the loader stack is slow to import and most requests never need it
+            from langchain_community.document_loaders import PyPDFLoader
             loader = PyPDFLoader(tmp_file_path)
             pages = loader.load()
             
             for page in pages:
                 extracted_text += page.page_content + "\n\n"
+                extracted_tokens += count_tokens(page.page_content, task="summary")
                 
                 # Stop parsing if we hit the limit to save CPU overhead
-                if len(extracted_text) > MAX_EXTRACT_CHARS:
+                if extracted_tokens > max_tokens:
                     break
         finally:
             # 3. Always clean up the temp file
@@ -51,12 +61,10 @@ def extract_text_from_url(pdf_url: str) -> str:
             except Exception as e:
                 logger.warning(f"Failed to remove temp PDF file {tmp_file_path}: {e}")
 
-        # 4. Truncate to exact character limit safely
-        truncated_text = extracted_text[:MAX_EXTRACT_CHARS]
-        
-        if len(extracted_text) > MAX_EXTRACT_CHARS:
-            logger.info(f"Truncated PDF text limit reached, returning {MAX_EXTRACT_CHARS} chars.")
-            truncated_text += "\n\n[... DOCUMENT TRUNCATED DUE TO LENGTH ...]"
+        # 4. Truncate to the summariser's token budget (script-aware, cut at a boundary)
+        truncated_text = truncate_to_tokens(extracted_text, max_tokens, task="summary", marker=TRUNCATION_MARKER)
+        if truncated_text != extracted_text:
+            logger.info(f"Truncated PDF text to the ~{max_tokens} token budget.")
             
         logger.info(f"Successfully extracted {len(truncated_text)} characters from PDF.")
         return truncated_text
@@ -68,6 +76,7 @@ def extract_text_from_url(pdf_url: str) -> str:
         logger.error(f"Failed to parse PDF text: {e}")
         return ""
 
+@timed(EXTRACTION_LATENCY, empty_is_failure=True, source="pdf_visuals")
 def describe_pdf_visuals(pdf_url: str) -> str:
     """
     Uses Gemini 1.5 Flash to 'look' at the PDF and describe any 
@@ -79,6 +88,9 @@ def describe_pdf_visuals(pdf_url: str) -> str:
     try:
         logger.info(f"Generating visual descriptions for PDF: {pdf_url}")
         
+        from langchain_core.messages import HumanMessage
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         # Initialize Gemini 1.5 Flash with multimodal support
         llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1)
         
@@ -0,0 +1,181 @@
+# -----------------------------------------------------------------------
+# prompt_builder.py
+# Prompt assembly with a stable shared-context prefix.
+#
+# Quiz, flashcards, recommendations, audio, the verifier and the doubt
+# solver all send the same study notes. PromptAssembly always renders that
+# shared context as the FIRST message, byte-identical across nodes, so
+# providers with prefix caching (Gemini 2.5 implicit caching, DeepSeek,
+# OpenAI-compatible endpoints) can reuse it. Task instructions follow.
+#
+# Rendered messages are memoized locally, and when GEMINI_CONTEXT_CACHE is
+# enabled the shared context is uploaded once as Gemini cached content
+# keyed on its hash, so unstructured Gemini calls stop resending it.
+# -----------------------------------------------------------------------
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from src.configs.config import env_float, env_str
+from src.utils.llm_utils import estimate_tokens
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CONTEXT_CACHE = env_str("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+GEMINI_CACHE_MIN_TOKENS = int(env_float("GEMINI_CACHE_MIN_TOKENS", 1024))
+GEMINI_CACHE_TTL_SECONDS = env_float("GEMINI_CACHE_TTL_SECONDS", 3600)
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SharedContext:
+    """Long context shared by several prompts, e.g. a learning space's summary notes."""
+
+    __slots__ = ("label", "text", "rendered", "key")
+
+    def __init__(self, text: str, label: str = "Study notes"):
+        self.label = label
+        self.text = text or ""
+        self.rendered = f"{label}:\n---\n{self.text}\n---"
+        self.key = _hash(self.rendered)[:32]
+
+
+# ── Local memoization of rendered prompts ──────────────────────────────
+
+class _RenderCache:
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: str, render):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = render()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return value
+
+
+_render_cache = _RenderCache()
+
+metrics.counter("prompt_render_cache_hits", "Rendered prompts served from the local cache.",
+                callback=lambda: _render_cache.hits)
+metrics.counter("prompt_render_cache_misses", "Prompts rendered from their templates.",
+                callback=lambda: _render_cache.misses)
+
+
+class PromptAssembly:
+    """
+    Callable drop-in for `chain_fn` in call_with_fallback():
+        chain_fn=PromptAssembly(instructions, user, shared_context=SharedContext(summary))
+
+    Message order is [shared context] → [task instructions] → [user turn],
+    so everything that differs between tasks comes after the shared prefix.
+    """
+
+    def __init__(self, instructions: str, user: str, shared_context: Optional[SharedContext] = None):
+        self.shared_context = shared_context
+        messages = [("system", instructions), ("user", user)]
+        if shared_context is not None:
+            messages.insert(0, ("system", "{shared_context}"))
+        self.template = ChatPromptTemplate(messages)
+        # With provider-side cached content the prefix lives in the cache, and
+        # Gemini rejects system instructions alongside it, so fold into one turn
+        self.cached_template = ChatPromptTemplate([("user", instructions + "\n\n" + user)])
+        self._template_key = _hash(instructions, user)
+
+    def _render(self, template: ChatPromptTemplate, kind: str, input_data: dict):
+        variables = dict(input_data)
+        if self.shared_context is not None and kind == "full":
+            variables["shared_context"] = self.shared_context.rendered
+        key = _hash(
+            kind, self._template_key,
+            self.shared_context.key if self.shared_context else "",
+            *(f"{k}={v}" for k, v in sorted(input_data.items())),
+        )
+        return _render_cache.get_or_render(key, lambda: template.invoke(variables))
+
+    def __call__(self, llm):
+        return RunnableLambda(lambda data: self._render(self.template, "full", data)) | llm
+
+    def with_cached_context(self, llm):
+        """Chain for an LLM already bound to cached content holding the shared context."""
+        return RunnableLambda(lambda data: self._render(self.cached_template, "cached", data)) | llm
+
+
+# ── Gemini context caching ─────────────────────────────────────────────
+
+class GeminiContextCache:
+    """Maps shared-context hashes to Gemini cached-content names, with TTL and failure memo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], tuple[Optional[str], float]] = {}
+
+    def lookup(self, model: str, shared_context: Optional[SharedContext]) -> Optional[str]:
+        if not GEMINI_CONTEXT_CACHE or shared_context is None:
+            return None
+        if estimate_tokens(shared_context.rendered) < GEMINI_CACHE_MIN_TOKENS:
+            return None
+
+        key = (model, shared_context.key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        name = self._create(model, shared_context)
+        # Failed creations are remembered briefly so we don't retry on every call
+        expires = now + (GEMINI_CACHE_TTL_SECONDS * 0.9 if name else 300)
+        with self._lock:
+            self._entries[key] = (name, expires)
+        return name
+
+    def _create(self, model: str, shared_context: SharedContext) -> Optional[str]:
+        try:
+            import google.generativeai as genai
+            from google.generativeai import caching
+
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            cached = caching.CachedContent.create(
+                model=f"models/{model}",
+                display_name=f"ctx-{shared_context.key[:16]}",
+                contents=[{"role": "user", "parts": [{"text": shared_context.rendered}]}],
+                ttl=timedelta(seconds=GEMINI_CACHE_TTL_SECONDS),
+            )
+            logger.info(
+                f"[PromptCache] Created Gemini cached content for context {shared_context.key[:8]} "
+                f"(~{estimate_tokens(shared_context.rendered)} tokens)"
+            )
+            return cached.name
+        except Exception as e:
+            logger.warning(f"[PromptCache] Gemini context caching unavailable: {e}")
+            return None
+
+
+gemini_context_cache = GeminiContextCache()
@@ -0,0 +1,213 @@
+# -----------------------------------------------------------------------
+# retry_policy.py
+# Decides whether (and when) a failed LLM call is retried.
+#
+# classify_error() looks at exception types and HTTP status codes rather
+# than message text. Provider SDKs expose the status differently (groq /
+# openai: .status_code, google: .code, httpx-based clients:
+# .response.status_code), so the exception and its __cause__ chain are
+# searched for the first one. Retry-After comes from the same places.
+#
+# Retries are also budgeted, so they can't amplify load during an outage:
+#   - per provider: retries ≤ RETRY_BUDGET_RATIO × calls in a rolling
+#     window (plus RETRY_BUDGET_MIN_RETRIES), shared by the whole process
+#   - per request: at most RETRY_MAX_PER_REQUEST retries across all LLM
+#     calls of one HTTP request or workflow run (retry_budget_scope())
+# -----------------------------------------------------------------------
+
+import email.utils
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from src.configs.config import (
+    RETRY_BUDGET_MIN_RETRIES, RETRY_BUDGET_RATIO, RETRY_BUDGET_WINDOW_SECONDS, RETRY_MAX_PER_REQUEST,
+)
+from src.utils.metrics import metrics
+
+LLM_RETRIES = metrics.counter("llm_retries", "LLM call retries by provider and reason.", ["provider", "reason"])
+LLM_RETRIES_DENIED = metrics.counter(
+    "llm_retries_denied", "Retryable LLM errors not retried because a budget was spent.", ["provider", "budget"],
+)
+
+# Transient by definition; every other 4xx means the request itself is wrong
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# SDK exception classes without a status code, matched by name so no SDK has to be imported
+_TRANSIENT_TYPES = {
+    "APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectError", "ReadTimeout",
+    "ConnectTimeout", "RemoteProtocolError", "ServiceUnavailable", "ServerError",
+}
+_FATAL_TYPES = {"TypeError", "KeyError", "AttributeError", "NotImplementedError", "ImportError"}
+
+
+@dataclass(frozen=True)
+class RetryDecision:
+    retryable: bool
+    reason: str                          # e.g. "429", "timeout", "connection", "400", "unknown"
+    status: Optional[int] = None
+    retry_after: Optional[float] = None  # seconds the provider asked us to wait
+
+
+def _error_chain(exc: BaseException):
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    for candidate in (getattr(exc, "status_code", None), getattr(exc, "code", None),
+                      getattr(getattr(exc, "response", None), "status_code", None)):
+        if isinstance(candidate, int) and 100 <= candidate <= 599:
+            return candidate
+    return None
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after_of(exc: BaseException) -> Optional[float]:
+    if getattr(exc, "retry_after", None) is not None:
+        return _parse_retry_after(exc.retry_after)
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            return _parse_retry_after(headers.get("retry-after"))
+        except AttributeError:
+            pass
+    # google.api_core errors carry a google.rpc.RetryInfo in .details
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    return None
+
+
+def _quota_is_zero(exc: BaseException) -> bool:
+    # Gemini answers 429 with "limit: 0" when the key has no quota for the model at all
+    return "limit: 0" in str(exc).lower()
+
+
+def classify_error(exc: BaseException) -> RetryDecision:
+    chain = list(_error_chain(exc))
+    status = next((s for s in map(_status_of, chain) if s is not None), None)
+    retry_after = next((r for r in map(_retry_after_of, chain) if r is not None), None)
+
+    if status is not None:
+        if status == 429 and _quota_is_zero(exc):
+            return RetryDecision(False, "quota_zero", status)
+        return RetryDecision(status in RETRYABLE_STATUS, str(status), status, retry_after)
+
+    names = {cls.__name__ for e in chain for cls in type(e).__mro__}
+    if names & {"TimeoutError", "APITimeoutError", "TimeoutException", "ReadTimeout", "ConnectTimeout"}:
+        return RetryDecision(True, "timeout", retry_after=retry_after)
+    if names & {"ConnectionError", "APIConnectionError", "ConnectError", "RemoteProtocolError"}:
+        return RetryDecision(True, "connection", retry_after=retry_after)
+    if names & _TRANSIENT_TYPES:
+        return RetryDecision(True, "transient", retry_after=retry_after)
+    if type(exc).__name__ in _FATAL_TYPES:
+        return RetryDecision(False, "bug")
+    # Anything else (e.g. malformed structured output) may well succeed on a second try
+    return RetryDecision(True, "unknown", retry_after=retry_after)
+
+
+# ── Budgets ────────────────────────────────────────────────────────────
+
+class ProviderRetryBudget:
+    """Rolling-window ratio of retries to calls, per provider."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_retries: int = RETRY_BUDGET_MIN_RETRIES,
+                 window_seconds: float = RETRY_BUDGET_WINDOW_SECONDS):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._calls: dict[str, deque] = {}
+        self._retries: dict[str, deque] = {}
+
+    def _trim(self, events: deque, now: float):
+        while events and now - events[0] > self.window_seconds:
+            events.popleft()
+
+    def record_call(self, provider: str):
+        now = time.monotonic()
+        with self._lock:
+            events = self._calls.setdefault(provider, deque())
+            self._trim(events, now)
+            events.append(now)
+
+    def try_acquire(self, provider: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls.setdefault(provider, deque())
+            retries = self._retries.setdefault(provider, deque())
+            self._trim(calls, now)
+            self._trim(retries, now)
+            if len(retries) >= self.min_retries + self.ratio * len(calls):
+                return False
+            retries.append(now)
+            return True
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._retries.clear()
+
+
+class RequestRetryBudget:
+    """Retries left for one request; shared by every thread working on it."""
+
+    def __init__(self, max_retries: int = RETRY_MAX_PER_REQUEST):
+        self.remaining = max_retries
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+provider_retry_budget = ProviderRetryBudget()
+
+_request_budget: ContextVar[Optional[RequestRetryBudget]] = ContextVar("request_retry_budget", default=None)
+
+
+@contextmanager
+def retry_budget_scope(max_retries: int = RETRY_MAX_PER_REQUEST):
+    """Bound the retries of all LLM calls made inside the block (and its worker threads)."""
+    token = _request_budget.set(RequestRetryBudget(max_retries))
+    try:
+        yield
+    finally:
+        _request_budget.reset(token)
+
+
+def acquire_retry(provider: str, reason: str) -> bool:
+    """Take one retry from the request and provider budgets; False if either is spent."""
+    request_budget = _request_budget.get()
+    if request_budget is not None and not request_budget.try_acquire():
+        LLM_RETRIES_DENIED.labels(provider, "request").inc()
+        return False
+    if not provider_retry_budget.try_acquire(provider):
+        LLM_RETRIES_DENIED.labels(provider, "provider").inc()
+        return False
+    LLM_RETRIES.labels(provider, reason).inc()
+    return True
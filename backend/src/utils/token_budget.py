@@ -0,0 +1,223 @@
+# -----------------------------------------------------------------------
+# token_budget.py
+# Token-aware limits for prompt sections.
+#
+# Character slices treat every script alike, but providers tokenize Hindi,
+# Tamil or Bengali text very differently from English: the same 8,000
+# characters can be ~2k tokens of English and several times that in an
+# Indic script. Counts here are per provider and per script:
+#   - "estimate" (default): characters-per-token ratios by provider family
+#     and Unicode script, no downloads. The defaults are deliberately on
+#     the conservative side; TOKEN_CALIBRATION_JSON overrides them, e.g.
+#     with ratios derived from the provider usage recorded in traces.
+#   - "tiktoken": a real BPE count when tiktoken and its encoding file are
+#     available locally; falls back to the estimate otherwise.
+#
+# A prompt's variable sections (notes, history, source material) are fitted
+# to its budget (config.prompt_budget) in priority order, and cut at a
+# paragraph / sentence / word boundary rather than mid-word.
+# -----------------------------------------------------------------------
+
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Optional
+from src.configs.config import PROMPT_TOKENIZER, TIKTOKEN_ENCODING, TOKEN_CALIBRATION_JSON, prompt_budget
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKENS_TRIMMED = metrics.counter(
+    "prompt_tokens_trimmed", "Estimated input tokens cut from prompt sections to fit their budget.",
+    ["prompt", "section"],
+)
+
+# Characters per token by provider family and script
+_DEFAULT_CALIBRATION: dict[str, dict[str, float]] = {
+    "default":  {"latin": 3.6, "devanagari": 1.6, "indic": 1.2, "cjk": 0.9, "other": 2.0},
+    "gemini":   {"latin": 4.0, "devanagari": 2.8, "indic": 2.2, "cjk": 1.2, "other": 2.5},
+    "groq":     {"latin": 4.0, "devanagari": 2.0, "indic": 1.4, "cjk": 1.0, "other": 2.2},
+    "deepseek": {"latin": 3.8, "devanagari": 1.6, "indic": 1.2, "cjk": 1.3, "other": 2.0},
+    "mistral":  {"latin": 3.6, "devanagari": 1.7, "indic": 1.2, "cjk": 1.0, "other": 2.0},
+}
+
+
+def _load_calibration() -> dict[str, dict[str, float]]:
+    calibration = {provider: dict(ratios) for provider, ratios in _DEFAULT_CALIBRATION.items()}
+    if not TOKEN_CALIBRATION_JSON:
+        return calibration
+    try:
+        for provider, ratios in json.loads(TOKEN_CALIBRATION_JSON).items():
+            calibration.setdefault(provider, dict(calibration["default"])).update(
+                {script: float(ratio) for script, ratio in ratios.items() if float(ratio) > 0}
+            )
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"⚠️ Ignoring invalid TOKEN_CALIBRATION_JSON: {e}")
+    return calibration
+
+
+_CALIBRATION = _load_calibration()
+
+# One pass over runs of non-Latin text; everything not matched counts as Latin
+_SCRIPT_RUNS = re.compile(
+    r"([\u0900-\u097f]+)"                                   # Devanagari: Hindi, Marathi, Nepali
+    r"|([\u0980-\u0dff]+)"                                  # Bengali … Malayalam, Sinhala
+    r"|([\u3000-\u9fff\uac00-\ud7af]+)"                     # CJK, Hangul
+    r"|([^\u0000-\u024f\u2000-\u206f\u0900-\u0dff\u3000-\u9fff\uac00-\ud7af]+)"
+)
+_RUN_SCRIPTS = ("devanagari", "indic", "cjk", "other")
+
+
+def _script_counts(text: str) -> dict[str, int]:
+    if text.isascii():
+        return {"latin": len(text)}
+    counts = dict.fromkeys(_RUN_SCRIPTS, 0)
+    for match in _SCRIPT_RUNS.finditer(text):
+        counts[_RUN_SCRIPTS[match.lastindex - 1]] += match.end() - match.start()
+    counts["latin"] = len(text) - sum(counts.values())
+    return counts
+
+
+# ── Optional tiktoken ──────────────────────────────────────────────────
+
+_encoding = None
+_encoding_failed = False
+
+
+def _tiktoken_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning(f"⚠️ tiktoken encoding '{TIKTOKEN_ENCODING}' unavailable, using estimates: {e}")
+    return _encoding
+
+
+# ── Counting ───────────────────────────────────────────────────────────
+
+def _providers_for(task: Optional[str]) -> tuple[str, ...]:
+    """Providers that may serve a task: its primary and the Gemini fallback."""
+    if task is None:
+        return ("default",)
+    from src.utils.model_router import TASK_MODEL_MAP
+    primary = TASK_MODEL_MAP.get(task, "gemini")
+    return (primary, "gemini") if primary != "gemini" else ("gemini",)
+
+
+def _estimate(counts: dict[str, int], provider: str) -> int:
+    ratios = _CALIBRATION.get(provider, _CALIBRATION["default"])
+    return math.ceil(sum(n / ratios.get(script, ratios["other"]) for script, n in counts.items() if n))
+
+
+def count_tokens(text: str, task: Optional[str] = None) -> int:
+    """
+    Input tokens `text` costs for `task`. The prompt may be served by the
+    task's primary provider or the fallback, so the larger count is used.
+    """
+    if not text:
+        return 0
+    if PROMPT_TOKENIZER == "tiktoken":
+        encoding = _tiktoken_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    counts = _script_counts(text)
+    return max(_estimate(counts, provider) for provider in _providers_for(task))
+
+
+# ── Truncation ─────────────────────────────────────────────────────────
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"[.!?।॥]\s")
+_WORD = re.compile(r"\s")
+
+
+def _boundary(text: str, cut: int, from_end: bool = False) -> int:
+    """Move a cut position to the nearest paragraph, sentence or word boundary within 15%."""
+    window = max(1, int(cut * 0.15)) if not from_end else max(1, int((len(text) - cut) * 0.15))
+    for pattern in (_PARAGRAPH, _SENTENCE, _WORD):
+        if from_end:
+            match = pattern.search(text, cut, min(len(text), cut + window))
+            if match:
+                return match.end()
+        else:
+            matches = list(pattern.finditer(text, max(0, cut - window), cut))
+            if matches:
+                return matches[-1].end() if pattern is not _WORD else matches[-1].start()
+    return cut
+
+
+def truncate_to_tokens(text: str, max_tokens: int, task: Optional[str] = None,
+                       marker: str = "", keep: str = "head") -> str:
+    """
+    Cut `text` to at most `max_tokens`, keeping its start ("head") or its end
+    ("tail", e.g. the latest conversation turns). `marker` is added where text was cut.
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    total = count_tokens(text, task)
+    if total <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(marker, task)
+    if budget <= 0:
+        return ""
+
+    length = int(len(text) * budget / total)
+    piece = lambda n: text[:n] if keep == "head" else text[len(text) - n:]
+    while length > 0 and count_tokens(piece(length), task) > budget:
+        length = int(length * 0.95)
+    if length <= 0:
+        return ""
+
+    if keep == "head":
+        return text[:_boundary(text, length)].rstrip() + marker
+    return marker + text[_boundary(text, len(text) - length, from_end=True):].lstrip()
+
+
+def clip_chars(text: str, max_chars: int) -> str:
+    """Character limit (for APIs that count characters, e.g. TTS) cut at a sentence or word boundary."""
+    if not text or len(text) <= max_chars:
+        return text or ""
+    return text[:_boundary(text, max_chars)].rstrip()
+
+
+# ── Fitting prompt sections ────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class PromptSection:
+    name: str
+    text: str
+    priority: int = 0                 # lower is filled first
+    max_tokens: Optional[int] = None  # cap even when the budget has room
+    marker: str = ""                  # appended (or prepended) where the text was cut
+    keep: str = "head"                # "tail" keeps the end of the text
+
+
+def fit_sections(prompt: str, sections: list[PromptSection], task: Optional[str] = None,
+                 budget: Optional[int] = None) -> dict[str, str]:
+    """
+    Fit the variable sections of a prompt into its token budget
+    (prompt_budget(prompt) unless given). Sections are filled by priority;
+    each takes what it needs up to its cap, and later ones get what is left.
+    """
+    remaining = prompt_budget(prompt) if budget is None else budget
+    fitted = {}
+    for section in sorted(sections, key=lambda s: s.priority):
+        allowance = remaining if section.max_tokens is None else min(remaining, section.max_tokens)
+        tokens = count_tokens(section.text, task)
+        text = section.text
+        if tokens > allowance:
+            text = truncate_to_tokens(section.text, allowance, task, section.marker, section.keep)
+            kept = count_tokens(text, task)
+            PROMPT_TOKENS_TRIMMED.labels(prompt, section.name).inc(tokens - kept)
+            logger.info(
+                f"✂️ Prompt '{prompt}': section '{section.name}' trimmed from ~{tokens} to ~{kept} tokens"
+            )
+            tokens = kept
+        fitted[section.name] = text
+        remaining = max(0, remaining - tokens)
+    return fitted
@@ -0,0 +1,356 @@
+# -----------------------------------------------------------------------
+# tracing.py
+# Lightweight request tracing with token and cost accounting.
+#
+# Spans follow the OpenTelemetry data model (trace_id / span_id /
+# parent_span_id, attributes, events, status) but are kept in-process:
+# finished spans go to a ring buffer and, when TRACE_EXPORT_PATH is set,
+# are appended to a JSONL file. The current span lives in a ContextVar, so
+# it follows work into LangGraph's worker threads like the deadlines do.
+#
+# Attribution keys (request_id, run_id, learning_space_id, user_id, node)
+# are inherited from the parent span, so every LLM call can be summed per
+# request, graph node, learning space and user.
+# -----------------------------------------------------------------------
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterable, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from src.configs.config import env_float, env_str
+
+logger = logging.getLogger(__name__)
+
+TRACE_BUFFER_SIZE = int(env_float("TRACE_BUFFER_SIZE", 5000))
+TRACE_EXPORT_PATH = env_str("TRACE_EXPORT_PATH", "")
+
+# Copied from the parent span so child spans can be grouped by them
+ATTRIBUTION_KEYS = ("request_id", "run_id", "learning_space_id", "user_id", "node")
+
+# USD per 1M tokens (input, output), list prices. Override or extend with
+# LLM_PRICES_JSON='{"model-name": [input, output]}'.
+PRICES_PER_MILLION: dict[str, tuple[float, float]] = {
+    "gemini-2.5-flash":        (0.30, 2.50),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "mistral-large-latest":    (2.00, 6.00),
+    "deepseek-chat":           (0.27, 1.10),
+}
+try:
+    PRICES_PER_MILLION.update({
+        model: tuple(prices) for model, prices in json.loads(env_str("LLM_PRICES_JSON", "{}")).items()
+    })
+except (ValueError, TypeError, AttributeError):
+    logger.warning("LLM_PRICES_JSON is not valid JSON — using the built-in price table.")
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, output_tokens: int) -> Optional[float]:
+    prices = PRICES_PER_MILLION.get(model or "")
+    if not prices:
+        return None
+    return round((input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000, 8)
+
+
+# ── Spans ──────────────────────────────────────────────────────────────
+
+class Span:
+    """A timed operation. Attributes are plain JSON values."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start", "end",
+                 "attributes", "events", "status", "error", "_lock")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.end: Optional[float] = None
+        inherited = {k: parent.attributes[k] for k in ATTRIBUTION_KEYS if parent and k in parent.attributes}
+        self.attributes = {**inherited, **{k: v for k, v in attributes.items() if v is not None}}
+        self.attributes.setdefault("request_id", self.trace_id)
+        self.events: list[dict] = []
+        self.status = "unset"
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def increment(self, key: str, amount: float = 1):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def add_event(self, name: str, **attributes):
+        with self._lock:
+            self.events.append({"name": name, "at": time.time(), "attributes": attributes})
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": None if self.end is None else round(self.duration * 1000, 2),
+            "attributes": dict(self.attributes),
+            "events": list(self.events),
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class LocalSpanExporter:
+    """Keeps the last TRACE_BUFFER_SIZE finished spans; optionally appends them to a JSONL file."""
+
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE, path: str = TRACE_EXPORT_PATH):
+        self._lock = threading.Lock()
+        self._spans: deque = deque(maxlen=max_spans)
+        self._path = path
+
+    def export(self, span: Span):
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+            if self._path:
+                try:
+                    with open(self._path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, default=str) + "\n")
+                except OSError as e:
+                    logger.warning(f"[Tracing] Could not write span to {self._path}: {e}")
+                    self._path = ""
+
+    def spans(self, name: Optional[str] = None, since: Optional[float] = None, **filters) -> list[dict]:
+        with self._lock:
+            snapshot = list(self._spans)
+        return [
+            s for s in snapshot
+            if (name is None or s["name"] == name)
+            and (since is None or s["start"] >= since)
+            and all(s["attributes"].get(k) == v for k, v in filters.items() if v is not None)
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+span_exporter = LocalSpanExporter()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name: str, **attributes):
+    """Open a child of the current span (or a new trace) for the duration of the block."""
+    span = Span(name, current_span(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+        if span.status == "unset":
+            span.status = "ok"
+    except BaseException as e:
+        span.status = "error"
+        span.error = str(e)[:500]
+        raise
+    finally:
+        span.end = time.time()
+        _current_span.reset(token)
+        span_exporter.export(span)
+
+
+def set_span_attributes(**attributes):
+    span = current_span()
+    if span is not None:
+        span.set(**attributes)
+
+
+def record_retry(error: Exception, attempt: int, delay: float, reason: Optional[str] = None):
+    """Called by invoke_with_retry before each backoff sleep."""
+    span = current_span()
+    if span is not None:
+        span.increment("retries")
+        span.add_event("retry", attempt=attempt, delay=round(delay, 3), reason=reason, error=str(error)[:200])
+
+
+# ── Token usage from LangChain responses ───────────────────────────────
+
+class UsageCallback(BaseCallbackHandler):
+    """
+    Adds the provider-reported token usage of every chat model call in a
+    chain to `span`. Reads `usage_metadata` on the message first and falls
+    back to OpenAI-style `llm_output["token_usage"]`.
+    """
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def on_llm_end(self, response, **kwargs: Any):
+        input_tokens = output_tokens = cached_tokens = 0
+        model = None
+        found = False
+        for generations in response.generations or []:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    found = True
+                    input_tokens += usage.get("input_tokens", 0) or 0
+                    output_tokens += usage.get("output_tokens", 0) or 0
+                    cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+                metadata = getattr(message, "response_metadata", None) or {}
+                model = model or metadata.get("model_name") or metadata.get("model")
+
+        llm_output = response.llm_output or {}
+        if not found:
+            usage = llm_output.get("token_usage") or llm_output.get("usage") or {}
+            if usage:
+                found = True
+                input_tokens = usage.get("prompt_tokens", 0) or 0
+                output_tokens = usage.get("completion_tokens", 0) or 0
+        model = model or llm_output.get("model_name")
+
+        if not found:
+            self.span.set(usage_reported=False)
+            return
+        self.span.increment("input_tokens", input_tokens)
+        self.span.increment("output_tokens", output_tokens)
+        if cached_tokens:
+            self.span.increment("cached_input_tokens", cached_tokens)
+        self.span.set(usage_reported=True, response_model=model)
+
+
+def finalize_llm_span(span: Span, ok: bool):
+    """Price the tokens recorded on an `llm.call` span and add it to the open usage tallies."""
+    # Builders may silently fall back to Gemini, so prefer the model the provider reported
+    model = span.attributes.get("response_model")
+    if model not in PRICES_PER_MILLION:
+        model = span.attributes.get("model")
+    cost = estimate_cost(
+        model,
+        span.attributes.get("input_tokens", 0),
+        span.attributes.get("output_tokens", 0),
+    )
+    span.set(cost_usd=cost)
+    for tally in _usage_tallies.get():
+        tally.add(span.attributes, ok)
+
+
+# ── Usage of one scope ─────────────────────────────────────────────────
+
+class UsageTally:
+    """
+    The LLM calls finished inside a usage_scope(), collected as each call
+    ends rather than read back from the (bounded) span buffer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: list[dict] = []
+
+    def add(self, attributes: dict, ok: bool):
+        with self._lock:
+            self._calls.append({"attributes": dict(attributes), "ok": ok})
+
+    def provider(self, task: str) -> Optional[str]:
+        """Provider that answered `task` here ("gemini+groq" if several did), None if no call succeeded."""
+        with self._lock:
+            providers = {c["attributes"].get("provider") or "unknown"
+                         for c in self._calls if c["ok"] and c["attributes"].get("task") == task}
+        return "+".join(sorted(providers)) or None
+
+    def report(self, group_by: str = "node") -> list[dict]:
+        """Like usage_report(), for exactly the calls of this scope."""
+        with self._lock:
+            calls = list(self._calls)
+        return _usage_rows(calls, group_by)
+
+
+_usage_tallies: ContextVar[tuple] = ContextVar("usage_tallies", default=())
+
+
+@contextmanager
+def usage_scope():
+    """Tally the LLM calls made in this block, including those in threads it starts with its context."""
+    tally = UsageTally()
+    token = _usage_tallies.set(_usage_tallies.get() + (tally,))
+    try:
+        yield tally
+    finally:
+        _usage_tallies.reset(token)
+
+
+# ── Aggregation ────────────────────────────────────────────────────────
+
+def percentile(sorted_values: list, q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _group_key(span: dict, group_by: Iterable[str]) -> tuple:
+    return tuple(span["attributes"].get(k) for k in group_by)
+
+
+def latency_report(name: str = "llm.call", group_by: tuple = ("task", "provider"),
+                   since: Optional[float] = None, **filters) -> list[dict]:
+    """p50/p95/p99 latency (ms) plus token, cost, retry and error totals per group."""
+    groups: dict[tuple, list[dict]] = {}
+    for span in span_exporter.spans(name=name, since=since, **filters):
+        groups.setdefault(_group_key(span, group_by), []).append(span)
+
+    report = []
+    for key, spans in groups.items():
+        latencies = sorted(s["duration_ms"] for s in spans)
+        report.append({
+            **dict(zip(group_by, key)),
+            "count": len(spans),
+            "errors": sum(1 for s in spans if s["status"] == "error"),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            **_totals(spans),
+        })
+    return sorted(report, key=lambda r: -r["count"])
+
+
+def usage_report(group_by: str = "learning_space_id", since: Optional[float] = None, **filters) -> list[dict]:
+    """Token, cost, retry and fallback totals of LLM calls grouped by one attribution key."""
+    return _usage_rows(span_exporter.spans(name="llm.call", since=since, **filters), group_by)
+
+
+def _usage_rows(spans: list[dict], group_by: str) -> list[dict]:
+    groups: dict[Any, list[dict]] = {}
+    for span in spans:
+        groups.setdefault(span["attributes"].get(group_by), []).append(span)
+    report = [{group_by: key, "calls": len(spans), **_totals(spans)} for key, spans in groups.items()]
+    return sorted(report, key=lambda r: -(r["cost_usd"] or 0))
+
+
+def _totals(spans: list[dict]) -> dict:
+    costs = [s["attributes"].get("cost_usd") for s in spans]
+    return {
+        "input_tokens": sum(s["attributes"].get("input_tokens", 0) for s in spans),
+        "output_tokens": sum(s["attributes"].get("output_tokens", 0) for s in spans),
+        "cost_usd": round(sum(c for c in costs if c), 6),
+        "unpriced_calls": sum(1 for c in costs if c is None),
+        "retries": sum(s["attributes"].get("retries", 0) for s in spans),
+        "fallbacks": sum(1 for s in spans if s["attributes"].get("fallback")),
+    }
@@ -1,6 +1,13 @@
 import re
-from youtube_transcript_api import YouTubeTranscriptApi
 from typing import Optional
+from src.configs.config import prompt_budget
+from src.utils.metrics import metrics, timed
+from src.utils.token_budget import truncate_to_tokens
+
+# Extractors return "" on failure, so empty results are counted separately
+EXTRACTION_LATENCY = metrics.histogram(
+    "source_extraction_duration_seconds", "Source material extraction by source type.", ["source", "outcome"]
+)
 
 def extract_video_id(url: str) -> Optional[str]:
     """
@@ -17,9 +24,10 @@ def extract_video_id(url: str) -> Optional[str]:
             return match.group(1)
     return None
 
+@timed(EXTRACTION_LATENCY, empty_is_failure=True, source="youtube")
 def fetch_youtube_transcript(url: str, languages=['en', 'hi', 'te', 'ta', 'kn', 'ml']) -> str:
     """
-    Fetches the transcript for a YouTube video.
+    Fetches the transcript for a YouTube video, cut to the summariser's token budget.
     Attempts common Indian languages if English is not primary.
     """
     video_id = extract_video_id(url)
@@ -27,6 +35,8 @@ def fetch_youtube_transcript(url: str, languages=['en', 'hi', 'te', 'ta', 'kn',
         return ""
 
     try:
+        from youtube_transcript_api import YouTubeTranscriptApi
+
         # Try to get the transcript
         transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
         
@@ -34,13 +44,16 @@ def fetch_youtube_transcript(url: str, languages=['en', 'hi', 'te', 'ta', 'kn',
         try:
             transcript = transcript_list.find_transcript(languages)
             data = transcript.fetch()
-            return " ".join([item['text'] for item in data])
         except:
             # Fallback to the first available transcript
             transcript = next(iter(transcript_list))
             data = transcript.fetch()
-            return " ".join([item['text'] for item in data])
-            
+
+        text = " ".join([item['text'] for item in data])
+        return truncate_to_tokens(
+            text, prompt_budget("source"), task="summary", marker=" [... TRANSCRIPT TRUNCATED DUE TO LENGTH ...]"
+        )
+
     except Exception as e:
         print(f"Error fetching YouTube transcript: {e}")
         return ""
@@ -0,0 +1,26 @@
+# Tests run offline: in-memory Supabase, fake LLM providers without the
+# simulated latency, per-process shared state. Set before any src.* import - config
+# is read once at import.
+
+import os
+import sys
+
+os.environ["SUPABASE_BACKEND"] = "memory"
+os.environ["FAKE_LLM"] = "true"
+os.environ["FAKE_LLM_TIME_SCALE"] = "0"
+os.environ["SHARED_STATE_BACKEND"] = "memory"
+os.environ["PRELOAD_AGENT_GRAPH"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """The in-memory Supabase client, emptied before and after the test."""
+    from src.services.supabase_service import supabase_service
+    client = supabase_service.client
+    client.reset()
+    yield client
+    client.reset()
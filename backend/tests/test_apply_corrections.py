@@ -0,0 +1,36 @@
+from src.agents.nodes.node_verifier import apply_corrections
+from src.agents.output_structures import SummaryCorrection
+
+SUMMARY = "Photosynthesis happens in the mitochondria.\nIt releases  oxygen\nas a by-product. Plants are animals."
+
+
+def _fix(span, replacement, reason="wrong"):
+    return SummaryCorrection(span=span, replacement=replacement, reason=reason)
+
+
+def test_exact_span_is_replaced():
+    text, applied = apply_corrections(SUMMARY, [_fix("in the mitochondria", "in the chloroplasts")])
+    assert "in the chloroplasts." in text and "mitochondria" not in text
+    assert len(applied) == 1
+
+
+def test_span_matches_across_different_whitespace():
+    text, applied = apply_corrections(SUMMARY, [_fix("It releases oxygen as a by-product.", "It releases oxygen.")])
+    assert "It releases oxygen. Plants" in text
+    assert len(applied) == 1
+
+
+def test_empty_replacement_deletes_the_span():
+    text, _ = apply_corrections(SUMMARY, [_fix("Plants are animals.", "")])
+    assert text.rstrip().endswith("as a by-product.") and "animals" not in text
+
+
+def test_unknown_and_blank_spans_are_ignored():
+    text, applied = apply_corrections(SUMMARY, [_fix("Plants are fungi.", "x"), _fix("   ", "x")])
+    assert text == SUMMARY and applied == []
+
+
+def test_only_the_first_occurrence_is_replaced_and_corrections_apply_in_order():
+    text, applied = apply_corrections("a cat and a cat", [_fix("cat", "dog"), _fix("a dog", "one dog")])
+    assert text == "one dog and a cat"
+    assert len(applied) == 2
@@ -0,0 +1,73 @@
+from src.api.routes import workflow
+from src.services import agent_workflow
+from src.services import supabase_service as supabase_module
+from src.services.run_lease import RunLease
+from src.services.supabase_service import supabase_service
+
+
+def _spaces(db, count, **fields):
+    db.seed("learning_space", [
+        {"id": f"s{i}", "user_id": "u1", "topic": f"topic {i}", "status": "normal", **fields} for i in range(count)
+    ])
+
+
+def test_get_learning_spaces_chunks_long_id_lists(db, monkeypatch):
+    _spaces(db, 250)
+    chunks = []
+    original = type(db.table("learning_space")).in_
+
+    def counting_in(query, column, values):
+        chunks.append(len(values))
+        return original(query, column, values)
+
+    monkeypatch.setattr(type(db.table("learning_space")), "in_", counting_in)
+    rows = supabase_service.get_learning_spaces([f"s{i}" for i in range(250)] + ["s0", "missing"], "topic")
+
+    assert chunks == [100, 100, 51]
+    assert len(rows) == 250
+    assert rows["s7"]["topic"] == "topic 7"
+    assert max(chunks) <= supabase_module.IN_QUERY_CHUNK
+
+
+def test_bulk_regeneration_reads_spaces_one_query_per_chunk(db, monkeypatch):
+    _spaces(db, 150)
+    db.seed("student_profile", [{"user_id": "u1", "grade_level": "8", "language": "English"}])
+    reads, seen = [], []
+    original = supabase_service.get_learning_spaces
+
+    def counting_reads(space_ids, columns="*"):
+        reads.append(len(space_ids))
+        return original(space_ids, columns)
+
+    def fake_invoke(space_id, user_id, language, learning_space=None, student_profile=None):
+        seen.append(learning_space["topic"])
+
+    monkeypatch.setattr(supabase_service, "get_learning_spaces", counting_reads)
+    monkeypatch.setattr(workflow, "invoke_agent_workflow", fake_invoke)
+    monkeypatch.setattr(workflow.time, "sleep", lambda seconds: None)
+    job = workflow.job_manager.register_user_job("u1", workflow.job_manager.cancel_all_user_jobs("u1"))
+    workflow._regenerate_all_spaces_sequentially("u1", None, job, [f"s{i}" for i in range(150)])
+
+    assert reads == [100, 50]
+    assert seen == [f"topic {i}" for i in range(150)]
+
+
+def test_bulk_regeneration_skips_spaces_claimed_or_deleted_after_the_prefetch(db, monkeypatch):
+    _spaces(db, 3)
+    db.seed("student_profile", [{"user_id": "u1", "grade_level": "8", "language": "English"}])
+    ran = []
+
+    def record_run(run, initial_state):
+        ran.append(run["learning_space_id"])
+        if run["learning_space_id"] == "s0":
+            # Another run claims s1 and s2 is deleted while the job is still on the first space
+            assert RunLease("s1", heartbeat_seconds=60).acquire()
+            db.table("learning_space").delete().eq("id", "s2").execute()
+        return None
+
+    monkeypatch.setattr(agent_workflow, "_stream_workflow", record_run)
+    monkeypatch.setattr(workflow.time, "sleep", lambda seconds: None)
+    job = workflow.job_manager.register_user_job("u1", workflow.job_manager.cancel_all_user_jobs("u1"))
+    workflow._regenerate_all_spaces_sequentially("u1", None, job, ["s0", "s1", "s2"])
+
+    assert ran == ["s0"]
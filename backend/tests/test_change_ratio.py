@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from src.agents.nodes import node_audio_summary
+from src.agents.nodes.node_verifier import apply_corrections, change_ratio
+
+
+def _summary(sentences=100):
+    return " ".join(f"Sentence {i} says chlorophyll absorbs light in leaf {i}." for i in range(sentences))
+
+
+def test_identical_text_has_no_change():
+    assert change_ratio(_summary(), _summary()) == 0.0
+
+
+def test_one_replaced_sentence_is_about_its_share_of_the_words():
+    before = _summary()
+    after = before.replace("Sentence 40 says chlorophyll absorbs light in leaf 40.",
+                           "Mitochondria release energy from glucose during cellular respiration.")
+    # 8 of ~800 words
+    assert 0.005 < change_ratio(before, after) < 0.015
+
+
+def test_diff_corrections_and_a_rewrite_with_the_same_result_score_the_same():
+    before = _summary()
+    span = "chlorophyll absorbs light in leaf 7."
+    corrected, applied = apply_corrections(before, [SimpleNamespace(span=span, replacement="stomata absorb CO2.")])
+    assert applied
+    rewrite = before.replace(span, "stomata absorb CO2.")
+    assert change_ratio(before, corrected) == change_ratio(before, rewrite)
+
+
+def test_reconcile_keeps_the_speculative_script_below_the_threshold(monkeypatch):
+    monkeypatch.setattr(node_audio_summary, "AUDIO_RERUN_CHANGE_RATIO", 0.01)
+    monkeypatch.setattr(node_audio_summary, "run_node_audio_overview", lambda state: {"podcast_script": "new"})
+
+    kept = node_audio_summary.run_node_audio_reconcile({"verification_stats": {"changed_ratio": 0.004}})
+    assert kept == {"audio_speculation": {"kept": True, "changed_ratio": 0.004}}
+
+    rerun = node_audio_summary.run_node_audio_reconcile({"verification_stats": {"changed_ratio": 0.03}})
+    assert rerun["podcast_script"] == "new" and rerun["audio_speculation"]["kept"] is False
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from src.agents import graph
+from src.services.run_lease import RunLease
+from src.services.supabase_service import run_write_scope, supabase_service
+from src.utils.deadline import Deadline, deadline_scope
+
+
+def _quiz(db, space_id="s1"):
+    return next(r for r in db.rows("learning_space") if r["id"] == space_id).get("quiz")
+
+
+def _held_lease(db) -> RunLease:
+    db.seed("learning_space", [{"id": "s1", "user_id": "u1", "topic": "t", "status": "normal"}])
+    lease = RunLease("s1", heartbeat_seconds=60)
+    assert lease.acquire()
+    return lease
+
+
+def test_write_applies_while_the_run_holds_the_lease(db):
+    lease = _held_lease(db)
+    with run_write_scope(lease.run_id):
+        assert supabase_service.update_learning_space("s1", {"quiz": "q1"}) is not None
+    assert _quiz(db) == "q1"
+    lease.release("normal")
+
+
+def test_write_after_release_is_dropped(db):
+    lease = _held_lease(db)
+    lease.release("normal")
+    with run_write_scope(lease.run_id):
+        assert supabase_service.update_learning_space("s1", {"quiz": "late"}) is None
+    assert _quiz(db) is None
+
+
+def test_write_from_a_superseded_run_is_dropped(db):
+    old = _held_lease(db)
+    db.table("learning_space").update({"lease_expires_at": "2000-01-01T00:00:00+00:00"}).eq("id", "s1").execute()
+    new = RunLease("s1", heartbeat_seconds=60)
+    assert new.acquire()
+    with run_write_scope(old.run_id):
+        supabase_service.update_learning_space("s1", {"quiz": "stale"})
+    assert _quiz(db) is None
+    new.release("normal")
+
+
+def test_write_with_a_cancelled_deadline_is_dropped(db):
+    lease = _held_lease(db)
+    deadline = Deadline(60)
+    deadline.cancel()
+    with run_write_scope(lease.run_id), deadline_scope(deadline=deadline):
+        assert supabase_service.update_learning_space("s1", {"quiz": "late"}) is None
+    assert _quiz(db) is None
+    lease.release("normal")
+
+
+def test_writes_outside_a_run_are_not_fenced(db):
+    db.seed("learning_space", [{"id": "s1", "user_id": "u1", "topic": "t", "status": "normal"}])
+    assert supabase_service.update_learning_space("s1", {"quiz": "manual"}) is not None
+    assert _quiz(db) == "manual"
+
+
+def test_timed_out_node_cannot_write_its_artifact(db, monkeypatch):
+    lease = _held_lease(db)
+    monkeypatch.setattr(graph, "node_timeout", lambda name: 0.1)
+    wrote = threading.Event()
+
+    def slow_node(state):
+        time.sleep(0.3)   # an in-flight provider call that finishes after the budget
+        supabase_service.update_learning_space("s1", {"quiz": "late"})
+        wrote.set()
+        return {"quiz": "late"}
+
+    with run_write_scope(lease.run_id), deadline_scope(60):
+        assert graph._bounded("quiz", slow_node)({}) == {"timed_out_nodes": ["quiz"]}
+    assert wrote.wait(2)
+    assert _quiz(db) is None
+    lease.release("normal")
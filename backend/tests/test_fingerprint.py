@@ -0,0 +1,107 @@
+import pytest
+
+from src.agents import fingerprint, graph
+from src.agents.fingerprint import SUMMARY_HASH_KEY, artifact_task, can_skip, compute_fingerprint
+from src.utils.model_router import provider_for_task
+from src.utils.tracing import finalize_llm_span, start_span, usage_scope
+
+
+def _state(**overrides):
+    state = {
+        "learning_space_id": "s1",
+        "student_profile": {"grade_level": "Class 8", "gender": "", "language": "English"},
+        "user_prompt": {"topic": "Photosynthesis", "file_url": ""},
+        "fingerprints": {SUMMARY_HASH_KEY: "abc"},
+        "stored_fingerprints": {},
+    }
+    state.update(overrides)
+    return state
+
+
+def _llm_call(task, provider, fail=False):
+    """A finished `llm.call` span as the router records it."""
+    with start_span("llm.call", task=task, provider=provider) as span:
+        ok = False
+        try:
+            if fail:
+                raise RuntimeError("provider down")
+            ok = True
+        finally:
+            finalize_llm_span(span, ok)
+
+
+def _quiz_node(provider):
+    def node(state):
+        _llm_call("quiz", provider)
+        return {"quiz": {"questions": ["q"]}}
+    return node
+
+
+def test_fingerprint_defaults_to_the_routed_provider():
+    state = _state()
+    routed = provider_for_task("quiz")
+    assert compute_fingerprint("quiz", state) == compute_fingerprint("quiz", state, routed)
+    assert compute_fingerprint("quiz", state) != compute_fingerprint("quiz", state, "gemini+" + routed)
+
+
+def test_profile_fields_the_prompts_ignore_do_not_change_the_fingerprint():
+    extra = _state(student_profile={**_state()["student_profile"], "adaptivity_level": "high"})
+    assert compute_fingerprint("quiz", extra) == compute_fingerprint("quiz", _state())
+
+
+def test_artifact_from_the_routed_provider_is_skipped_next_run():
+    run = graph._incremental("quiz", _quiz_node(provider_for_task("quiz")))
+    stored = run(_state())["fingerprints"]
+
+    next_run = _state(stored_fingerprints=stored, quiz={"questions": ["q"]})
+    assert can_skip("quiz", next_run, compute_fingerprint("quiz", next_run))
+
+
+def test_artifact_from_a_fallback_provider_is_regenerated_next_run():
+    assert provider_for_task("quiz") != "gemini"
+    run = graph._incremental("quiz", _quiz_node("gemini"))
+    stored = run(_state())["fingerprints"]
+
+    assert stored["quiz"]
+    next_run = _state(stored_fingerprints=stored, quiz={"questions": ["q"]})
+    assert not can_skip("quiz", next_run, compute_fingerprint("quiz", next_run))
+
+
+def test_tally_counts_only_successful_calls_of_the_task():
+    with usage_scope() as usage:
+        with pytest.raises(RuntimeError):
+            _llm_call("quiz", "groq", fail=True)
+        _llm_call("quiz", "gemini")
+        _llm_call("verification", "mistral")
+    assert usage.provider("quiz") == "gemini"
+    assert usage.provider("audio") is None
+
+
+def test_combined_mode_fingerprints_with_the_study_pack_provider(monkeypatch):
+    monkeypatch.setattr(fingerprint, "GENERATION_MODE", "combined")
+    assert artifact_task("quiz") == "study_pack"
+    assert artifact_task("audio_summary") == "audio"
+    state = _state()
+    assert compute_fingerprint("quiz", state) == compute_fingerprint("quiz", state, provider_for_task("study_pack"))
+
+
+def test_study_pack_parse_failure_fingerprints_the_per_artifact_provider(db, monkeypatch):
+    from langchain_core.messages import AIMessage
+    from src.agents.nodes import node_study_pack
+
+    monkeypatch.setattr(fingerprint, "GENERATION_MODE", "combined")
+    # The combined call answers, but with nothing that validates
+    monkeypatch.setattr(node_study_pack, "call_with_fallback",
+                        lambda **kwargs: AIMessage(content='{"quiz": {"questions": "not a list"}}'))
+    state = _state(summary_notes="Plants turn light into glucose in their chloroplasts.")
+
+    update = node_study_pack.run_node_study_pack(state)
+
+    assert update["generation_stats"]["fallbacks"] == ["quiz", "flashcards", "recommendation"]
+    assert update["quiz"]
+    quiz_provider = provider_for_task("quiz")
+    assert quiz_provider != provider_for_task("study_pack")
+    assert update["fingerprints"]["quiz"] == compute_fingerprint("quiz", state, quiz_provider)
+    # So the next run retries the combined call instead of skipping
+    next_run = _state(stored_fingerprints=update["fingerprints"], quiz=update["quiz"])
+    assert not can_skip("quiz", next_run, compute_fingerprint("quiz", next_run))
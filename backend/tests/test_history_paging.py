@@ -0,0 +1,90 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from src.api.routes.doubt import _decode_cursor, _encode_cursor, get_doubt_history
+
+
+def _seed(db, count=7):
+    # Pairs of rows share a timestamp, so paging must fall back to id order
+    rows = [{"id": f"m{i:02d}", "created_at": f"2026-01-01T10:00:{i // 2:02d}+00:00",
+             "learning_space_id": "s1", "user_id": "u1", "role": "user", "content": f"c{i}"}
+            for i in range(count)]
+    rows.append({"id": "other", "created_at": "2026-01-01T10:00:00+00:00",
+                 "learning_space_id": "s2", "user_id": "u1", "role": "user", "content": "not this chat"})
+    db.seed("doubt_messages", rows)
+
+
+def _page(**params):
+    params = {"limit": 3, "before": None, "since": None, "fields": "role,content", "if_none_match": None, **params}
+    response = get_doubt_history("s1", "u1", **params)
+    return response, (json.loads(response.body) if response.body else None)
+
+
+def _ids(body):
+    return [m["id"] for m in body["messages"]]
+
+
+def test_paging_back_visits_every_message_once_oldest_first(db):
+    _seed(db)
+    _, page = _page()
+    assert _ids(page) == ["m04", "m05", "m06"] and page["has_more"]
+
+    seen = _ids(page)
+    while page["has_more"]:
+        _, page = _page(before=page["before_cursor"])
+        seen = _ids(page) + seen
+    assert seen == [f"m{i:02d}" for i in range(7)]
+
+
+def test_since_returns_only_newer_messages(db):
+    _seed(db)
+    _, latest = _page()
+    db.seed("doubt_messages", [{"id": "m07", "created_at": "2026-01-01T10:00:03+00:00",
+                                "learning_space_id": "s1", "user_id": "u1", "role": "assistant", "content": "new"}])
+
+    _, delta = _page(since=latest["since_cursor"])
+    assert _ids(delta) == ["m07"] and not delta["has_more"]
+
+    _, empty = _page(since=delta["since_cursor"])
+    assert empty["messages"] == [] and empty["since_cursor"] == delta["since_cursor"]
+
+
+def test_fields_and_etag(db):
+    _seed(db)
+    response, page = _page(fields="content")
+    assert set(page["messages"][0]) == {"id", "created_at", "content"}
+
+    not_modified, _ = _page(fields="content", if_none_match=response.headers["etag"])
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.parametrize("params", [
+    {"before": "not-a-cursor"}, {"fields": "password"},
+    {"before": _encode_cursor({"created_at": "t", "id": "1"}), "since": _encode_cursor({"created_at": "t", "id": "1"})},
+])
+def test_bad_requests(db, params):
+    with pytest.raises(HTTPException) as error:
+        _page(**params)
+    assert error.value.status_code == 400
+
+
+def test_cursor_round_trip():
+    message = {"created_at": "2026-01-01T10:00:00.000001+00:00", "id": "9f1c"}
+    assert _decode_cursor(_encode_cursor(message)) == (message["created_at"], message["id"])
+
+
+def test_a_batch_is_saved_in_question_answer_order(db, monkeypatch):
+    from src.api.routes import doubt
+    from src.services import memory_supabase
+    # Like Postgres now(): one timestamp for every row of the insert
+    monkeypatch.setattr(memory_supabase, "_now_iso", lambda: "2026-01-01T10:00:00+00:00")
+    monkeypatch.setattr(doubt.conversation_store, "record_exchange", lambda *args: None)
+    ctx = SimpleNamespace(learning_space_id="s1", user_id="u1")
+    exchanges = [(f"q{i}", f"a{i}") for i in range(20)]
+    doubt._save_exchanges(ctx, exchanges)
+
+    _, page = _page(limit=200)
+    assert [m["content"] for m in page["messages"]] == [text for pair in exchanges for text in pair]
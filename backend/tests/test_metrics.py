@@ -0,0 +1,27 @@
+import pytest
+
+from src.utils.metrics import MetricsRegistry, _Metric
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("m", "doc")
+
+    class Incomplete(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Incomplete("m", "doc")
+
+
+def test_registry_renders_every_kind():
+    registry = MetricsRegistry()
+    registry.counter("jobs", "Jobs.", ["status"]).labels("ok").inc(2)
+    registry.gauge("depth", "Depth.", callback=lambda: 3).set(99)  # the callback wins
+    registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)).observe(0.5)
+
+    text = registry.render()
+    assert 'jobs_total{status="ok"} 2' in text
+    assert "depth 3" in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text and 'latency_seconds_bucket{le="1"} 1' in text
+    assert "latency_seconds_count 1" in text
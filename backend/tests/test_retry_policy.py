@@ -0,0 +1,163 @@
+import contextvars
+import threading
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import llm_utils, retry_policy
+from src.utils.retry_policy import (
+    ProviderRetryBudget, RequestRetryBudget, acquire_retry, classify_error, retry_budget_scope,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, message="error", status_code=None, code=None, response=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.response = response
+        self.retry_after = retry_after
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fresh_provider_budget(monkeypatch):
+    budget = ProviderRetryBudget(ratio=0.5, min_retries=2, window_seconds=60)
+    monkeypatch.setattr(retry_policy, "provider_retry_budget", budget)
+    monkeypatch.setattr(llm_utils, "provider_retry_budget", budget)
+    return budget
+
+
+# ── classify_error ─────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("status, retryable", [
+    (429, True), (503, True), (529, True), (408, True), (400, False), (401, False), (404, False), (422, False),
+])
+def test_status_codes(status, retryable):
+    decision = classify_error(StatusError(status_code=status))
+    assert (decision.retryable, decision.reason, decision.status) == (retryable, str(status), status)
+
+
+def test_status_is_found_on_any_sdk_attribute_and_in_the_cause_chain():
+    assert classify_error(StatusError(code=503)).status == 503  # google
+    assert classify_error(StatusError(response=SimpleNamespace(status_code=502, headers={}))).status == 502  # httpx
+    try:
+        try:
+            raise StatusError(status_code=429)
+        except StatusError as e:
+            raise ValueError("output parser failed") from e
+    except ValueError as wrapped:
+        assert classify_error(wrapped).reason == "429"
+
+
+def test_retry_after_seconds_and_http_date():
+    headers = {"retry-after": "7"}
+    assert classify_error(StatusError(status_code=429, response=SimpleNamespace(status_code=429, headers=headers))
+                          ).retry_after == 7.0
+    later = formatdate(time.time() + 30, usegmt=True)
+    assert 25 < classify_error(StatusError(status_code=503, retry_after=later)).retry_after <= 30
+
+
+def test_zero_quota_is_not_retried():
+    decision = classify_error(StatusError("Quota exceeded, limit: 0", status_code=429))
+    assert (decision.retryable, decision.reason) == (False, "quota_zero")
+
+
+def test_errors_without_a_status():
+    assert classify_error(APITimeoutError()).reason == "timeout"
+    assert classify_error(TimeoutError()).reason == "timeout"
+    assert classify_error(APIConnectionError()).reason == "connection"
+    assert classify_error(KeyError("x")) == retry_policy.RetryDecision(False, "bug")
+    assert classify_error(ValueError("malformed JSON")).reason == "unknown"
+    assert classify_error(ValueError("malformed JSON")).retryable
+
+
+# ── Budgets ────────────────────────────────────────────────────────────
+
+def test_provider_budget_allows_min_retries_plus_a_share_of_calls(monkeypatch):
+    budget = ProviderRetryBudget(ratio=0.5, min_retries=2, window_seconds=10)
+    clock = [100.0]
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: clock[0])
+
+    for _ in range(4):
+        budget.record_call("groq")
+    granted = sum(budget.try_acquire("groq") for _ in range(10))
+    assert granted == 2 + 0.5 * 4
+    assert budget.try_acquire("mistral")  # budgets are per provider
+
+    clock[0] += 11  # the window rolled over
+    assert budget.try_acquire("groq")
+
+
+def test_request_budget_is_shared_by_threads_in_the_scope(fresh_provider_budget):
+    fresh_provider_budget.min_retries = 100
+    granted = []
+    with retry_budget_scope(max_retries=3):
+        # Worker threads run in a copy of the caller's context, as graph._bounded starts them
+        workers = [
+            threading.Thread(target=contextvars.copy_context().run,
+                             args=(lambda: granted.append(acquire_retry("groq", "429")),))
+            for _ in range(8)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    assert granted.count(True) == 3
+
+
+def test_request_budget_counts_down():
+    budget = RequestRetryBudget(max_retries=2)
+    assert [budget.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+# ── invoke_with_retry ──────────────────────────────────────────────────
+
+def _flaky(errors):
+    calls = []
+
+    def invoke(_):
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return invoke, calls
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    waits = []
+    monkeypatch.setattr(llm_utils, "sleep_with_deadline", lambda seconds, *a, **k: waits.append(seconds))
+    return waits
+
+
+def test_transient_errors_are_retried_with_retry_after(no_sleep):
+    invoke, calls = _flaky([StatusError(status_code=429, retry_after="1"), APITimeoutError()])
+    assert llm_utils.invoke_with_retry(invoke, {}, max_retries=3, initial_delay=0.25, provider="groq") == "ok"
+    assert len(calls) == 3
+    # Retry-After replaces the backoff, which still doubles for the next retry
+    assert 1.0 <= no_sleep[0] <= 1.1 and 0.5 <= no_sleep[1] <= 0.55
+
+
+def test_unretryable_errors_fail_at_once(no_sleep):
+    invoke, calls = _flaky([StatusError(status_code=400)])
+    with pytest.raises(StatusError):
+        llm_utils.invoke_with_retry(invoke, {}, max_retries=3, provider="groq")
+    assert len(calls) == 1 and no_sleep == []
+
+
+def test_spent_request_budget_stops_retries(no_sleep):
+    invoke, calls = _flaky([StatusError(status_code=503) for _ in range(5)])
+    with retry_budget_scope(max_retries=1), pytest.raises(StatusError):
+        llm_utils.invoke_with_retry(invoke, {}, max_retries=5, provider="groq")
+    assert len(calls) == 2
@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+
+from src.services import agent_workflow
+from src.services.run_lease import RunLease
+from src.services.supabase_service import supabase_service
+
+
+def _space(db, space_id="s1", **fields):
+    db.seed("learning_space", [{"id": space_id, "user_id": "u1", "topic": "t", "status": "normal", **fields}])
+
+
+def _row(db, space_id="s1"):
+    return next(r for r in db.rows("learning_space") if r["id"] == space_id)
+
+
+def _expire(db, space_id="s1"):
+    db.table("learning_space").update({"lease_expires_at": "2000-01-01T00:00:00+00:00"}).eq("id", space_id).execute()
+
+
+def test_only_one_concurrent_acquire_wins(db):
+    _space(db)
+    winners = []
+
+    def claim():
+        lease = RunLease("s1", heartbeat_seconds=60)
+        if lease.acquire():
+            winners.append(lease)
+
+    threads = [threading.Thread(target=claim) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(winners) == 1
+    assert _row(db)["status"] == "generating"
+    assert _row(db)["run_id"] == winners[0].run_id
+    winners[0].release("normal")
+
+
+def test_renew_and_release(db):
+    _space(db)
+    lease = RunLease("s1", heartbeat_seconds=60)
+    assert lease.acquire()
+    assert supabase_service.renew_run_lease("s1", lease.run_id, 60) is True
+    assert lease.release("normal")
+    row = _row(db)
+    assert (row["status"], row["run_id"], row["lease_expires_at"]) == ("normal", None, None)
+
+
+def test_expired_lease_is_taken_over_and_old_release_is_ignored(db):
+    _space(db)
+    old = RunLease("s1", heartbeat_seconds=60)
+    assert old.acquire()
+    assert not RunLease("s1", heartbeat_seconds=60).acquire()   # still held
+
+    _expire(db)
+    new = RunLease("s1", heartbeat_seconds=60)
+    assert new.acquire()
+    assert supabase_service.renew_run_lease("s1", old.run_id, 60) is False
+    assert not old.release("normal")
+    assert _row(db)["run_id"] == new.run_id
+    assert new.release("normal")
+
+
+def test_heartbeat_reports_a_lost_lease(db):
+    _space(db)
+    victim = RunLease("s1", heartbeat_seconds=0.05)
+    lost = threading.Event()
+    victim.on_lost(lost.set)
+    assert victim.acquire()
+    _expire(db)
+    thief = RunLease("s1", heartbeat_seconds=60)
+    assert thief.acquire()
+    assert lost.wait(2)
+    assert victim.lost.is_set()
+    assert not victim.release("normal")
+    thief.release("normal")
+
+
+def test_missing_space_after_acquire_releases_the_lease(db, monkeypatch):
+    # /invoke acquires first; a failed (None) read must not leave the space 'generating'
+    _space(db)
+    lease = RunLease("s1", heartbeat_seconds=0.05)
+    assert lease.acquire()
+    monkeypatch.setattr(supabase_service, "get_learning_space", lambda space_id: None)
+
+    assert agent_workflow.invoke_agent_workflow("s1", "u1", lease=lease) is None
+
+    row = _row(db)
+    assert (row["status"], row["run_id"]) == ("failed", None)
+    assert RunLease("s1", heartbeat_seconds=60).acquire()
+
+
+def test_failing_read_after_acquire_releases_the_lease(db, monkeypatch):
+    _space(db)
+    lease = RunLease("s1", heartbeat_seconds=60)
+    assert lease.acquire()
+
+    def boom(user_id):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(supabase_service, "get_student_profile", boom)
+    try:
+        agent_workflow.invoke_agent_workflow("s1", "u1", lease=lease)
+    except RuntimeError:
+        pass
+    assert _row(db)["status"] == "failed"
+
+
+def _fail_writes(db, monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(type(db.table("learning_space")), "update", boom)
+
+
+def test_acquire_tells_a_held_lease_from_a_failed_claim(db, monkeypatch):
+    _space(db)
+    holder = RunLease("s1", heartbeat_seconds=60)
+    assert holder.acquire() is True
+    assert RunLease("s1", heartbeat_seconds=60).acquire() is False
+
+    _fail_writes(db, monkeypatch)
+    assert RunLease("s2", heartbeat_seconds=60).acquire() is None
+
+
+def test_invoke_reports_a_failed_claim_as_an_error_not_a_running_run(db, monkeypatch):
+    from fastapi import BackgroundTasks, HTTPException
+    from src.api.routes import workflow
+
+    _space(db)
+    request = workflow.WorkflowRequest(learning_space_id="s1", user_id="u1")
+    holder = RunLease("s1", heartbeat_seconds=60)
+    assert holder.acquire()
+
+    duplicate = workflow.workflow_invoke(request, BackgroundTasks())
+    assert duplicate["already_running"] and duplicate["run_id"] == holder.run_id
+
+    _fail_writes(db, monkeypatch)
+    with pytest.raises(HTTPException) as failed:
+        workflow.workflow_invoke(request, BackgroundTasks())
+    assert failed.value.status_code == 503
+    # The user's invoke slot was given back both times
+    slots = [workflow.job_manager.try_start_invoke("u1") for _ in range(workflow.JobManager.MAX_CONCURRENT_JOBS_PER_USER)]
+    assert all(slots)
+    for slot in slots:
+        workflow.job_manager.finish_invoke("u1", slot)
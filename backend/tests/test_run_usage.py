@@ -0,0 +1,51 @@
+from collections import deque
+
+from src.services.agent_workflow import invoke_agent_workflow
+from src.utils import tracing
+
+
+def test_run_usage_is_complete_even_when_the_span_buffer_wraps(db, monkeypatch):
+    # A buffer smaller than one run: reading usage back from it would lose calls
+    monkeypatch.setattr(tracing.span_exporter, "_spans", deque(maxlen=2))
+    db.seed("student_profile", [{"user_id": "u1", "grade_level": "Class 8", "language": "English"}])
+    db.seed("learning_space", [{"id": "s1", "user_id": "u1", "topic": "Photosynthesis", "status": "normal"}])
+
+    assert invoke_agent_workflow("s1", "u1") is not None
+
+    log = db.rows("workflow_run_logs")[-1]
+    calls = sum(row["calls"] for row in log["token_usage"])
+    assert calls >= 5
+    assert {"summarise", "quiz", "flashcards"} <= {row["node"] for row in log["token_usage"]}
+    assert log["cost_usd"] == round(sum(row["cost_usd"] for row in log["token_usage"]), 6)
+
+
+def test_usage_scope_reports_per_node_totals():
+    with tracing.usage_scope() as usage:
+        for node, tokens in (("quiz", 10), ("quiz", 5), ("summarise", 7)):
+            with tracing.start_span("graph.node", node=node), tracing.start_span(
+                "llm.call", task=node, provider="gemini", model="gemini-2.5-flash",
+            ) as span:
+                span.set(input_tokens=tokens, output_tokens=1)
+                tracing.finalize_llm_span(span, ok=True)
+
+    rows = {row["node"]: row for row in usage.report(group_by="node")}
+    assert rows["quiz"]["calls"] == 2 and rows["quiz"]["input_tokens"] == 15
+    assert rows["summarise"]["calls"] == 1 and rows["summarise"]["output_tokens"] == 1
+
+
+def test_a_call_made_while_handling_an_exception_counts_as_ok():
+    from src.utils.model_router import LLM_LATENCY, call_with_fallback, provider_for_task
+    from src.utils.prompt_builder import PromptAssembly
+
+    provider = provider_for_task("quiz")
+    ok_calls = LLM_LATENCY.labels("quiz", provider, "ok")
+    before = sum(ok_calls.counts)
+    with tracing.usage_scope() as usage:
+        try:
+            raise KeyError("combined output missing 'quiz'")
+        except KeyError:
+            call_with_fallback("quiz", PromptAssembly("Answer briefly.", "{question}"), {"question": "Why?"})
+
+    assert usage.provider("quiz") == provider
+    assert usage.report()[0]["calls"] == 1
+    assert sum(ok_calls.counts) == before + 1
@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+
+from src.api.routes.workflow import JobManager
+from src.services import shared_state as shared_state_module
+from src.services.shared_state import MemorySharedState, SharedState, SQLiteSharedState
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    """Factory of stores that see the same records, as the workers of one host do."""
+    if request.param == "memory":
+        store = MemorySharedState()
+        return lambda: store
+    return lambda: SQLiteSharedState(str(tmp_path / "shared.sqlite3"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(shared_state_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        SharedState()
+
+
+def test_update_get_set_delete(make_store):
+    store = make_store()
+    assert store.get("ns", "k") is None
+    assert store.update("ns", "k", lambda r: r.setdefault("n", 1)) == 1
+    store.set("ns", "k", {"m": 2})
+    assert make_store().get("ns", "k") == {"n": 1, "m": 2}
+
+    # get() hands out a copy
+    store.get("ns", "k")["n"] = 99
+    assert store.get("ns", "k")["n"] == 1
+
+    store.delete("ns", "k")
+    assert store.get("ns", "k") is None
+
+
+def test_failing_update_leaves_the_record_unchanged(make_store):
+    store = make_store()
+    store.set("ns", "k", {"n": 1})
+
+    def fail(record):
+        record["n"] = 2
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.update("ns", "k", fail)
+    assert store.get("ns", "k") == {"n": 1}
+
+
+def test_ttl_expiry(make_store, clock):
+    store = make_store()
+    store.set("ns", "short", {"v": 1}, ttl=10)
+    store.set("ns", "forever", {"v": 2})
+    assert set(store.items("ns")) == {"short", "forever"}
+
+    clock[0] += 11
+    assert store.get("ns", "short") is None
+    assert set(store.items("ns")) == {"forever"}
+    # An expired record starts again from default()
+    assert store.update("ns", "short", lambda r: r.get("v"), default=lambda: {"v": 7}) == 7
+
+
+def test_clear_one_namespace_or_all(make_store):
+    store = make_store()
+    store.set("a", "k", {"v": 1})
+    store.set("b", "k", {"v": 2})
+    store.clear("a")
+    assert store.items("a") == {} and store.items("b") == {"k": {"v": 2}}
+    store.clear()
+    assert store.items("b") == {}
+
+
+def test_counters_are_atomic_across_stores(make_store):
+    stores = [make_store() for _ in range(4)]
+
+    def bump(store):
+        for _ in range(50):
+            store.incr("counters", "c")
+
+    threads = [threading.Thread(target=bump, args=(s,)) for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stores[0].counter("counters", "c") == 200
+
+
+def test_lock_is_exclusive_renewable_and_expires(make_store, clock):
+    one, two = make_store(), make_store()
+    assert one.try_lock("sweep", "worker-1", ttl=30)
+    assert not two.try_lock("sweep", "worker-2", ttl=30)
+    assert one.try_lock("sweep", "worker-1", ttl=30)  # renew
+
+    assert not two.unlock("sweep", "worker-2")
+    assert one.unlock("sweep", "worker-1")
+    assert two.try_lock("sweep", "worker-2", ttl=30)
+
+    clock[0] += 31  # worker-2 died holding it
+    assert one.try_lock("sweep", "worker-1", ttl=30)
+
+
+def test_sqlite_falls_back_to_process_memory_when_the_file_fails(tmp_path, monkeypatch):
+    store = SQLiteSharedState(str(tmp_path / "shared.sqlite3"))
+
+    def broken(*args, **kwargs):
+        raise shared_state_module.sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_connect", broken)
+    assert store.incr("ns", "c") == 1
+    assert store.counter("ns", "c") == 1
+
+
+# ── Bulk-job cancellation ──────────────────────────────────────────────
+
+def test_bulk_job_is_cancelled_by_a_newer_request(make_store):
+    a, b = JobManager(make_store()), JobManager(make_store())
+    job = a.register_user_job("u1", a.cancel_all_user_jobs("u1"))
+    assert not job.cancelled
+    b.cancel_all_user_jobs("u1")  # another worker
+    assert job.cancelled
+
+
+def test_bulk_job_registered_after_a_newer_cancel_is_still_cancelled(make_store):
+    a, b = JobManager(make_store()), JobManager(make_store())
+    # Request A cancels, request B cancels, then A registers its job: A's job must not survive
+    generation_a = a.cancel_all_user_jobs("u1")
+    generation_b = b.cancel_all_user_jobs("u1")
+    job_a = a.register_user_job("u1", generation_a)
+    job_b = b.register_user_job("u1", generation_b)
+    assert job_a.cancelled and not job_b.cancelled
+
+
+def test_current_generation_is_shared_across_workers(make_store):
+    a, b = JobManager(make_store()), JobManager(make_store())
+    assert a.current_generation("u1") == 0
+    generation = b.cancel_all_user_jobs("u1")
+    assert a.current_generation("u1") == generation == 1
+
+
+def test_invoke_slots_are_limited_per_user_across_workers(make_store):
+    a, b = JobManager(make_store()), JobManager(make_store())
+    slots = [a.try_start_invoke("u1"), b.try_start_invoke("u1")]
+    assert all(slots) and a.try_start_invoke("u1") is None
+    assert b.try_start_invoke("u2")
+
+    a.finish_invoke("u1", slots[0])
+    assert b.try_start_invoke("u1")
@@ -0,0 +1,39 @@
+from src.agents.summary_artifact import EMPTY_SUMMARY, SummaryArtifact, merge_summary
+
+DRAFT = SummaryArtifact("## Photosynthesis\nPlants make glucose in the mitochondria.", title="Notes")
+
+
+def test_verify_and_enrichment_in_the_same_superstep_are_both_kept():
+    verified = DRAFT.with_text("## Photosynthesis\nPlants make glucose in the chloroplasts.")
+    enriched = DRAFT.with_appendix("## Diagram\nA leaf cross-section.")
+
+    for left, right in ((verified, enriched), (enriched, verified)):
+        merged = merge_summary(left, right)
+        assert merged.text == verified.text and merged.revision == 1
+        assert merged.appendix == ("## Diagram\nA leaf cross-section.",)
+        assert merged.title == "Notes"
+        assert "chloroplasts" in merged.markdown and "Diagram" in merged.markdown
+
+
+def test_higher_revision_wins_and_ties_go_to_the_newer_update():
+    older, newer = DRAFT.with_text("first"), DRAFT.with_text("second")
+    assert merge_summary(older, newer).text == "second"
+    assert merge_summary(DRAFT.with_text("first").with_text("again"), newer).text == "again"
+
+
+def test_appendix_sections_are_not_duplicated():
+    section = "## Diagram\nA leaf."
+    left = DRAFT.with_appendix(section)
+    right = left.with_appendix("## Video\nA timelapse.")
+    assert merge_summary(left, right).appendix == (section, "## Video\nA timelapse.")
+
+
+def test_missing_sides_and_raw_values():
+    assert merge_summary(DRAFT, None) is DRAFT
+    assert merge_summary(None, DRAFT) is DRAFT
+    assert merge_summary(EMPTY_SUMMARY, DRAFT) is DRAFT
+    merged = merge_summary({"title": "T", "summary": "stored text"}, None)
+    assert (merged.title, merged.text) == ("T", "stored text")
+    # An unchanged appendix returns the winning body itself, without rebuilding it
+    revised = DRAFT.with_text("x")
+    assert merge_summary(DRAFT, revised) is revised
@@ -0,0 +1,39 @@
+import pytest
+
+from src.utils.token_budget import count_tokens, truncate_to_tokens
+
+ENGLISH = " ".join(f"Sentence number {i} explains one more step of photosynthesis." for i in range(200))
+HINDI = " ".join("प्रकाश संश्लेषण में पौधे सूर्य के प्रकाश से भोजन बनाते हैं।" for _ in range(200))
+
+
+@pytest.mark.parametrize("text", [ENGLISH, HINDI])
+@pytest.mark.parametrize("keep", ["head", "tail"])
+def test_result_fits_the_budget(text, keep):
+    cut = truncate_to_tokens(text, 100, task="chat", marker=" [...]", keep=keep)
+    assert 0 < count_tokens(cut, "chat") <= 100
+    assert len(cut) < len(text)
+
+
+def test_head_keeps_the_start_and_cuts_at_a_sentence():
+    cut = truncate_to_tokens(ENGLISH, 100, marker="\n[TRUNCATED]")
+    assert cut.startswith("Sentence number 0 ")
+    assert cut.endswith("photosynthesis.\n[TRUNCATED]")
+
+
+def test_tail_keeps_the_end():
+    cut = truncate_to_tokens(ENGLISH, 100, marker="[...] ", keep="tail")
+    assert cut.startswith("[...] Sentence number ")
+    assert cut.endswith("Sentence number 199 explains one more step of photosynthesis.")
+
+
+def test_hindi_is_counted_denser_than_english():
+    # Same character budget would overflow: Devanagari costs more tokens per character
+    english, hindi = truncate_to_tokens(ENGLISH, 100), truncate_to_tokens(HINDI, 100)
+    assert len(hindi) < len(english)
+
+
+def test_text_within_budget_and_degenerate_budgets():
+    assert truncate_to_tokens("short text", 100, marker="[...]") == "short text"
+    assert truncate_to_tokens(ENGLISH, 0) == ""
+    assert truncate_to_tokens("", 10) == ""
+    assert truncate_to_tokens(ENGLISH, 2, marker=" [TRUNCATED BECAUSE IT WAS LONG]") == ""
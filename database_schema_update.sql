@@ -28,3 +28,51 @@ ALTER TABLE public.content_cache ENABLE ROW LEVEL SECURITY;
 -- Allow authenticated users to read/write (standard for private DB access)
 CREATE POLICY "Allow All for Authenticated" ON public.ai_provider_logs FOR ALL USING (auth.role() = 'authenticated');
 CREATE POLICY "Allow All for Authenticated" ON public.content_cache FOR ALL USING (auth.role() = 'authenticated');
+
+-- 3. Incremental Regeneration SQL
+-- Fingerprints of the inputs each stored artifact was generated from
+ALTER TABLE public.learning_space ADD COLUMN IF NOT EXISTS artifact_fingerprints JSONB DEFAULT '{}'::jsonb;
+
+-- 4. Workflow Run Timing SQL
+CREATE TABLE IF NOT EXISTS public.workflow_run_logs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    learning_space_id UUID NOT NULL,
+    status TEXT NOT NULL,
+    total_latency FLOAT NOT NULL,
+    node_timings JSONB DEFAULT '{}'::jsonb,
+    skipped_nodes JSONB DEFAULT '[]'::jsonb,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_workflow_run_logs_space ON public.workflow_run_logs(learning_space_id, created_at DESC);
+ALTER TABLE public.workflow_run_logs ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow All for Authenticated" ON public.workflow_run_logs FOR ALL USING (auth.role() = 'authenticated');
+
+-- 5. Graceful Degradation SQL
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS timed_out_nodes JSONB DEFAULT '[]'::jsonb;
+CREATE INDEX IF NOT EXISTS idx_learning_space_generating ON public.learning_space(updated_at) WHERE status = 'generating';
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS verification_stats JSONB;
+
+-- 6. Critical Path SQL
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS critical_path_latency FLOAT;
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS critical_path JSONB DEFAULT '[]'::jsonb;
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS audio_speculation JSONB;
+
+-- 7. Combined Generation SQL
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS generation_stats JSONB;
+
+-- 8. Token Accounting SQL
+-- Per-node token, retry, fallback and cost totals of each workflow run
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS token_usage JSONB;
+ALTER TABLE public.workflow_run_logs ADD COLUMN IF NOT EXISTS cost_usd DOUBLE PRECISION;
+
+-- 9. Run Lease SQL
+-- One workflow run per learning space: a run claims the row with a conditional
+-- update and renews lease_expires_at while it works; expired leases can be taken over
+ALTER TABLE public.learning_space ADD COLUMN IF NOT EXISTS run_id TEXT;
+ALTER TABLE public.learning_space ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- 10. Doubt History Pagination SQL
+-- Keyset pages and delta syncs of a chat seek on (created_at, id) within one space and user
+CREATE INDEX IF NOT EXISTS idx_doubt_messages_chat ON public.doubt_messages(learning_space_id, user_id, created_at, id);